@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'votes.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'votes.routers.PrimaryPinMiddleware',
 ]
 
 ROOT_URLCONF = 'padron_web.urls'
@@ -82,6 +84,84 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# 'search' stores the results of repeated voter searches. LocMemCache is a size bounded LRU cache per process, to share
+# it between processes use 'django.core.cache.backends.filebased.FileBasedCache' with a directory as LOCATION.
+# 'padron' holds the stamps that tell every process the padron changed (see votes.stamps), it must be shared by the
+# web workers and the management commands. Its table is created by the votes migrations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'padron-search',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    'padron': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'padron_stamps',
+    },
+}
+
+SEARCH_CACHE_ALIAS = 'search'
+
+STAMPS_CACHE_ALIAS = 'padron'
+
+# Seconds a process keeps using its copy of the stamps before reading them again, so the changes made by another
+# process are seen after at most this long
+STAMP_CHECK_SECONDS = 2
+
+# Maximum amount of voters returned by the name autocomplete
+AUTOCOMPLETE_MAX_RESULTS = 20
+
+# Minimum seconds between two builds of a process autocomplete index caused by the voters added or deleted in other
+# processes. A reload of the padron builds it again right away.
+AUTOCOMPLETE_REFRESH_SECONDS = 300
+
+# Maximum amount of cédulas resolved by a single batch lookup
+VOTERS_LOOKUP_MAX_BATCH = 200
+
+# Search cost guard
+# Shorter identifications and names are not searched, they match most of the padron
+SEARCH_MIN_IDENTIFICATION_LENGTH = 4
+SEARCH_MIN_NAME_LENGTH = 3
+
+# Maximum amount of voters shown by a search, a longer list asks to refine it
+SEARCH_MAX_RESULTS = 500
+
+# Searches expected to find more voters are not run. Only Postgresql estimates them, with the query planner.
+SEARCH_MAX_ESTIMATED_MATCHES = 100000
+
+# Server side time limit of a search: statement_timeout on Postgresql, maxTimeMS on MongoDB
+SEARCH_TIMEOUT_MS = 3000
+
+# Read replicas
+# Reads go to one of DATABASE_REPLICAS, writes and the reads that follow a write go to 'default'. The replicas must be
+# Postgresql streaming replicas of 'default', PostgresqlDB sends them Postgresql only SQL. For example:
+#     'replica': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'padron_electoral', 'HOST': 'replica-host', ...}
+# and set DATABASE_REPLICAS = ['replica'].
+
+DATABASE_ROUTERS = ['votes.routers.PrimaryReplicaRouter']
+
+DATABASE_REPLICAS = []
+
+# Seconds a client keeps reading from the primary after writing
+REPLICA_LAG_SECONDS = 5
+
+# Request timing
+# Requests slower than this are logged with their database calls, database time and render time
+REQUEST_SLOW_THRESHOLD_MS = 500
+
+# Dotted path to a function(request, response, timing) called after every request, for example to send the timing
+# to a metrics system. None to disable it.
+REQUEST_PROFILER = None
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -128,5 +208,13 @@ LOGIN_REDIRECT_URL = '/padron/votantes/'
 # For mongodb connection
 CONNECTION_STRING = 'mongodb://localhost:27017'
 
-# Select 'Mongodb' or 'Postgresql'
+# Mongodb reads. Use another connection string to read from a different server, as a second local mongod
+MONGO_READ_CONNECTION_STRING = CONNECTION_STRING
+MONGO_READ_PREFERENCE = 'secondaryPreferred'
+
+# Embedded padron for the stations without a network or a database server. With 'Sqlite' the users and sessions
+# can stay offline as well, using a sqlite3 'default' database in DATABASES.
+SQLITE_DATABASE_PATH = BASE_DIR / 'padron.sqlite3'
+
+# Select 'Mongodb', 'Postgresql' or 'Sqlite'
 ACTUAL_DATABASE = 'Mongodb'
@@ -1,6 +1,120 @@
-from django.contrib import admin
+import json
 
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .fields import normalise_name
 from .models import Person, Location
+from .search_guard import SearchRefused, check_search
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that takes the amount of rows from the Postgresql planner instead of a COUNT(*) over the whole
+    padron. EXPLAIN does not run the query, so every page of the changelist costs a single indexed query.
+
+    The estimates below EXACT_COUNT_LIMIT are replaced by the exact count, which is cheap for so few rows, so the
+    short lists (as a search) show their real size. The other databases are always counted.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+
+            if estimate >= self.EXACT_COUNT_LIMIT:
+                return estimate
+
+        return queryset.count()
+
+
+class PersonChangeList(ChangeList):
+    """
+    A changelist that reads only the columns of list_display
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).only(*self.model_admin.list_fields)
+
+
+def get_prefix_upper_bound(prefix):
+    """
+    The first string of digits after all the ones that start with a prefix, so a prefix search is an index range
+
+    :param prefix: a string of digits
+    :return: the upper bound, or None if every string above the prefix starts with it (as '999')
+    """
+    prefix = prefix.rstrip('9')
+    if prefix == '':
+        return None
+
+    return prefix[:-1] + str(int(prefix[-1]) + 1)
+
+
+@admin.register(Person)
+class PersonAdmin(admin.ModelAdmin):
+    """
+    The admin of the padron voters, usable with millions of rows: no exact count of the table, no select with every
+    location in the change form, and a search that is always an index range.
+
+    The search box takes the beginning of an identification, looked up as a range of the primary key, or the
+    beginning of a name, looked up on the normalised search_key through its trigram index.
+    """
+    list_display = ('identification', 'full_name', 'elec_code', 'voting_board', 'id_expiration_date')
+    list_select_related = ('elec_code',)
+    # The columns read by the changelist, list_display and the location name
+    list_fields = ('identification', 'full_name', 'elec_code', 'elec_code__province', 'elec_code__canton',
+                   'elec_code__district', 'voting_board', 'id_expiration_date')
+    raw_id_fields = ('elec_code',)
+    # Enables the search box, the lookups are built by get_search_results
+    search_fields = ('identification',)
+    search_help_text = "Inicio de la cédula o del nombre"
+    # Sorting by another column would sort the whole padron, only the primary key is ordered by an index
+    sortable_by = ('identification',)
+    paginator = EstimatedCountPaginator
+    # Without it a filtered changelist counts the whole table as well
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return PersonChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term == '':
+            return queryset, False
+
+        identification = search_term if search_term.isdigit() else ''
+        name = '' if identification else normalise_name(search_term)
+
+        try:
+            check_search(identification, name)
+        except SearchRefused as refused:
+            self.message_user(request, str(refused), messages.WARNING)
+            return queryset.none(), False
+
+        if identification:
+            queryset = queryset.filter(identification__gte=identification)
+            upper_bound = get_prefix_upper_bound(identification)
+
+            if upper_bound is not None:
+                queryset = queryset.filter(identification__lt=upper_bound)
+        else:
+            queryset = queryset.filter(search_key__startswith=name)
+
+        return queryset, False
+
 
-admin.site.register(Person)
-admin.site.register(Location)
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    """
+    The admin of the vote locations, a small table
+    """
+    list_display = ('elec_code', 'province', 'canton', 'district')
+    search_fields = ('^province', '^canton', '^district')
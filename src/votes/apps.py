@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class VotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'votes'
+
+    def ready(self):
+        # Registers the signal receivers, votes.stamps first so the stamps are bumped before the other receivers run
+        import votes.stamps  # noqa: F401
+        import votes.autocomplete  # noqa: F401
+        import votes.cache  # noqa: F401
+        import votes.locations  # noqa: F401
@@ -0,0 +1,439 @@
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from logging import getLogger
+from threading import Event, Lock, Thread, current_thread
+
+from django.db import connections
+from django.dispatch import receiver
+
+from padron_web.settings import AUTOCOMPLETE_REFRESH_SECONDS, STAMP_CHECK_SECONDS
+from votes.fields import normalise_name
+from votes.signals import voter_added, voter_deleted, voters_added, voters_deleted, padron_reloaded
+from votes.stamps import PADRON_STAMP, RELOAD_STAMP
+
+logger = getLogger(__name__)
+
+
+class _IndexArrays:
+    """
+    The sorted arrays of an AutocompleteIndex, never modified once built so they are read without a lock
+
+    ...
+
+    Attributes
+    ----------
+    names : str
+        all the full names, sorted and concatenated
+    name_offsets : array
+        where each name starts in names, with an extra item for the end of the last one
+    name_ids : array
+        the identification of each name
+    ids : array
+        the identifications, sorted
+    id_rows : array
+        the name row of each identification in ids
+    id_lengths : set
+        the amount of digits of the stored identifications
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: a list of (full_name, identification) tuples, sorted in place
+        """
+        entries.sort(key=lambda entry: (normalise_name(entry[0]), entry[1]))
+
+        self.names = ''.join(full_name for full_name, identification in entries)
+        self.name_offsets = array('I', [0])
+        self.name_ids = array('Q', (identification for full_name, identification in entries))
+
+        offset = 0
+        for full_name, identification in entries:
+            offset += len(full_name)
+            self.name_offsets.append(offset)
+
+        id_order = sorted(range(len(entries)), key=self.name_ids.__getitem__)
+        self.ids = array('Q', (self.name_ids[row] for row in id_order))
+        self.id_rows = array('I', id_order)
+        self.id_lengths = {len(str(identification)) for identification in self.ids}
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def get_entries(self):
+        """
+        :return: a list of (full_name, identification) tuples with every stored voter
+        """
+        return [(self.names[self.name_offsets[row]:self.name_offsets[row + 1]], identification)
+                for row, identification in enumerate(self.name_ids)]
+
+    def search_names(self, query, limit, removed):
+        names, offsets, name_ids = self.names, self.name_offsets, self.name_ids
+        low, high = 0, len(name_ids)
+
+        while low < high:
+            middle = (low + high) // 2
+            if normalise_name(names[offsets[middle]:offsets[middle + 1]]) < query:
+                low = middle + 1
+            else:
+                high = middle
+
+        matches = []
+        for row in range(low, len(name_ids)):
+            full_name = names[offsets[row]:offsets[row + 1]]
+            if not normalise_name(full_name).startswith(query) or len(matches) == limit:
+                break
+            if name_ids[row] not in removed:
+                matches.append((str(name_ids[row]), full_name))
+
+        return matches
+
+    def search_ids(self, query, limit, removed):
+        names, offsets, ids, id_rows = self.names, self.name_offsets, self.ids, self.id_rows
+        matches = []
+
+        for length in sorted(self.id_lengths):
+            if length < len(query):
+                continue
+
+            padding = 10 ** (length - len(query))
+            start = bisect_left(ids, int(query) * padding)
+            end = bisect_right(ids, (int(query) + 1) * padding - 1)
+
+            for position in range(start, end):
+                if len(matches) == limit:
+                    return matches
+                if ids[position] not in removed:
+                    row = id_rows[position]
+                    matches.append((str(ids[position]), names[offsets[row]:offsets[row + 1]]))
+
+        return matches
+
+
+class AutocompleteIndex:
+    """
+    An in-memory prefix index over the voters full names and identifications, for type-ahead searches.
+
+    The names are kept sorted in a single string with an array of offsets, and the identifications as integers in
+    a sorted array pointing to their name's row, so millions of voters take a few bytes each and a prefix lookup is a
+    binary search. Identifications are expected to be numeric, as the ones in the TSE files. Names are sorted and
+    compared by their normalise_name key, so the lookups are accent and case insensitive while the original names are
+    returned.
+
+    The arrays are built by a background thread, started by the first search of each process, which finds nothing
+    until they are ready; the requests never wait for a build nor read the database. The voters added and deleted by
+    this process are kept in a small overlay, merged into new arrays by the same thread once it grows too much. The
+    thread also reads the shared stamps (see votes.stamps) every check_seconds to see the changes made by the other
+    processes: a reload of the padron builds the arrays again right away, the other changes at most every
+    refresh_seconds.
+
+    A forked process inherits the arrays but not the thread, it starts its own on its first search.
+
+    ...
+
+    Attributes
+    ----------
+    refresh_seconds : int
+        the minimum time between two builds caused by the voters changed in other processes
+    check_seconds : int
+        the time between two reads of the shared stamps
+    __database : DBFactory
+        the database the index is built from, given by the first search
+    __arrays : _IndexArrays
+        the voters read by the last build, None before it ends
+    __stamps : tuple
+        the reload and padron stamps read before the last build
+    __built_at : float
+        the monotonic time of the last build
+    __added : dict
+        identifications and names added after the arrays were built
+    __removed : set
+        identifications no longer valid in the arrays
+    __pending : list
+        the (identification, full_name or None) changes received while new arrays are built, applied again over
+        them. None when no build or compaction is running
+    __worker : Thread
+        the background thread, None before the first search and after stop
+    __wake : Event
+        set to run the background thread's checks before check_seconds
+    """
+    COMPACT_THRESHOLD = 10000
+
+    def __init__(self, refresh_seconds=AUTOCOMPLETE_REFRESH_SECONDS, check_seconds=STAMP_CHECK_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.check_seconds = check_seconds
+        self.__database = None
+        self.__arrays = None
+        self.__stamps = (None, None)
+        self.__built_at = 0.0
+        self.__added = {}
+        self.__removed = set()
+        self.after_fork()
+
+    def after_fork(self):
+        """
+        Replaces the lock and forgets the background thread, a forked process inherits them in any state but without
+        the thread. A build or compaction running in the parent process is forgotten as well.
+        """
+        self.__lock = Lock()
+        self.__wake = Event()
+        self.__worker = None
+        self.__pending = None
+
+    def start(self, database):
+        """
+        Starts the background thread that builds the index and keeps it updated, unless it is already running.
+
+        :param database: a DBFactory
+        """
+        with self.__lock:
+            if self.__worker is not None and self.__worker.is_alive():
+                return
+
+            self.__database = database
+            self.__worker = Thread(target=self.__run, name='autocomplete-index', daemon=True)
+            self.__worker.start()
+
+    def stop(self):
+        """
+        Stops the background thread once its current build or compaction ends.
+        """
+        with self.__lock:
+            self.__worker = None
+
+        self.__wake.set()
+
+    def build(self, database):
+        """
+        Loads all the voters names from the database and replaces the arrays. The previous ones keep answering
+        meanwhile, and the changes received during the build are applied again over the new ones.
+
+        :param database: a DBFactory
+        """
+        # Read before the voters, a change made during the build causes another one later
+        stamps = (RELOAD_STAMP.get(), PADRON_STAMP.get())
+
+        with self.__lock:
+            self.__pending = []
+
+        entries = [(full_name, int(identification)) for identification, full_name in database.get_voter_names()]
+
+        if self.__replace(_IndexArrays(entries), stamps, time.monotonic()):
+            logger.info("Autocomplete index built with %s voters", len(entries))
+
+    def compact(self):
+        """
+        Merges the overlay into new arrays, without reading the database.
+        """
+        with self.__lock:
+            if self.__arrays is None:
+                return
+
+            arrays, stamps, built_at = self.__arrays, self.__stamps, self.__built_at
+            added, removed = dict(self.__added), set(self.__removed)
+            self.__pending = []
+
+        entries = [entry for entry in arrays.get_entries() if entry[1] not in removed]
+        entries.extend((full_name, identification) for identification, full_name in added.items())
+        self.__replace(_IndexArrays(entries), stamps, built_at)
+
+    def clear(self):
+        """
+        Forgets all the voters, the background thread builds the index again. A build running meanwhile is discarded.
+        """
+        with self.__lock:
+            self.__arrays = None
+            self.__stamps = (None, None)
+            self.__added = {}
+            self.__removed = set()
+            self.__pending = None
+
+        self.__wake.set()
+
+    def search(self, database, query, limit=10):
+        """
+        Looks for the voters whose full name or identification starts with the query.
+
+        :param database: the DBFactory the index is built from, by the background thread this search starts
+        :param query: the typed text, digits are taken as an identification
+        :param limit: the maximum amount of voters to return
+        :return: a list of (identification, full_name) tuples sorted by name or identification, empty while the
+            index is built for the first time
+        """
+        self.start(database)
+
+        query = normalise_name(query)
+        if query == '':
+            return []
+
+        with self.__lock:
+            arrays = self.__arrays
+            if arrays is None:
+                return []
+
+            if query.isdigit():
+                matches = arrays.search_ids(query, limit, self.__removed)
+                matches.extend((str(identification), full_name) for identification, full_name in self.__added.items()
+                               if str(identification).startswith(query))
+                matches.sort(key=lambda match: match[0])
+            else:
+                matches = arrays.search_names(query, limit, self.__removed)
+                matches.extend((str(identification), full_name) for identification, full_name in self.__added.items()
+                               if normalise_name(full_name).startswith(query))
+                matches.sort(key=lambda match: normalise_name(match[1]))
+
+        return matches[:limit]
+
+    def add(self, identification, full_name):
+        """
+        Adds a voter to the overlay.
+
+        :param identification: the voter's identification
+        :param full_name: the voter's full name
+        """
+        self.__change(int(identification), full_name.upper())
+
+    def remove(self, identification):
+        """
+        Hides a voter from the results.
+
+        :param identification: the voter's identification
+        """
+        self.__change(int(identification), None)
+
+    def __change(self, identification, full_name):
+        with self.__lock:
+            if self.__arrays is None and self.__pending is None:
+                # Neither built nor building, the next build reads the change from the database
+                return
+
+            self.__apply(identification, full_name)
+
+            if self.__pending is not None:
+                self.__pending.append((identification, full_name))
+
+            compact = self.__pending is None and len(self.__added) + len(self.__removed) >= self.COMPACT_THRESHOLD
+
+        if compact:
+            self.__wake.set()
+
+    def __apply(self, identification, full_name):
+        self.__removed.add(identification)
+        if full_name is None:
+            self.__added.pop(identification, None)
+        else:
+            self.__added[identification] = full_name
+
+    def __replace(self, arrays, stamps, built_at):
+        with self.__lock:
+            if self.__pending is None:
+                # Cleared meanwhile, the arrays may belong to the replaced padron
+                return False
+
+            self.__arrays = arrays
+            self.__stamps = stamps
+            self.__built_at = built_at
+            self.__added = {}
+            self.__removed = set()
+
+            for identification, full_name in self.__pending:
+                self.__apply(identification, full_name)
+
+            self.__pending = None
+
+        return True
+
+    def __update(self):
+        reload_stamp, padron_stamp = self.__stamps
+
+        if self.__arrays is None or RELOAD_STAMP.get() != reload_stamp:
+            self.build(self.__database)
+        elif PADRON_STAMP.get() != padron_stamp and time.monotonic() - self.__built_at >= self.refresh_seconds:
+            self.build(self.__database)
+        elif len(self.__added) + len(self.__removed) >= self.COMPACT_THRESHOLD:
+            self.compact()
+
+    def __run(self):
+        while self.__worker is current_thread():
+            try:
+                self.__update()
+            except Exception:
+                logger.exception("The autocomplete index could not be updated")
+                # Stops recording the changes, the overlay keeps them over the current arrays
+                with self.__lock:
+                    self.__pending = None
+            finally:
+                # The thread's own database connections
+                connections.close_all()
+
+            self.__wake.wait(self.check_seconds)
+            self.__wake.clear()
+
+
+AUTOCOMPLETE_INDEX = AutocompleteIndex()
+
+os.register_at_fork(after_in_child=AUTOCOMPLETE_INDEX.after_fork)
+
+
+@receiver(voter_added)
+def add_to_autocomplete_index(sender, identification, full_name, **kwargs):
+    """
+    Keeps the autocomplete index updated with the new voters
+
+    :param sender: the DBFactory class that added the voter
+    :param identification: the voter's identification
+    :param full_name: the voter's full name
+    :param kwargs: other params
+    """
+    AUTOCOMPLETE_INDEX.add(identification, full_name)
+
+
+@receiver(voter_deleted)
+def remove_from_autocomplete_index(sender, identification, **kwargs):
+    """
+    Keeps the autocomplete index updated with the deleted voters
+
+    :param sender: the DBFactory class that deleted the voter
+    :param identification: the voter's identification
+    :param kwargs: other params
+    """
+    AUTOCOMPLETE_INDEX.remove(identification)
+
+
+@receiver(voters_added)
+def add_batch_to_autocomplete_index(sender, voters, **kwargs):
+    """
+    Keeps the autocomplete index updated with a batch of new voters
+
+    :param sender: the DBFactory class that added the voters
+    :param voters: a list of (identification, full_name) tuples
+    :param kwargs: other params
+    """
+    for identification, full_name in voters:
+        AUTOCOMPLETE_INDEX.add(identification, full_name)
+
+
+@receiver(voters_deleted)
+def remove_batch_from_autocomplete_index(sender, identifications, **kwargs):
+    """
+    Keeps the autocomplete index updated with a batch of deleted voters
+
+    :param sender: the DBFactory class that deleted the voters
+    :param identifications: a list of identifications
+    :param kwargs: other params
+    """
+    for identification in identifications:
+        AUTOCOMPLETE_INDEX.remove(identification)
+
+
+@receiver(padron_reloaded)
+def clear_autocomplete_index(sender, **kwargs):
+    """
+    Drops the voters of the replaced padron, the index is built again from the new one. The other processes see the
+    new reload stamp
+
+    :param sender: the DBFactory class that replaced the padron
+    :param kwargs: other params
+    """
+    AUTOCOMPLETE_INDEX.clear()
@@ -0,0 +1,144 @@
+import csv
+import datetime
+
+from votes.locations import LOCATION_HIERARCHY
+
+NEW_VOTERS_COLUMNS = ('identification', 'elec_code', 'full_name', 'id_expiration_date')
+
+# Only the first errors are reported, a wrong file could have thousands
+MAX_REPORTED_ERRORS = 100
+
+
+class BulkResult:
+    """
+    The outcome of a bulk add or delete
+
+    ...
+
+    Attributes
+    ----------
+    processed : int
+        the amount of valid lines
+    applied : int
+        the amount of voters inserted or deleted
+    errors : list
+        (line number, message) tuples of the first invalid lines
+    error_count : int
+        the amount of invalid lines
+    """
+
+    def __init__(self):
+        self.processed = 0
+        self.applied = 0
+        self.errors = []
+        self.error_count = 0
+
+    @property
+    def skipped(self):
+        return self.processed - self.applied
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+def parse_date(value):
+    """
+    Reads a date as YYYY-MM-DD or as YYYYMMDD, like in PADRON_COMPLETO.txt
+
+    :param value: a string with the date
+    :return: the date as a Date type
+    """
+    value = value.strip()
+    if len(value) == 8 and value.isdigit():
+        return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:]))
+
+    return datetime.date.fromisoformat(value)
+
+
+def add_voters_from_file(database, lines, batch_size=5000):
+    """
+    Inserts the new voters of a CSV file with the columns identification, elec_code, full_name and
+    id_expiration_date, a batch at a time.
+
+    :param database: a DBFactory
+    :param lines: an iterable of text lines, like an open file
+    :param batch_size: the amount of voters inserted at once
+    :return: a BulkResult
+    """
+    result = BulkResult()
+    reader = csv.DictReader(lines)
+
+    if reader.fieldnames is None or not set(NEW_VOTERS_COLUMNS).issubset(reader.fieldnames):
+        result.add_error(1, f"The header must have the columns: {', '.join(NEW_VOTERS_COLUMNS)}")
+        return result
+
+    batch = []
+    for line_number, row in enumerate(reader, start=2):
+        identification = (row['identification'] or '').strip()
+        location = LOCATION_HIERARCHY.get_location(database, (row['elec_code'] or '').strip())
+        full_name = (row['full_name'] or '').strip()
+
+        if not identification.isdigit() or len(identification) != 9:
+            result.add_error(line_number, f"Invalid identification: {identification}")
+            continue
+        if location is None:
+            result.add_error(line_number, f"Unknown electoral code: {row['elec_code']}")
+            continue
+        if full_name == '':
+            result.add_error(line_number, "Missing name")
+            continue
+
+        try:
+            id_expiration_date = parse_date(row['id_expiration_date'] or '')
+        except ValueError:
+            result.add_error(line_number, f"Invalid expiration date: {row['id_expiration_date']}")
+            continue
+
+        batch.append({'identification': identification, 'elec_code': location, 'full_name': full_name,
+                      'id_expiration_date': id_expiration_date})
+        result.processed += 1
+
+        if len(batch) == batch_size:
+            result.applied += len(database.add_voters(batch))
+            batch = []
+
+    if batch:
+        result.applied += len(database.add_voters(batch))
+
+    return result
+
+
+def delete_voters_from_file(database, lines, batch_size=5000):
+    """
+    Deletes the voters listed in a file, like a list of deceased people. The identification is the first comma
+    separated value of every line, lines without one (as a header) are ignored.
+
+    :param database: a DBFactory
+    :param lines: an iterable of text lines, like an open file
+    :param batch_size: the amount of voters deleted at once
+    :return: a BulkResult
+    """
+    result = BulkResult()
+    batch = []
+
+    for line_number, line in enumerate(lines, start=1):
+        identification = line.split(',')[0].strip()
+
+        if not identification.isdigit():
+            if identification != '' and line_number > 1:
+                result.add_error(line_number, f"Invalid identification: {identification}")
+            continue
+
+        batch.append(identification)
+        result.processed += 1
+
+        if len(batch) == batch_size:
+            result.applied += database.delete_voters(batch)
+            batch = []
+
+    if batch:
+        result.applied += database.delete_voters(batch)
+
+    return result
@@ -0,0 +1,119 @@
+import hashlib
+from logging import getLogger
+
+from django.core.cache import caches
+
+from padron_web.settings import SEARCH_CACHE_ALIAS
+from votes.fields import normalise_name
+from votes.search_guard import check_search, guarded_search
+from votes.stamps import PADRON_STAMP
+
+logger = getLogger(__name__)
+
+
+def normalise_query(identification, name):
+    """
+    Normalises the searching specifications, so equivalent searches share the same cache entry
+
+    :param identification: the value of 'identification' input
+    :param name: the value of 'name' input
+    :return: a tuple with the identification without extra whitespace and the name normalised
+    """
+    return identification.strip(), normalise_name(name)
+
+
+class SearchCache:
+    """
+    A size bounded cache in front of DBFactory.search_voters, keyed by the normalised query.
+
+    The entries are stored in one of the Django caches (see CACHES in settings), so the local-memory backend gives a
+    per process LRU cache and the file or memcached backends share it between processes. Every key includes the
+    padron stamp (see votes.stamps), shared by all the processes and replaced when a voter is added or deleted or the
+    padron is loaded, so all the stored results become unreachable at once in every process.
+
+    ...
+
+    Attributes
+    ----------
+    alias : str
+        the name of the Django cache used to store the results
+    """
+    HITS_KEY = 'search:hits'
+    MISSES_KEY = 'search:misses'
+
+    def __init__(self, alias=SEARCH_CACHE_ALIAS):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def search_voters(self, database, identification, name):
+        """
+        Returns the voters who match the searching specifications, from the cache if possible. The expensive
+        searches raise SearchRefused (see votes.search_guard), they are not cached.
+
+        :param database: the DBFactory used on a cache miss
+        :param identification: the value of 'identification' input
+        :param name: the value of 'name' input
+        :return: a list with the found voters, at most SEARCH_MAX_RESULTS + 1
+        """
+        identification, name = normalise_query(identification, name)
+
+        if identification == '' and name == '':
+            return []
+
+        check_search(identification, name)
+
+        key = self.__get_key(identification, name)
+        voters_info_list = self.cache.get(key)
+
+        if voters_info_list is not None:
+            self.__increment(self.HITS_KEY)
+            return voters_info_list
+
+        self.__increment(self.MISSES_KEY)
+        voters_info_list = guarded_search(database, identification, name)
+        self.cache.set(key, voters_info_list)
+
+        return voters_info_list
+
+    def invalidate(self):
+        """
+        Makes every stored result unreachable in every process, the old entries are evicted by the cache backend.
+        """
+        PADRON_STAMP.bump()
+
+    def get_statistics(self):
+        """
+        Hit rate metrics of the cache.
+
+        :return: a dictionary with the hits, misses, hit rate and current padron stamp
+        """
+        values = self.cache.get_many([self.HITS_KEY, self.MISSES_KEY])
+        hits = values.get(self.HITS_KEY, 0)
+        misses = values.get(self.MISSES_KEY, 0)
+        lookups = hits + misses
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'generation': PADRON_STAMP.get(),
+        }
+
+    def __get_key(self, identification, name):
+        generation = PADRON_STAMP.get()
+        digest = hashlib.md5(f'{identification}|{name}'.encode('utf-8')).hexdigest()
+
+        return f'search:{generation}:{digest}'
+
+    def __increment(self, key):
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            logger.warning("Search cache counter %s was evicted", key)
+
+
+SEARCH_CACHE = SearchCache()
@@ -0,0 +1,52 @@
+import csv
+import json
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_COLUMNS = ('identification', 'full_name', 'elec_code', 'province', 'canton', 'district', 'voting_board',
+                  'gender', 'id_expiration_date')
+
+
+class _LineBuffer:
+    """
+    A file-like object that returns what is written instead of storing it, for csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_voters(database, export_format='csv', province=None, canton=None, district=None, chunk_size=1000):
+    """
+    Encodes the voters of a region as CSV or NDJSON, a few lines at a time. The voters are read with
+    DBFactory.iter_voters, so exporting the whole padron uses constant memory and the first lines are ready right away.
+
+    :param database: a DBFactory
+    :param export_format: 'csv' or 'ndjson'
+    :param province: a province name, or None for the whole padron
+    :param canton: a canton name, or None for the whole province
+    :param district: a district name, or None for the whole canton
+    :param chunk_size: the amount of voters encoded in each yielded string
+    :return: a generator of strings with complete lines
+    """
+    if export_format == 'csv':
+        writer = csv.writer(_LineBuffer())
+        encode = writer.writerow
+        yield encode(EXPORT_COLUMNS)
+    else:
+        def encode(row):
+            return json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=str) + '\n'
+
+    lines = []
+    for row in database.iter_voters(province=province, canton=canton, district=district):
+        lines.append(encode(row))
+
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+
+    if lines:
+        yield ''.join(lines)
@@ -0,0 +1,145 @@
+import datetime
+import unicodedata
+
+from django.db import models
+
+# Gender codes: the position in this tuple is the value stored in the database
+GENDERS = ('Hombre', 'Mujer')
+
+
+def get_gender(identification):
+    """
+    Derives the gender from an identification. The person is a man if id's fourth digit is even, otherwise is a woman.
+
+    :param identification: a string or an integer with the voter id
+    :return: 'Hombre' or 'Mujer'
+    """
+    return GENDERS[int(str(identification)[3]) % 2]
+
+
+def gender_to_code(gender):
+    """
+    Converts a gender name into the small integer stored in the database
+
+    :param gender: 'Hombre' or 'Mujer'
+    :return: 0 or 1
+    """
+    if gender is None or isinstance(gender, int):
+        return gender
+
+    return GENDERS.index(gender)
+
+
+def code_to_gender(code):
+    """
+    Converts a stored gender code back into its name
+
+    :param code: 0 or 1
+    :return: 'Hombre' or 'Mujer'
+    """
+    if code is None or code in GENDERS:
+        return code
+
+    return GENDERS[int(code)]
+
+
+def code_to_string(code, width):
+    """
+    Converts a numeric code into its fixed width string, as it comes in the TSE files
+
+    :param code: an integer or a string with the code
+    :param width: the amount of digits of the code
+    :return: the code padded with zeros
+    """
+    if code is None:
+        return code
+
+    return str(code).zfill(width)
+
+
+def normalise_name(name):
+    """
+    Builds the key used to search voters by name: uppercase, without accents or tildes and with single spaces, so
+    'Peña  Solís' and 'PENA SOLIS' match the same voters
+
+    :param name: a name or a part of it
+    :return: the normalised name
+    """
+    decomposed = unicodedata.normalize('NFKD', name.upper())
+
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def date_to_datetime(date):
+    """
+    BSON has no date type, so dates are stored as datetimes at midnight
+
+    :param date: a date
+    :return: the same date as a datetime
+    """
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+class GenderField(models.Field):
+    """
+    Stores the voter's gender as a small integer while the application keeps seeing 'Hombre' and 'Mujer'.
+    """
+    description = "Gender stored as a small integer"
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return code_to_gender(value)
+
+    def to_python(self, value):
+        return code_to_gender(value)
+
+    def get_prep_value(self, value):
+        return gender_to_code(super().get_prep_value(value))
+
+
+class FixedWidthCodeField(models.Field):
+    """
+    Stores a zero padded numeric code (electoral code, voting board) as an integer while the application keeps seeing
+    the fixed width string.
+
+    ...
+
+    Attributes
+    ----------
+    width : int
+        the amount of digits of the code
+    """
+    description = "Fixed width numeric code stored as an integer"
+
+    def __init__(self, *args, width=None, **kwargs):
+        self.width = width
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['width'] = self.width
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'PositiveIntegerField'
+
+    def rel_db_type(self, connection):
+        return models.IntegerField().db_type(connection=connection)
+
+    def from_db_value(self, value, expression, connection):
+        return code_to_string(value, self.width)
+
+    def to_python(self, value):
+        if value is None or value == '':
+            return None
+
+        return code_to_string(value, self.width)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or value == '':
+            return None
+
+        return int(value)
@@ -1,5 +1,7 @@
+import codecs
+
 from django import forms
-from votes.models import Person, Location
+from votes.locations import LOCATION_HIERARCHY
 
 
 class SearchLocationForm(forms.Form):
@@ -19,33 +21,45 @@ class SearchLocationForm(forms.Form):
     name = forms.CharField(label='name', max_length=100, required=False)
 
 
-class NewVoterForm(forms.ModelForm):
+class NewVoterForm(forms.Form):
     """
-    A class for the new voter information
+    A class for the new voter information. A plain form, not a ModelForm: the voter is validated and saved with the
+    selected DBFactory, not with the Django database
+
 
     ...
 
     Attributes
     ----------
     identification : IntegerField
-        legal voter identification as numbers
-    elec_code : ModelChoiceField
-        voter's electoral location
+        legal voter identification as numbers, cleaned as a string of a voter who does not exist yet
+    province : ChoiceField
+        province of the electoral location, only used to choose the canton
+    canton : ChoiceField
+        canton of the electoral location, only used to choose the district
+    elec_code : ChoiceField
+        voter's electoral location, chosen by district. Cleaned as a Location object
     full_name : CharField
         voter's full name
     id_expiration_date : DateField
         date of voter id's expiration
     """
-    identification = forms.IntegerField(label='Identificación', required=True, widget=forms.NumberInput(
+    identification = forms.IntegerField(label='Identificación', required=True, min_value=1,
+                                        max_value=999999999999999, widget=forms.NumberInput(
         attrs={'class': 'form-control me-2',
                'type': 'search',
                'aria-label': 'Search'}))
 
-    elec_code = forms.ModelChoiceField(label='Lugar de votación', queryset=Location.objects.all(), widget=forms.Select(
-        attrs={'class': 'form-control me-2',
-               'type': 'search'}))
+    province = forms.ChoiceField(label='Provincia', widget=forms.Select(
+        attrs={'class': 'form-control me-2'}))
+
+    canton = forms.ChoiceField(label='Cantón', widget=forms.Select(
+        attrs={'class': 'form-control me-2'}))
+
+    elec_code = forms.ChoiceField(label='Distrito', widget=forms.Select(
+        attrs={'class': 'form-control me-2'}))
 
-    full_name = forms.CharField(label='Nombre', required=True, widget=forms.TextInput(
+    full_name = forms.CharField(label='Nombre', required=True, max_length=200, widget=forms.TextInput(
         attrs=({'class': 'form-control me-2',
                 'type': 'search',
                 'aria-label': 'Search'})))
@@ -56,7 +70,116 @@ class NewVoterForm(forms.ModelForm):
                                                     'type': 'search',
                                                     'aria-label': 'Search'}))
 
-    class Meta:
-        model = Person
-        fields = ['identification', 'elec_code',
-                  'full_name', 'id_expiration_date']
+    field_order = ['identification', 'province', 'canton', 'elec_code', 'full_name', 'id_expiration_date']
+
+    def __init__(self, *args, database=None, **kwargs):
+        """
+        Fills the location choices from the in-memory location hierarchy. Only the provinces are needed to show the
+        form, the cantons and districts of the submitted data are needed to validate it.
+
+        :param database: the DBFactory used to load the locations the first time and to look for the voter
+        """
+        super().__init__(*args, **kwargs)
+        self.database = database
+
+        province = self.data.get('province', '')
+        canton = self.data.get('canton', '')
+        empty_choice = [('', '---------')]
+
+        self.fields['province'].choices = empty_choice + [
+            (name, name) for name in LOCATION_HIERARCHY.get_provinces(database)]
+        self.fields['canton'].choices = empty_choice + [
+            (name, name) for name in LOCATION_HIERARCHY.get_cantons(database, province)]
+        self.fields['elec_code'].choices = empty_choice + [
+            (elec_code, district) for elec_code, district in LOCATION_HIERARCHY.get_districts(database, province,
+                                                                                                canton)]
+
+    def clean_identification(self):
+        """
+        Looks for the identification in the selected database, it must not belong to a voter yet
+
+        :return: the identification as a string
+        """
+        identification = str(self.cleaned_data['identification'])
+
+        if self.database.get_voter(identification) is not None:
+            raise forms.ValidationError('Ya existe un votante con esta identificación.')
+
+        return identification
+
+    def clean_elec_code(self):
+        """
+        Resolves the chosen electoral code with a lookup in the location hierarchy
+
+        :return: a Location object
+        """
+        location = LOCATION_HIERARCHY.get_location(self.database, self.cleaned_data['elec_code'])
+
+        if location is None:
+            raise forms.ValidationError('El distrito seleccionado no existe.')
+
+        return location
+
+
+class BulkVotersForm(forms.Form):
+    """
+    A class for the bulk update files
+
+    ...
+
+    Attributes
+    ----------
+    new_voters_file : FileField
+        a CSV file with the columns identification, elec_code, full_name and id_expiration_date
+    deceased_file : FileField
+        a file with one identification per line of the voters to delete
+    encoding : ChoiceField
+        the encoding of both files, checked before any voter is changed
+    """
+    ENCODINGS = [('utf-8-sig', 'UTF-8'), ('iso-8859-1', 'ISO-8859-1 (Latin-1, como los archivos del TSE)')]
+
+    new_voters_file = forms.FileField(label='Nuevos votantes (CSV)', required=False, widget=forms.ClearableFileInput(
+        attrs={'class': 'form-control me-2'}))
+
+    deceased_file = forms.FileField(label='Personas fallecidas', required=False, widget=forms.ClearableFileInput(
+        attrs={'class': 'form-control me-2'}))
+
+    encoding = forms.ChoiceField(label='Codificación', choices=ENCODINGS, initial='utf-8-sig', widget=forms.Select(
+        attrs={'class': 'form-control me-2'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        if not cleaned_data.get('new_voters_file') and not cleaned_data.get('deceased_file'):
+            raise forms.ValidationError('Debe adjuntar al menos un archivo.')
+
+        encoding = cleaned_data.get('encoding')
+        if encoding:
+            for field in ('new_voters_file', 'deceased_file'):
+                if cleaned_data.get(field) and not self.__is_decodable(cleaned_data[field], encoding):
+                    self.add_error(field, f'El archivo no está en {dict(self.ENCODINGS)[encoding]}, elija otra '
+                                          f'codificación.')
+
+        return cleaned_data
+
+    @staticmethod
+    def __is_decodable(uploaded_file, encoding):
+        """
+        Decodes the whole file a chunk at a time, so a wrong encoding is reported before the voters are changed
+
+        :param uploaded_file: an UploadedFile
+        :param encoding: the name of a Python codec
+        :return: True if the file can be decoded, the file is left at its beginning
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+
+        try:
+            for chunk in uploaded_file.chunks():
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return False
+        finally:
+            uploaded_file.seek(0)
+
+        return True
@@ -0,0 +1,139 @@
+from logging import getLogger
+from threading import Lock
+
+from django.dispatch import receiver
+
+from votes.signals import padron_reloaded
+from votes.stamps import RELOAD_STAMP
+
+logger = getLogger(__name__)
+
+
+class LocationHierarchy:
+    """
+    An in-memory copy of the vote locations as a province -> canton -> district hierarchy.
+
+    It is loaded once per process from the database, so the new voter form and its cascading selects never query the
+    locations table, and an electoral code is resolved with a dictionary lookup. The copy remembers the reload stamp
+    (see votes.stamps) it was loaded with and is loaded again when another process replaces the padron.
+
+    ...
+
+    Attributes
+    ----------
+    __loaded : tuple
+        (locations, hierarchy, stamp) or None before the first load, where locations are the Location objects by
+        electoral code, hierarchy is {province: {canton: [(elec_code, district), ...]}} with everything sorted by name
+        and stamp is the reload stamp read before the locations
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__loaded = None
+
+    def load(self, database):
+        """
+        Reads all the locations from the database.
+
+        :param database: a DBFactory
+        """
+        # Read first, so a reload that ends while the locations are read is seen by the next lookup
+        stamp = RELOAD_STAMP.get()
+        locations = {}
+        hierarchy = {}
+
+        for location in sorted(database.get_locations(), key=lambda item: (item.province, item.canton, item.district)):
+            locations[location.elec_code] = location
+            districts = hierarchy.setdefault(location.province, {}).setdefault(location.canton, [])
+            districts.append((location.elec_code, location.district))
+
+        with self.__lock:
+            self.__loaded = (locations, hierarchy, stamp)
+
+        logger.info("Location hierarchy loaded with %s locations", len(locations))
+
+    def clear(self):
+        """
+        Forgets the loaded locations, they are read again on the next lookup.
+        """
+        with self.__lock:
+            self.__loaded = None
+
+    def get_provinces(self, database):
+        """
+        :param database: the DBFactory used to load the locations the first time
+        :return: a sorted list with the provinces names
+        """
+        return list(self.__get_hierarchy(database))
+
+    def get_cantons(self, database, province):
+        """
+        :param database: the DBFactory used to load the locations the first time
+        :param province: the province name
+        :return: a sorted list with the cantons names of the province
+        """
+        return list(self.__get_hierarchy(database).get(province, {}))
+
+    def get_districts(self, database, province, canton):
+        """
+        :param database: the DBFactory used to load the locations the first time
+        :param province: the province name
+        :param canton: the canton name
+        :return: a sorted list of (elec_code, district) tuples of the canton
+        """
+        return list(self.__get_hierarchy(database).get(province, {}).get(canton, []))
+
+    def get_elec_codes(self, database, province=None, canton=None, district=None):
+        """
+        :param database: the DBFactory used to load the locations the first time
+        :param province: a province name, or None for all the provinces
+        :param canton: a canton name, or None for all the cantons of the province
+        :param district: a district name, or None for all the districts of the canton
+        :return: a list with the electoral codes of the region
+        """
+        return [elec_code
+                for province_name, cantons in self.__get_hierarchy(database).items() if province in (None, province_name)
+                for canton_name, districts in cantons.items() if canton in (None, canton_name)
+                for elec_code, district_name in districts if district in (None, district_name)]
+
+    def get_location(self, database, elec_code):
+        """
+        :param database: the DBFactory used to load the locations the first time
+        :param elec_code: an electoral code
+        :return: the Location object with the electoral code or None if it does not exist
+        """
+        locations, hierarchy, stamp = self.__get_loaded(database)
+        location = locations.get(elec_code)
+
+        # A new code may come from a reload made less than STAMP_CHECK_SECONDS ago
+        if location is None and RELOAD_STAMP.get(fresh=True) != stamp:
+            self.load(database)
+            location = self.__loaded[0].get(elec_code)
+
+        return location
+
+    def __get_hierarchy(self, database):
+        return self.__get_loaded(database)[1]
+
+    def __get_loaded(self, database):
+        loaded = self.__loaded
+        if loaded is None or loaded[2] != RELOAD_STAMP.get():
+            self.load(database)
+            loaded = self.__loaded
+
+        return loaded
+
+
+LOCATION_HIERARCHY = LocationHierarchy()
+
+
+@receiver(padron_reloaded)
+def clear_location_hierarchy(sender, **kwargs):
+    """
+    Drops the locations of the replaced padron at once in the process that replaced it, the other processes see the
+    new reload stamp
+
+    :param sender: the DBFactory class that replaced the padron
+    :param kwargs: other params
+    """
+    LOCATION_HIERARCHY.clear()
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from votes.bulk import add_voters_from_file, delete_voters_from_file
+from votes.utils import get_database
+
+
+class Command(BaseCommand):
+    help = 'Adds the voters of a CSV file and deletes the voters listed in another file, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--add', type=str, help='CSV file with identification, elec_code, full_name and '
+                                                    'id_expiration_date columns')
+        parser.add_argument('--delete', type=str, help='file with one identification per line')
+        parser.add_argument('--encoding', type=str, default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not options['add'] and not options['delete']:
+            raise CommandError('Use --add, --delete or both')
+
+        start = time.perf_counter()
+        database = get_database()
+        operations = [(options['add'], add_voters_from_file, 'added'),
+                      (options['delete'], delete_voters_from_file, 'deleted')]
+
+        for path, operation, verb in operations:
+            if not path:
+                continue
+
+            with open(path, 'r', encoding=options['encoding'], newline='') as file:
+                result = operation(database, file, batch_size=options['batch_size'])
+
+            print(f"{path}: {result.applied} voters {verb}, {result.skipped} skipped, "
+                  f"{result.error_count} invalid lines")
+            for line_number, message in result.errors:
+                print(f"  line {line_number}: {message}")
+
+        execution_time = time.perf_counter() - start
+        print(f"Execution time in seconds: {execution_time}")
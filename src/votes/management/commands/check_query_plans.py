@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from padron_web.settings import ACTUAL_DATABASE
+from votes.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the queries of every DBFactory read and flags the plans that scan the whole padron, ' \
+           'as a sequential scan on Postgresql or a collection scan on MongoDB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', choices=('Postgresql', 'Mongodb'), default=ACTUAL_DATABASE)
+        parser.add_argument('--identification', help='the voter used for the sample values, the first one of the '
+                                                      'padron by default')
+
+    def handle(self, *args, **options):
+        try:
+            checks = check_query_plans(options['database'], options['identification'])
+        except (ValueError, LookupError) as error:
+            raise CommandError(error)
+
+        for check in checks:
+            if check.ok:
+                self.stdout.write(f"OK    {check.label}: {check.queries} queries")
+            else:
+                self.stdout.write(self.style.WARNING(f"SCAN  {check.label}: {check.queries} queries, "
+                                                     f"full scan of {', '.join(check.scans)}"))
+
+        failed = [check.label for check in checks if not check.ok]
+        if failed:
+            raise CommandError(f"{len(failed)} reads scan the whole padron: {', '.join(failed)}")
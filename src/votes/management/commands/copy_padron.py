@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from votes.transfer import copy_padron, summarise_padron
+from votes.utils import DATABASE_NAMES, set_database
+
+
+class Command(BaseCommand):
+    help = 'Copies the voters and locations from one database backend into another, to switch ACTUAL_DATABASE ' \
+           'without processing the TSE files again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=DATABASE_NAMES)
+        parser.add_argument('target', choices=DATABASE_NAMES)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--skip-verify', action='store_true',
+                            help='do not compare the counts and checksums of both databases after the copy')
+
+    def handle(self, *args, **options):
+        if options['source'] == options['target']:
+            raise CommandError("The source and the target must be different databases")
+
+        start = time.perf_counter()
+        source = set_database(options['source'])
+        target = set_database(options['target'])
+
+        # An empty source would copy nothing and then verify as equal to an empty target
+        if not source.has_voters():
+            raise CommandError(f"{options['source']} has no voters, there is nothing to copy")
+
+        copy_padron(source, target, batch_size=options['batch_size'], max_workers=options['workers'])
+        self.stdout.write(f"Copy time in seconds: {time.perf_counter() - start}")
+
+        if not options['skip_verify']:
+            source_summary = summarise_padron(source)
+            if source_summary.voters == 0:
+                raise CommandError(f"{options['source']} has no voters, the copy can not be verified")
+
+            target_summary = summarise_padron(target)
+            self.stdout.write(f"{options['source']}: {source_summary}")
+            self.stdout.write(f"{options['target']}: {target_summary}")
+
+            if source_summary != target_summary:
+                raise CommandError("The databases are different, the copy is incomplete")
+
+            self.stdout.write("The databases are equal")
+
+        execution_time = time.perf_counter() - start
+        self.stdout.write(f"Execution time in seconds: {execution_time}")
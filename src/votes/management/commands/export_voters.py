@@ -0,0 +1,31 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from votes.export import EXPORT_FORMATS, export_voters
+from votes.utils import get_database
+
+
+class Command(BaseCommand):
+    help = 'Exports the voters of a region, or the whole padron, as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--province', type=str)
+        parser.add_argument('--canton', type=str)
+        parser.add_argument('--district', type=str)
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', type=str, help='file path, the voters are written to stdout if omitted')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        chunks = export_voters(get_database(), options['format'], province=options['province'],
+                               canton=options['canton'], district=options['district'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
+
+        execution_time = time.perf_counter() - start
+        self.stderr.write(f"Execution time in seconds: {execution_time}")
@@ -1,25 +1,62 @@
 import time
 import os
 
-from django.core.management.base import BaseCommand
-from votes.utils import FileDecoder
+from django.core.management.base import BaseCommand, CommandError
+from votes.utils import FileDecoder, ReloadError, get_database
 from padron_web.settings import BASE_DIR
 
 
 class Command(BaseCommand):
-    help = 'Processes two txt files and upload them to a database'
+    help = 'Processes two txt files, or the zip archive of the TSE that contains them, and upload them to a database'
 
     def add_arguments(self, parser):
-        parser.add_argument('register_files', nargs=2, type=str)
+        parser.add_argument('register_files', nargs='*', type=str,
+                            help='PADRON_COMPLETO.txt and Distelec.txt, or a single .zip archive with both')
+        parser.add_argument('--reload', action='store_true',
+                            help='load into shadow tables or collections and swap them with the live padron when '
+                                 'complete, the previous version is kept')
+        parser.add_argument('--rollback', action='store_true',
+                            help='swap the previous version of the padron back in, no files are read')
+        parser.add_argument('--abort', action='store_true',
+                            help='drop the shadow tables or collections of a reload that stopped, so the voters can '
+                                 'be added and deleted again, no files are read')
 
     def handle(self, *args, **options):
         start = time.perf_counter()
+
+        if options['rollback']:
+            try:
+                get_database().rollback_reload()
+            except ReloadError as error:
+                raise CommandError(str(error))
+
+            print("The previous version of the padron was restored")
+            return
+
+        if options['abort']:
+            try:
+                get_database().abort_reload()
+            except ReloadError as error:
+                raise CommandError(str(error))
+
+            print("The reload of the padron was aborted")
+            return
+
         folder_path = os.path.join(BASE_DIR, '../fixtures/')
-        people_path = folder_path + options['register_files'][0]
-        locations_path = folder_path + options['register_files'][1]
+        register_files = [os.path.join(folder_path, file_name) for file_name in options['register_files']]
 
         decoder = FileDecoder()
-        decoder.process_files(locations_path=locations_path, people_path=people_path)
+
+        try:
+            if len(register_files) == 1 and register_files[0].lower().endswith('.zip'):
+                decoder.process_archive(register_files[0], reload=options['reload'])
+            elif len(register_files) == 2:
+                decoder.process_files(locations_path=register_files[1], people_path=register_files[0],
+                                      reload=options['reload'])
+            else:
+                raise CommandError("Expected PADRON_COMPLETO.txt and Distelec.txt, or a single .zip archive")
+        except ReloadError as error:
+            raise CommandError(str(error))
 
         execution_time = time.perf_counter() - start
         print(f"Execution time in seconds: {execution_time}")
@@ -0,0 +1,105 @@
+# Generated by Django 4.1.7 on 2023-04-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import LPad
+import votes.fields
+
+ELEC_CODE_LIKE_INDEX_COLUMNS = ('votes_person', ['elec_code_id'])
+
+
+def gender_names_to_codes(apps, schema_editor):
+    Person = apps.get_model('votes', 'Person')
+    db_alias = schema_editor.connection.alias
+
+    for gender in votes.fields.GENDERS:
+        Person.objects.using(db_alias).filter(gender=gender).update(gender_code=gender)
+
+
+def gender_codes_to_names(apps, schema_editor):
+    Person = apps.get_model('votes', 'Person')
+    db_alias = schema_editor.connection.alias
+
+    for gender in votes.fields.GENDERS:
+        Person.objects.using(db_alias).filter(gender_code=gender).update(gender=gender)
+
+
+def drop_elec_code_like_index(apps, schema_editor):
+    # Postgresql keeps a varchar_pattern_ops index on the foreign key to the location, which an integer column does
+    # not accept, and Django only drops the one of the altered primary key
+    if schema_editor.connection.vendor == 'postgresql':
+        index_name = schema_editor._create_index_name(*ELEC_CODE_LIKE_INDEX_COLUMNS, suffix='_like')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(index_name)}')
+
+
+def create_elec_code_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        index_name = schema_editor._create_index_name(*ELEC_CODE_LIKE_INDEX_COLUMNS, suffix='_like')
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {schema_editor.quote_name(index_name)} '
+                              f'ON votes_person (elec_code_id varchar_pattern_ops)')
+
+
+def pad_codes(apps, schema_editor):
+    # The integer columns come back as strings without the leading zeros, pads them back to their widths
+    Location = apps.get_model('votes', 'Location')
+    Person = apps.get_model('votes', 'Person')
+    db_alias = schema_editor.connection.alias
+
+    Location.objects.using(db_alias).update(elec_code=LPad('elec_code', 6, Value('0')))
+    Person.objects.using(db_alias).update(elec_code_id=LPad('elec_code_id', 6, Value('0')),
+                                          voting_board=LPad('voting_board', 5, Value('0')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0003_location_votes_locat_provinc_1e186e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_elec_code_like_index, create_elec_code_like_index),
+        migrations.RunPython(migrations.RunPython.noop, pad_codes),
+        migrations.AlterField(
+            model_name='location',
+            name='elec_code',
+            field=votes.fields.FixedWidthCodeField(primary_key=True, serialize=False, verbose_name='electoral code', width=6),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='voting_board',
+            field=votes.fields.FixedWidthCodeField(width=5),
+        ),
+        migrations.RemoveIndex(
+            model_name='person',
+            name='votes_perso_identif_6fae5c_idx',
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='gender_code',
+            field=votes.fields.GenderField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='gender',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.RunPython(gender_names_to_codes, gender_codes_to_names),
+        migrations.RemoveField(
+            model_name='person',
+            name='gender',
+        ),
+        migrations.RenameField(
+            model_name='person',
+            old_name='gender_code',
+            new_name='gender',
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='gender',
+            field=votes.fields.GenderField(),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['identification', 'elec_code', 'gender'], name='votes_perso_identif_6fae5c_idx'),
+        ),
+    ]
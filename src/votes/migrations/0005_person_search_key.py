@@ -0,0 +1,58 @@
+# Generated by Django 4.1.7 on 2023-04-20 09:41
+
+from django.db import migrations, models
+import votes.fields
+
+
+def populate_search_keys(apps, schema_editor):
+    # A single UPDATE on Postgresql, the same normalisation as votes.fields.normalise_name: uppercase, without accents
+    # and with single spaces
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+        schema_editor.execute("UPDATE votes_person SET search_key = "
+                              "btrim(regexp_replace(upper(unaccent(full_name)), '\\s+', ' ', 'g'))")
+        return
+
+    Person = apps.get_model('votes', 'Person')
+    db_alias = schema_editor.connection.alias
+    batch = []
+
+    for person in Person.objects.using(db_alias).only('identification', 'full_name').iterator(chunk_size=1000):
+        person.search_key = votes.fields.normalise_name(person.full_name)
+        batch.append(person)
+
+        if len(batch) == 1000:
+            Person.objects.using(db_alias).bulk_update(batch, ['search_key'])
+            batch = []
+
+    Person.objects.using(db_alias).bulk_update(batch, ['search_key'])
+
+
+def create_trigram_index(apps, schema_editor):
+    # A trigram index keeps the 'contains' searches on search_key index backed. Only available on Postgresql.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS votes_person_search_key_trgm '
+                              'ON votes_person USING gin (search_key gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS votes_person_search_key_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0004_compact_person_schema'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='normalised name'),
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2023-04-21 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0005_person_search_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['id_expiration_date'], name='votes_perso_id_expi_1b3872_idx'),
+        ),
+    ]
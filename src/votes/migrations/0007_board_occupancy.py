@@ -0,0 +1,44 @@
+# Generated by Django 4.1.7 on 2023-04-24 10:12
+
+from django.db import migrations, models
+from django.db.models import Count
+import votes.fields
+
+
+def count_board_voters(apps, schema_editor):
+    Person = apps.get_model('votes', 'Person')
+    BoardOccupancy = apps.get_model('votes', 'BoardOccupancy')
+    db_alias = schema_editor.connection.alias
+
+    boards = Person.objects.using(db_alias).values('elec_code_id', 'voting_board').annotate(voters=Count('pk'))
+    BoardOccupancy.objects.using(db_alias).bulk_create(
+        (BoardOccupancy(elec_code=board['elec_code_id'], voting_board=board['voting_board'], voters=board['voters'])
+         for board in boards.order_by()), batch_size=10000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0006_person_id_expiration_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('elec_code', votes.fields.FixedWidthCodeField(verbose_name='electoral code', width=6)),
+                ('voting_board', votes.fields.FixedWidthCodeField(width=5)),
+                ('voters', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['elec_code', 'voting_board', 'full_name'], include=('identification',), name='votes_person_board_roster_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='boardoccupancy',
+            constraint=models.UniqueConstraint(fields=('elec_code', 'voting_board'), name='unique_board_occupancy'),
+        ),
+        migrations.RunPython(count_board_voters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.7 on 2023-04-25 16:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_identification_trigram_index(apps, schema_editor):
+    # The identification searches are 'contains' searches as well. Only available on Postgresql.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS votes_person_identification_trgm '
+                              'ON votes_person USING gin (identification gin_trgm_ops)')
+
+
+def drop_identification_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS votes_person_identification_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0007_board_occupancy'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='person',
+            name='votes_perso_identif_5c5032_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='person',
+            name='votes_perso_identif_6fae5c_idx',
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='elec_code',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='votes.location'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['elec_code', 'gender'], name='votes_perso_elec_co_96f463_idx'),
+        ),
+        migrations.RunPython(create_identification_trigram_index, drop_identification_trigram_index),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2023-04-26 10:12
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # The table of the 'padron' DatabaseCache, where the stamps of votes.stamps are shared by every process
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0008_workload_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+from votes.fields import FixedWidthCodeField, GenderField
+
 
 class Location(models.Model):
     """
@@ -9,8 +11,8 @@ class Location(models.Model):
 
     Attributes
     ----------
-    elec_code : CharField
-        location's electoral code. This is the primary key.
+    elec_code : FixedWidthCodeField
+        location's six digits electoral code, stored as an integer. This is the primary key.
     province : CharField
         name of the province.
     canton : CharField
@@ -21,7 +23,7 @@ class Location(models.Model):
     Methods
     -------
     """
-    elec_code = models.CharField('electoral code', max_length=200, primary_key=True)
+    elec_code = FixedWidthCodeField('electoral code', width=6, primary_key=True)
     province = models.CharField(max_length=200)
     canton = models.CharField(max_length=200)
     district = models.CharField(max_length=200)
@@ -49,28 +51,72 @@ class Person(models.Model):
         legal identification in Costa Rica
     elec_code : CharField
         foreign key of location model
-    voting_board : CharField
-        voting board within the vote location
+    voting_board : FixedWidthCodeField
+        five digits voting board within the vote location, stored as an integer
     full_name : CharField
         person's full name
-    gender : CharField
-        person's gender. the person is a man if id's fourth digit is even, otherwise is a woman.
+    gender : GenderField
+        person's gender stored as a small integer. the person is a man if id's fourth digit is even, otherwise is a
+        woman.
+    search_key : CharField
+        person's full name normalised with normalise_name, used to search by name
 
     Methods
     -------
     """
     identification = models.CharField(max_length=15, primary_key=True)
-    elec_code = models.ForeignKey(Location, on_delete=models.CASCADE)
-    voting_board = models.CharField(max_length=15)
+    elec_code = models.ForeignKey(Location, on_delete=models.CASCADE, db_index=False)
+    voting_board = FixedWidthCodeField(width=5)
     full_name = models.CharField('name', max_length=200)
-    gender = models.CharField(max_length=200)
+    gender = GenderField()
     id_expiration_date = models.DateField()
+    search_key = models.CharField('normalised name', max_length=200, default='', editable=False)
 
     def __str__(self):
         return f"Cedula: {self.identification}, {self.full_name}"
 
     class Meta:
+        # Designed around the DBFactory queries, check them with the check_query_plans command. The foreign key
+        # index on elec_code alone is left out, both composites lead with it.
         indexes = [
-            models.Index(fields=['identification', 'elec_code', 'gender']),
-            models.Index(fields=['identification', 'id_expiration_date']),
+            # The voters by district and gender of get_voter_statistics, an index only scan
+            models.Index(fields=['elec_code', 'gender']),
+            # The voters with the same expiration date of get_voter_statistics
+            models.Index(fields=['id_expiration_date']),
+            # The board rosters sorted by name, covering the identification for an index only scan
+            models.Index(fields=['elec_code', 'voting_board', 'full_name'], include=['identification'],
+                         name='votes_person_board_roster_idx'),
+        ]
+
+
+class BoardOccupancy(models.Model):
+    """
+    Model for the amount of voters of every voting board, counted when the padron is loaded and kept up to date by the
+    voters added and deleted afterwards.
+
+    ...
+
+    Attributes
+    ----------
+    elec_code : FixedWidthCodeField
+        six digits electoral code of the vote location. It is not a foreign key, so a reload can replace the
+        locations table without touching this one.
+    voting_board : FixedWidthCodeField
+        five digits voting board within the vote location
+    voters : PositiveIntegerField
+        the amount of voters of the voting board
+
+    Methods
+    -------
+    """
+    elec_code = FixedWidthCodeField('electoral code', width=6)
+    voting_board = FixedWidthCodeField(width=5)
+    voters = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Junta {self.voting_board} de {self.elec_code}: {self.voters}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['elec_code', 'voting_board'], name='unique_board_occupancy'),
         ]
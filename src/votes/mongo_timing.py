@@ -0,0 +1,74 @@
+from pymongo.monitoring import CommandListener
+
+from votes.timing import record_db_call
+
+
+class MongoTimingListener(CommandListener):
+    """
+    A pymongo command listener that adds every command sent to MongoDB to the request timing. It is passed to the
+    MongoClient in its event_listeners, pymongo publishes the events in the thread that runs the command.
+
+    It lives apart from votes.timing, so pymongo is only imported by the MongoDB backend.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_db_call(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        record_db_call(event.duration_micros / 1_000_000)
+
+
+class MongoCommandRecorder(CommandListener):
+    """
+    A pymongo command listener that keeps the read commands sent to some collections while recording is on, so they
+    can be explained. Used by votes.query_plans, registered with pymongo.monitoring.register.
+
+    ...
+
+    Attributes
+    ----------
+    collections : tuple
+        the names of the recorded collections, recorded in every version of the padron (votes_person_N, see
+        MongoDB.get_collection_name) as well
+    command_names : tuple
+        the names of the recorded commands, as 'find' or 'aggregate'
+    recording : bool
+        True while the commands are recorded
+    commands : list
+        the recorded commands, without the session and routing fields added by the driver
+    """
+
+    def __init__(self, collections, command_names):
+        self.collections = collections
+        self.command_names = command_names
+        self.recording = False
+        self.commands = []
+
+    def started(self, event):
+        if not self.recording or event.command_name not in self.command_names:
+            return
+
+        if self.is_recorded(event.command.get(event.command_name)):
+            self.commands.append({key: value for key, value in event.command.items()
+                                  if not key.startswith('$') and key not in ('lsid', 'txnNumber')})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def is_recorded(self, collection):
+        """
+        :param collection: the name of a collection, or None
+        :return: True if it is one of the recorded collections or one of their versions
+        """
+        if not isinstance(collection, str):
+            return False
+
+        name, _, version = collection.rpartition('_')
+
+        return collection in self.collections or (version.isdigit() and name in self.collections)
@@ -0,0 +1,246 @@
+import json
+from contextlib import ExitStack
+
+from django.db import connections
+
+from padron_web.settings import SEARCH_MAX_RESULTS, SEARCH_MIN_IDENTIFICATION_LENGTH
+from votes.utils import set_database
+
+# The tables and collections too large to be read whole by a request
+LARGE_TABLES = ('votes_person',)
+
+# The Mongo commands that read documents, the others (getMore, insert, ...) are not explained
+MONGO_READ_COMMANDS = ('find', 'aggregate', 'count', 'distinct')
+
+
+class PlanCheck:
+    """
+    The plans of the queries sent by a DBFactory method
+
+    ...
+
+    Attributes
+    ----------
+    label : str
+        the method and the kind of call
+    queries : int
+        the amount of queries or commands explained
+    scans : list
+        the large tables or collections read whole, one item per plan that reads them
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.queries = 0
+        self.scans = []
+
+    @property
+    def ok(self):
+        return not self.scans
+
+
+def get_sample_calls(database, voter):
+    """
+    The reads of a DBFactory, called with the values of an existing voter so the plans match the real requests
+
+    :param database: a DBFactory
+    :param voter: a Person object read from the database
+    :return: a list of (label, callable) tuples
+    """
+    location = voter.elec_code
+    part_of_identification = voter.identification[2:2 + SEARCH_MIN_IDENTIFICATION_LENGTH]
+    surname = voter.full_name.split()[-1]
+    limit = SEARCH_MAX_RESULTS + 1
+
+    return [
+        ("search_voters by identification", lambda: database.search_voters(part_of_identification, '', limit=limit)),
+        ("search_voters by name", lambda: database.search_voters('', surname, limit=limit)),
+        ("get_voter", lambda: database.get_voter(voter.identification)),
+        ("get_voters", lambda: database.get_voters([voter.identification])),
+        ("get_voter_statistics", lambda: database.get_voter_statistics(voter.id_expiration_date, location)),
+        ("get_board_roster", lambda: database.get_board_roster(location.elec_code, voter.voting_board)),
+        ("get_board_occupancy", lambda: database.get_board_occupancy(location.elec_code)),
+        # Only the first batch, the plan is the same for the rest
+        ("iter_voters by district", lambda: next(iter(database.iter_voters(location.province, location.canton,
+                                                                           location.district)), None)),
+    ]
+
+
+def check_query_plans(database_name, identification=None):
+    """
+    Runs every read of a DBFactory, records its queries and explains them, looking for the plans that read a large
+    table or collection whole: a Seq Scan on Postgresql or a COLLSCAN on MongoDB.
+
+    :param database_name: 'Postgresql' or 'Mongodb'
+    :param identification: the voter used for the sample values, the first one of the padron by default
+    :return: a list of PlanCheck. Raises ValueError for the other databases and LookupError for a missing voter
+    """
+    if database_name == 'Postgresql':
+        record, explain = record_postgresql_queries, explain_postgresql_query
+    elif database_name == 'Mongodb':
+        record, explain = record_mongodb_commands, explain_mongodb_command
+        register_mongodb_recorder()
+    else:
+        raise ValueError(f"The query plans of {database_name} can not be checked")
+
+    # A new object, created after the recorder is registered
+    database = set_database(database_name)
+
+    if identification is None:
+        identification = find_sample_identification(database)
+
+    voter = database.get_voter(identification)
+    if voter is None:
+        raise LookupError(f"The voter {identification} does not exist")
+
+    checks = []
+    for label, call in get_sample_calls(database, voter):
+        check = PlanCheck(label)
+
+        for query in record(database, call):
+            check.queries += 1
+            check.scans.extend(explain(database, query))
+
+        checks.append(check)
+
+    return checks
+
+
+def find_sample_identification(database):
+    """
+    Finds a voter through the indexed board reads, get_voter_names would read the whole padron on Postgresql
+
+    :param database: a DBFactory
+    :return: the identification of the first voter of the first voting board with voters, or None
+    """
+    for location in database.get_locations():
+        for voting_board, amount in database.get_board_occupancy(location.elec_code):
+            roster = database.get_board_roster(location.elec_code, voting_board)
+            if roster:
+                return roster[0].identification
+
+    return None
+
+
+def record_postgresql_queries(database, call):
+    """
+    :param database: a PostgresqlDB
+    :param call: a callable that runs some queries
+    :return: a list of (alias, sql, params) tuples with the SELECT queries run by the callable
+    """
+    queries = []
+
+    def recorder(alias):
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((alias, sql, params))
+
+            return execute(sql, params, many, context)
+
+        return record
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder(connection.alias)))
+
+        call()
+
+    return queries
+
+
+def explain_postgresql_query(database, query):
+    """
+    :param database: a PostgresqlDB
+    :param query: an (alias, sql, params) tuple
+    :return: a list with the large tables read by a Seq Scan node
+    """
+    alias, sql, params = query
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return find_sequential_scans(plan[0]['Plan'])
+
+
+def find_sequential_scans(node):
+    """
+    :param node: a node of a Postgresql json plan
+    :return: a list with the large tables read by a Seq Scan in the node or its children
+    """
+    scans = []
+
+    if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES:
+        scans.append(node['Relation Name'])
+
+    for child in node.get('Plans', []):
+        scans.extend(find_sequential_scans(child))
+
+    return scans
+
+
+_mongo_recorder = None
+
+
+def record_mongodb_commands(database, call):
+    """
+    :param database: a MongoDB, created after the recorder was registered
+    :param call: a callable that sends some commands
+    :return: a list with the read commands sent to the large collections
+    """
+    _mongo_recorder.commands = []
+    _mongo_recorder.recording = True
+
+    try:
+        call()
+    finally:
+        _mongo_recorder.recording = False
+
+    return _mongo_recorder.commands
+
+
+def register_mongodb_recorder():
+    """
+    Registers the command recorder of record_mongodb_commands. It must be called before the MongoDB object is
+    created, the clients take the listeners registered when they are built.
+    """
+    global _mongo_recorder
+    # Imported here, so pymongo is only loaded when MongoDB is checked
+    from pymongo import monitoring
+    from votes.mongo_timing import MongoCommandRecorder
+
+    if _mongo_recorder is None:
+        _mongo_recorder = MongoCommandRecorder(LARGE_TABLES, MONGO_READ_COMMANDS)
+        monitoring.register(_mongo_recorder)
+
+
+def explain_mongodb_command(database, command):
+    """
+    :param database: a MongoDB
+    :param command: a read command
+    :return: a list with the large collections read by a COLLSCAN stage of the winning plan
+    """
+    explanation = database.db.command({'explain': command, 'verbosity': 'queryPlanner'})
+    # The first field of a command is its name, with the collection as value
+    collection = next(iter(command.values()))
+
+    return [collection] * count_collection_scans(explanation)
+
+
+def count_collection_scans(explanation):
+    """
+    :param explanation: the output of explain, or a part of it
+    :return: the amount of COLLSCAN stages, the rejected plans are not inspected
+    """
+    if isinstance(explanation, list):
+        return sum(count_collection_scans(item) for item in explanation)
+    if not isinstance(explanation, dict):
+        return 0
+
+    scans = 1 if explanation.get('stage') == 'COLLSCAN' else 0
+
+    return scans + sum(count_collection_scans(value) for key, value in explanation.items()
+                       if key != 'rejectedPlans')
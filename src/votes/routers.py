@@ -0,0 +1,103 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_PIN_COOKIE = 'padron_primary'
+
+
+class RoutingState:
+    """
+    Where the reads of the current request or command go
+
+    ...
+
+    Attributes
+    ----------
+    pinned : bool
+        True when the reads must go to the primary database
+    wrote : bool
+        True when the current request wrote to the primary database
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_routing_state = ContextVar('routing_state', default=None)
+
+
+def pin_primary():
+    """
+    Sends the rest of the reads of the current request or command to the primary database, so they see what was just
+    written. Called by the database backends before every write.
+    """
+    state = _routing_state.get()
+    if state is None:
+        state = RoutingState()
+        _routing_state.set(state)
+
+    state.pinned = True
+    state.wrote = True
+
+
+def is_primary_pinned():
+    """
+    :return: True if the reads of the current request or command must go to the primary database
+    """
+    state = _routing_state.get()
+
+    return state is not None and state.pinned
+
+
+class PrimaryReplicaRouter:
+    """
+    A database router that sends the reads of the padron models to the aliases in settings.DATABASE_REPLICAS and the
+    writes to 'default'.
+
+    The reads go to 'default' as well when there are no replicas or when the request is pinned to the primary, after
+    a write or during the seconds that follow it (see PrimaryPinMiddleware). Sessions, users and the other apps
+    always use 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+
+        if not replicas or is_primary_pinned() or model._meta.app_label != 'votes':
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and the replicas hold the same data
+        return True
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins the requests of a client to the primary database for settings.REPLICA_LAG_SECONDS after it wrote, so the page
+    shown after adding a voter does not read a replica that has not received the new voter yet.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=PRIMARY_PIN_COOKIE in request.COOKIES)
+        token = _routing_state.set(state)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(PRIMARY_PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_LAG_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+
+        return response
@@ -0,0 +1,50 @@
+from logging import getLogger
+
+from padron_web.settings import SEARCH_MIN_IDENTIFICATION_LENGTH, SEARCH_MIN_NAME_LENGTH, SEARCH_MAX_RESULTS, \
+    SEARCH_MAX_ESTIMATED_MATCHES
+from votes.utils import SearchTimeoutError
+
+logger = getLogger(__name__)
+
+
+class SearchRefused(Exception):
+    """
+    A search that is not run or not completed because it is too expensive, its message asks the user to refine it
+    """
+
+
+def check_search(identification, name):
+    """
+    Refuses the searches that would match most of the padron, before any database or cache lookup
+
+    :param identification: the normalised identification
+    :param name: the normalised name
+    """
+    if identification != '' and len(identification) < SEARCH_MIN_IDENTIFICATION_LENGTH:
+        raise SearchRefused(f"Escriba al menos {SEARCH_MIN_IDENTIFICATION_LENGTH} dígitos de la cédula")
+    if identification == '' and name != '' and len(name) < SEARCH_MIN_NAME_LENGTH:
+        raise SearchRefused(f"Escriba al menos {SEARCH_MIN_NAME_LENGTH} letras del nombre")
+
+
+def guarded_search(database, identification, name):
+    """
+    Runs a search that can not tie up a worker and a database connection: it is refused when the database expects
+    too many voters, it returns at most SEARCH_MAX_RESULTS + 1 voters (one more tells the list is incomplete) and it
+    is stopped by the database after SEARCH_TIMEOUT_MS.
+
+    :param database: a DBFactory
+    :param identification: the normalised identification
+    :param name: the normalised name
+    :return: a list of VoterRow
+    """
+    estimate = database.estimate_voters(identification, name)
+
+    if estimate is not None and estimate > SEARCH_MAX_ESTIMATED_MATCHES:
+        logger.info("Search of '%s' refused, about %s voters expected", identification or name, estimate)
+        raise SearchRefused(f"La búsqueda coincide con cerca de {estimate} votantes, agregue más datos")
+
+    try:
+        return database.search_voters(identification=identification, name=name, limit=SEARCH_MAX_RESULTS + 1)
+    except SearchTimeoutError as error:
+        logger.warning("Search of '%s' timed out", identification or name, exc_info=error)
+        raise SearchRefused("La búsqueda tardó demasiado, agregue más datos") from error
@@ -0,0 +1,17 @@
+from django.dispatch import Signal
+
+# Sent by the database backends after a voter is inserted. Arguments: identification, full_name
+voter_added = Signal()
+
+# Sent by the database backends after a voter is deleted. Arguments: identification
+voter_deleted = Signal()
+
+# Sent by the database backends after a batch of voters is inserted. Arguments: voters, a list of
+# (identification, full_name) tuples
+voters_added = Signal()
+
+# Sent by the database backends after a batch of voters is deleted. Arguments: identifications
+voters_deleted = Signal()
+
+# Sent by the database backends after the whole padron is replaced by a reload or a rollback. No arguments
+padron_reloaded = Signal()
@@ -0,0 +1,101 @@
+import time
+import uuid
+
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from padron_web.settings import STAMPS_CACHE_ALIAS, STAMP_CHECK_SECONDS
+from votes.signals import voter_added, voter_deleted, voters_added, voters_deleted, padron_reloaded
+
+
+class SharedStamp:
+    """
+    A value shared by every process, the web workers and the management commands, replaced by a new one each time
+    the padron changes. The per process caches remember the stamp they were built with and are refreshed when it is
+    different.
+
+    The stamps are stored in the STAMPS_CACHE_ALIAS Django cache, a database cache by default, without expiration. A
+    process reads its stamp again at most every STAMP_CHECK_SECONDS, so the other processes see a change after that
+    long; the process that changed the padron sees it at once.
+
+    A missing stamp (a new cache, or a cache that lost it) starts with a new random value, never with one used
+    before, so a cache built with an old value can not become valid again.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+        the key of the stamp in the cache
+    """
+
+    def __init__(self, name, alias=STAMPS_CACHE_ALIAS, check_seconds=STAMP_CHECK_SECONDS):
+        self.name = name
+        self.alias = alias
+        self.check_seconds = check_seconds
+        # (value, monotonic time it was read), replaced as a whole so the threads never see half of it
+        self.__local = (None, 0.0)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, fresh=False):
+        """
+        :param fresh: True to read the stamp from the cache now, without waiting for STAMP_CHECK_SECONDS
+        :return: the current value of the stamp
+        """
+        value, checked = self.__local
+
+        if fresh or value is None or time.monotonic() - checked >= self.check_seconds:
+            value = self.cache.get(self.name)
+
+            if value is None:
+                self.cache.add(self.name, uuid.uuid4().hex, timeout=None)
+                # Another process may have added it first
+                value = self.cache.get(self.name)
+
+            self.__local = (value, time.monotonic())
+
+        return value
+
+    def bump(self):
+        """
+        Replaces the stamp with a new value, the caches built with the old one become stale in every process
+        """
+        value = uuid.uuid4().hex
+        self.cache.set(self.name, value, timeout=None)
+        self.__local = (value, time.monotonic())
+
+
+# Changes with every voter added or deleted and every load of the padron
+PADRON_STAMP = SharedStamp('stamp:padron')
+
+# Changes only when the whole padron is loaded, replaced or rolled back
+RELOAD_STAMP = SharedStamp('stamp:reload')
+
+
+@receiver(voter_added)
+@receiver(voter_deleted)
+@receiver(voters_added)
+@receiver(voters_deleted)
+def bump_padron_stamp(sender, **kwargs):
+    """
+    Tells every process that the voters changed
+
+    :param sender: the DBFactory class that changed the padron
+    :param kwargs: other params
+    """
+    PADRON_STAMP.bump()
+
+
+@receiver(padron_reloaded)
+def bump_reload_stamp(sender, **kwargs):
+    """
+    Tells every process that the padron was replaced
+
+    :param sender: the DBFactory class that replaced the padron
+    :param kwargs: other params
+    """
+    RELOAD_STAMP.bump()
+    PADRON_STAMP.bump()
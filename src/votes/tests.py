@@ -1,3 +1,879 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from votes import routers
+from votes.admin import get_prefix_upper_bound
+from votes.autocomplete import AutocompleteIndex
+from votes.bulk import add_voters_from_file, delete_voters_from_file
+from votes.export import EXPORT_COLUMNS, export_voters
+from votes.fields import FixedWidthCodeField, GenderField, normalise_name
+from votes.locations import LOCATION_HIERARCHY
+from votes.models import Location, Person
+from votes.routers import PRIMARY_PIN_COOKIE, PrimaryPinMiddleware, PrimaryReplicaRouter, is_primary_pinned, \
+    pin_primary
+from votes.search_guard import SearchRefused, check_search, guarded_search
+from votes.signals import voter_deleted
+from votes.stamps import PADRON_STAMP, RELOAD_STAMP
+from votes.timing import RequestTimingMiddleware, record_db_call
+from votes.transfer import copy_padron, summarise_padron
+from votes.utils import MongoDB, PostgresqlDB, ReloadError, SearchTimeoutError, SqliteDB, VoterRow
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# The stamps live in a database cache, a local memory one is enough for these tests
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'search': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-search'},
+    'padron': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-padron'},
+}
+
+SAMPLE_LOCATIONS = [('101001', 'SAN JOSE', 'CENTRAL', 'HOSPITAL'), ('101002', 'SAN JOSE', 'CENTRAL', 'CARMEN'),
+                    ('201001', 'ALAJUELA', 'CENTRAL', 'ALAJUELA')]
+
+# The person tuples of FileDecoder, without the search key
+SAMPLE_VOTERS = [('101110111', '00012', 'JOSÉ PEÑA SOLÍS', 'Hombre', datetime.date(2030, 1, 1), '101001'),
+                 ('101120112', '00012', 'ANA MORA ROJAS', 'Mujer', datetime.date(2030, 1, 1), '101001'),
+                 ('101130113', '00013', 'LUIS ROJAS MORA', 'Hombre', datetime.date(2031, 6, 1), '101002'),
+                 ('201140114', '00001', 'MARIA PEREZ ARCE', 'Mujer', datetime.date(2030, 1, 1), '201001')]
+
+
+def load_sample_padron(database):
+    """
+    Loads SAMPLE_LOCATIONS and SAMPLE_VOTERS as process_files does
+
+    :param database: a DBFactory
+    """
+    database.load_location_data(SAMPLE_LOCATIONS)
+    database.load_people_data([(*voter, normalise_name(voter[2])) for voter in SAMPLE_VOTERS])
+    database.create_indexes()
+    database.refresh_board_occupancy()
+
+
+def can_mock_mongo():
+    """
+    :return: True if mongomock is installed and takes the bulk writes of the installed pymongo, mongomock 4.3 does not
+        take the UpdateOne of pymongo 4.11 and later
+    """
+    if mongomock is None:
+        return False
+
+    from pymongo import UpdateOne
+
+    try:
+        mongomock.MongoClient().padron_tests.probe.bulk_write([UpdateOne({}, {'$set': {'probe': 1}})])
+    except TypeError:
+        return False
+
+    return True
+
+
+def isolate_backend(test):
+    """
+    Forgets the locations read and the primary pinned by the writes of a test, at its beginning and its end
+
+    :param test: the TestCase that uses a DBFactory
+    """
+    token = routers._routing_state.set(None)
+    test.addCleanup(routers._routing_state.reset, token)
+    LOCATION_HIERARCHY.clear()
+    test.addCleanup(LOCATION_HIERARCHY.clear)
+
+
+def make_sqlite_database(test):
+    """
+    :param test: the TestCase that uses the database, it is removed after the test
+    :return: a SqliteDB on a temporary file
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    patcher = mock.patch('votes.utils.SQLITE_DATABASE_PATH', os.path.join(directory.name, 'padron.sqlite3'))
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+    return SqliteDB()
+
+
+class FakeDatabase:
+    """
+    A DBFactory stand-in that keeps the voters in a dictionary and records the batches it receives
+
+    ...
+
+    Attributes
+    ----------
+    locations : list
+        the Location objects returned by get_locations
+    voters : dict
+        the full names by identification
+    batches : list
+        the sizes of the batches of add_voters and delete_voters
+    estimate : int
+        the amount of voters returned by estimate_voters
+    timeout : bool
+        True to make search_voters raise SearchTimeoutError
+    """
+
+    def __init__(self, locations=(), voters=None):
+        self.locations = list(locations)
+        self.voters = dict(voters or {})
+        self.batches = []
+        self.estimate = None
+        self.timeout = False
+
+    def get_locations(self):
+        return list(self.locations)
+
+    def get_voter_names(self):
+        return list(self.voters.items())
+
+    def estimate_voters(self, identification, name):
+        return self.estimate
+
+    def search_voters(self, identification, name, limit=None):
+        if self.timeout:
+            raise SearchTimeoutError("timed out")
+
+        return []
+
+    def add_voters(self, people):
+        self.batches.append(len(people))
+        new_people = [person for person in people if person['identification'] not in self.voters]
+        for person in new_people:
+            self.voters[person['identification']] = person['full_name']
+
+        return [person['identification'] for person in new_people]
+
+    def delete_voters(self, identifications):
+        self.batches.append(len(identifications))
+
+        return sum(self.voters.pop(identification, None) is not None for identification in identifications)
+
+
+class FieldsTests(SimpleTestCase):
+
+    def test_gender_field_stores_codes(self):
+        field = GenderField()
+
+        self.assertEqual(field.get_prep_value('Hombre'), 0)
+        self.assertEqual(field.get_prep_value('Mujer'), 1)
+        self.assertIsNone(field.get_prep_value(None))
+        self.assertEqual(field.to_python(1), 'Mujer')
+        self.assertEqual(field.from_db_value(0, None, None), 'Hombre')
+
+    def test_fixed_width_code_field_pads_codes(self):
+        field = FixedWidthCodeField(width=6)
+
+        self.assertEqual(field.get_prep_value('001001'), 1001)
+        self.assertEqual(field.to_python(1001), '001001')
+        self.assertEqual(field.from_db_value(101001, None, None), '101001')
+        self.assertIsNone(field.to_python(''))
+        self.assertIsNone(field.get_prep_value(''))
+
+    def test_fixed_width_code_field_keeps_width_in_migrations(self):
+        name, path, args, kwargs = FixedWidthCodeField(width=5).deconstruct()
+
+        self.assertEqual(kwargs['width'], 5)
+
+    def test_normalise_name(self):
+        self.assertEqual(normalise_name('  José   Peña\tSolís '), 'JOSE PENA SOLIS')
+        self.assertEqual(normalise_name('PENA SOLIS'), normalise_name('peña solís'))
+        self.assertEqual(normalise_name('   '), '')
+
+    def test_get_prefix_upper_bound(self):
+        self.assertEqual(get_prefix_upper_bound('1234'), '1235')
+        self.assertEqual(get_prefix_upper_bound('1299'), '13')
+        self.assertEqual(get_prefix_upper_bound('0'), '1')
+        self.assertIsNone(get_prefix_upper_bound('999'))
+
+
+class MigrationTests(TransactionTestCase):
+    """
+    Runs the votes migrations backwards and forwards over a few rows
+    """
+
+    def migrate(self, migration):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('votes', migration)])
+
+        return executor.loader.project_state(('votes', migration)).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes('votes')[0][1])
+
+    def test_compact_person_schema_keeps_the_codes(self):
+        apps = self.migrate('0003_location_votes_locat_provinc_1e186e_idx_and_more')
+        location = apps.get_model('votes', 'Location').objects.create(elec_code='010203', province='SAN JOSE',
+                                                                       canton='CENTRAL', district='CARMEN')
+        apps.get_model('votes', 'Person').objects.create(identification='101110111', elec_code=location,
+                                                         voting_board='00003', full_name='ANA SOTO', gender='Mujer',
+                                                         id_expiration_date=datetime.datetime(2030, 1, 1))
+
+        apps = self.migrate('0004_compact_person_schema')
+        person = apps.get_model('votes', 'Person').objects.get()
+        self.assertEqual((person.elec_code_id, person.voting_board, person.gender), ('010203', '00003', 'Mujer'))
+
+        apps = self.migrate('0003_location_votes_locat_provinc_1e186e_idx_and_more')
+        person = apps.get_model('votes', 'Person').objects.get()
+        self.assertEqual((person.elec_code_id, person.voting_board, person.gender), ('010203', '00003', 'Mujer'))
+
+    def test_search_keys_are_filled(self):
+        apps = self.migrate('0004_compact_person_schema')
+        location = apps.get_model('votes', 'Location').objects.create(elec_code='101001', province='SAN JOSE',
+                                                                       canton='CENTRAL', district='HOSPITAL')
+        apps.get_model('votes', 'Person').objects.create(identification='101110111', elec_code=location,
+                                                         voting_board='00012', full_name='José  Peña Solís',
+                                                         gender='Hombre', id_expiration_date=datetime.date(2030, 1, 1))
+
+        apps = self.migrate('0005_person_search_key')
+
+        self.assertEqual(apps.get_model('votes', 'Person').objects.get().search_key, 'JOSE PENA SOLIS')
+
+    def get_person_indexes(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, 'votes_person'))
+
+    def test_the_statistics_index_is_created(self):
+        self.migrate('0006_person_id_expiration_date_index')
+        self.assertIn('votes_perso_id_expi_1b3872_idx', self.get_person_indexes())
+
+        self.migrate('0005_person_search_key')
+        self.assertNotIn('votes_perso_id_expi_1b3872_idx', self.get_person_indexes())
+
+    def test_the_indexes_follow_the_queries(self):
+        self.migrate('0008_workload_indexes')
+        indexes = self.get_person_indexes()
+        self.assertIn('votes_perso_elec_co_96f463_idx', indexes)
+        self.assertTrue(indexes.isdisjoint({'votes_perso_identif_5c5032_idx', 'votes_perso_identif_6fae5c_idx'}))
+
+        self.migrate('0007_board_occupancy')
+        indexes = self.get_person_indexes()
+        self.assertNotIn('votes_perso_elec_co_96f463_idx', indexes)
+        self.assertTrue(indexes >= {'votes_perso_identif_5c5032_idx', 'votes_perso_identif_6fae5c_idx',
+                                    'votes_person_board_roster_idx'})
+
+    def test_board_occupancy_counts_the_voters(self):
+        apps = self.migrate('0006_person_id_expiration_date_index')
+        location = apps.get_model('votes', 'Location').objects.create(elec_code='101001', province='SAN JOSE',
+                                                                       canton='CENTRAL', district='HOSPITAL')
+        Person = apps.get_model('votes', 'Person')
+        for identification, voting_board in [('101110111', '00012'), ('101120112', '00012'), ('101130113', '00013')]:
+            Person.objects.create(identification=identification, elec_code=location, voting_board=voting_board,
+                                  full_name='ANA SOTO', gender='Mujer', id_expiration_date=datetime.date(2030, 1, 1))
+
+        apps = self.migrate('0008_workload_indexes')
+
+        self.assertEqual(sorted(apps.get_model('votes', 'BoardOccupancy').objects.values_list(
+            'elec_code', 'voting_board', 'voters')), [('101001', '00012', 2), ('101001', '00013', 1)])
+
+    def test_the_stamps_cache_table_is_created(self):
+        self.migrate('0008_workload_indexes')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE padron_stamps')
+
+        self.migrate('0009_padron_stamps_cache')
+
+        self.assertIn('padron_stamps', connection.introspection.table_names())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkTests(SimpleTestCase):
+
+    def setUp(self):
+        LOCATION_HIERARCHY.clear()
+        self.database = FakeDatabase([Location(elec_code='101001', province='SAN JOSE', canton='CENTRAL',
+                                               district='HOSPITAL')], {'101110111': 'ANA SOTO'})
+
+    def tearDown(self):
+        LOCATION_HIERARCHY.clear()
+
+    def test_add_voters_from_file(self):
+        lines = ['identification,elec_code,full_name,id_expiration_date\n',
+                 '404440444,101001,Luis Mora,2030-01-31\n',
+                 '505550555,101001,Eva Rojas,20310215\n',
+                 '101110111,101001,Ana Soto,2030-01-01\n',
+                 '12,101001,Corta,2030-01-01\n',
+                 '606660666,999999,Sin Distrito,2030-01-01\n',
+                 '707770777,101001,,2030-01-01\n',
+                 '808880888,101001,Mala Fecha,2030-02-30\n']
+
+        result = add_voters_from_file(self.database, lines, batch_size=2)
+
+        self.assertEqual(result.processed, 3)
+        self.assertEqual(result.applied, 2)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(self.database.batches, [2, 1])
+        self.assertEqual([line_number for line_number, message in result.errors], [5, 6, 7, 8])
+        self.assertEqual(self.database.voters['505550555'], 'Eva Rojas')
+
+    def test_add_voters_from_file_without_header(self):
+        result = add_voters_from_file(self.database, ['404440444,101001,Luis Mora,2030-01-31\n'])
+
+        self.assertEqual(result.error_count, 1)
+        self.assertEqual(result.errors[0][0], 1)
+        self.assertEqual(self.database.batches, [])
+
+    def test_delete_voters_from_file(self):
+        lines = ['identification\n', '101110111\n', '404440444,fallecido\n', 'abc\n', '\n']
+
+        result = delete_voters_from_file(self.database, lines)
+
+        self.assertEqual(result.processed, 2)
+        self.assertEqual(result.applied, 1)
+        self.assertEqual(result.errors, [(4, 'Invalid identification: abc')])
+        self.assertNotIn('101110111', self.database.voters)
+
+
+class SearchGuardTests(SimpleTestCase):
+
+    def test_short_searches_are_refused(self):
+        with self.assertRaisesMessage(SearchRefused, "Escriba al menos 4 dígitos de la cédula"):
+            check_search('123', '')
+        with self.assertRaisesMessage(SearchRefused, "Escriba al menos 3 letras del nombre"):
+            check_search('', 'AN')
+
+        check_search('1234', '')
+        check_search('', 'ANA')
+
+    def test_large_searches_are_refused(self):
+        database = FakeDatabase()
+        database.estimate = 2000000
+
+        with self.assertRaisesMessage(SearchRefused, "La búsqueda coincide con cerca de 2000000 votantes"):
+            guarded_search(database, '', 'ANA')
+
+    def test_slow_searches_are_refused(self):
+        database = FakeDatabase()
+        database.timeout = True
+
+        with self.assertLogs('votes.search_guard', 'WARNING'), \
+                self.assertRaisesMessage(SearchRefused, "La búsqueda tardó demasiado"):
+            guarded_search(database, '', 'ANA')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AutocompleteIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.database = FakeDatabase(voters={'101110111': 'JOSÉ PEÑA SOLÍS', '205550222': 'ANA SOTO MORA',
+                                             '101120112': 'JOSEFA ROJAS'})
+        self.index = AutocompleteIndex(refresh_seconds=3600, check_seconds=0.01)
+        self.index.build(self.database)
+        self.addCleanup(self.index.stop)
+
+    def wait_for(self, query, matches):
+        deadline = time.monotonic() + 5
+        while self.index.search(self.database, query) != matches and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.index.search(self.database, query), matches)
+
+    def test_search_by_name_ignores_accents(self):
+        self.assertEqual(self.index.search(self.database, 'jose'),
+                         [('101110111', 'JOSÉ PEÑA SOLÍS'), ('101120112', 'JOSEFA ROJAS')])
+        self.assertEqual(self.index.search(self.database, 'jose', limit=1), [('101110111', 'JOSÉ PEÑA SOLÍS')])
+
+    def test_search_by_identification(self):
+        self.assertEqual(self.index.search(self.database, '1011'),
+                         [('101110111', 'JOSÉ PEÑA SOLÍS'), ('101120112', 'JOSEFA ROJAS')])
+        self.assertEqual(self.index.search(self.database, '3'), [])
+        self.assertEqual(self.index.search(self.database, '  '), [])
+
+    def test_overlay_changes(self):
+        self.index.add('303330333', 'José Arce')
+        self.index.remove('101110111')
+
+        self.assertEqual(self.index.search(self.database, 'jose'),
+                         [('303330333', 'JOSÉ ARCE'), ('101120112', 'JOSEFA ROJAS')])
+
+    def test_compact_keeps_the_changes(self):
+        self.index.add('303330333', 'José Arce')
+        self.index.remove('205550222')
+        self.index.compact()
+
+        self.assertEqual(self.index.search(self.database, 'ana'), [])
+        self.assertEqual(self.index.search(self.database, '3033'), [('303330333', 'JOSÉ ARCE')])
+
+    def test_cleared_index_finds_nothing(self):
+        self.index.clear()
+        # The search starts a background build, the database read is not answered by this search
+        self.database.voters = {}
+
+        self.assertEqual(self.index.search(self.database, 'jose'), [])
+
+    def test_the_worker_builds_the_index(self):
+        self.index.clear()
+        self.database.voters['303330333'] = 'JOSÉ ARCE'
+
+        self.wait_for('jose', [('303330333', 'JOSÉ ARCE'), ('101110111', 'JOSÉ PEÑA SOLÍS'),
+                               ('101120112', 'JOSEFA ROJAS')])
+
+    def test_the_worker_follows_a_reload_of_another_process(self):
+        self.index.search(self.database, 'jose')
+        self.database.voters = {'404440444': 'JOSUÉ MORA'}
+        RELOAD_STAMP.bump()
+
+        self.wait_for('jos', [('404440444', 'JOSUÉ MORA')])
+
+    def test_the_searches_do_not_read_the_stamps(self):
+        self.index.stop()
+
+        with mock.patch.object(RELOAD_STAMP, 'get', side_effect=AssertionError), \
+                mock.patch.object(PADRON_STAMP, 'get', side_effect=AssertionError), \
+                mock.patch('votes.autocomplete.Thread'):
+            self.assertEqual(self.index.search(self.database, '2055'), [('205550222', 'ANA SOTO MORA')])
+
+    def test_a_forked_process_starts_its_own_worker(self):
+        self.index.search(self.database, 'ana')
+        self.index.after_fork()
+
+        with mock.patch('votes.autocomplete.Thread') as thread:
+            self.assertEqual(self.index.search(self.database, 'ana'), [('205550222', 'ANA SOTO MORA')])
+
+        thread.return_value.start.assert_called_once_with()
+
+
+class BackendTests:
+    """
+    The tests run on every DBFactory, over the sample padron. The subclasses create the database
+    """
+
+    def make_database(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        isolate_backend(self)
+        self.database = self.make_database()
+        load_sample_padron(self.database)
+
+    def test_has_voters(self):
+        self.assertTrue(self.database.has_voters())
+
+        self.database.delete_voters([voter[0] for voter in SAMPLE_VOTERS])
+
+        self.assertFalse(self.database.has_voters())
+
+    def add_voter(self, identification, full_name):
+        return self.database.add_voter({'identification': identification, 'full_name': full_name,
+                                        'elec_code': Location(elec_code='201001', province='ALAJUELA',
+                                                              canton='CENTRAL', district='ALAJUELA'),
+                                        'id_expiration_date': datetime.date(2032, 1, 1)})
+
+    def test_add_voter(self):
+        self.assertEqual(self.add_voter('201150115', 'Eva Soto'), '201150115')
+
+        person = self.database.get_voter('201150115')
+        self.assertEqual((person.full_name, person.voting_board, person.elec_code.district),
+                         ('EVA SOTO', '00000', 'ALAJUELA'))
+        self.assertEqual(self.database.get_board_occupancy('201001'), [('00000', 1), ('00001', 1)])
+
+    def test_delete_voter(self):
+        deleted = []
+
+        def receiver(sender, identification, **kwargs):
+            deleted.append(identification)
+
+        voter_deleted.connect(receiver)
+        self.addCleanup(voter_deleted.disconnect, receiver)
+
+        self.database.delete_voter('101110111')
+        self.database.delete_voter('999999999')
+
+        self.assertEqual(deleted, ['101110111'])
+        self.assertIsNone(self.database.get_voter('101110111'))
+        self.assertEqual(self.database.get_board_occupancy('101001'), [('00012', 1)])
+
+    def test_board_roster_and_occupancy(self):
+        self.assertEqual(self.database.get_board_roster('101001', '00012'),
+                         [VoterRow('101120112', 'ANA MORA ROJAS'), VoterRow('101110111', 'JOSÉ PEÑA SOLÍS')])
+        self.assertEqual(self.database.get_board_roster('101001', '00013'), [])
+        self.assertEqual(self.database.get_board_occupancy('101001'), [('00012', 2)])
+        self.assertEqual(self.database.get_board_occupancy('101002'), [('00013', 1)])
+
+    def test_get_voter_statistics(self):
+        location = Location(elec_code='101001', province='SAN JOSE', canton='CENTRAL', district='HOSPITAL')
+
+        # All, men and women of the district, canton and province, and the voters with the same expiration date
+        self.assertEqual(self.database.get_voter_statistics(datetime.date(2030, 1, 1), location),
+                         [2, 3, 3, 1, 2, 2, 1, 1, 1, 3])
+
+    def test_search_voters(self):
+        self.assertEqual({voter.identification for voter in self.database.search_voters('', 'rojas')},
+                         {'101120112', '101130113'})
+        self.assertEqual({voter.identification for voter in self.database.search_voters('1011', '')},
+                         {'101110111', '101120112', '101130113'})
+        self.assertEqual(len(self.database.search_voters('1011', '', limit=2)), 2)
+        self.assertEqual(self.database.search_voters('', ''), [])
+
+
+class CountedEstimateTests:
+    """
+    The tests of the backends that estimate a search counting its first voters
+    """
+
+    def test_estimate_voters_counts_up_to_the_limit(self):
+        self.assertEqual(self.database.estimate_voters('', 'ROJAS'), 2)
+        self.assertEqual(self.database.estimate_voters('', ''), 0)
+
+        with mock.patch('votes.utils.SEARCH_MAX_ESTIMATED_MATCHES', 0):
+            self.assertEqual(self.database.estimate_voters('1011', ''), 1)
+
+
+class ReloadTests:
+    """
+    The tests of the backends that reload the padron without downtime
+    """
+
+    def reload(self, voters, expected_voters=None):
+        self.database.begin_reload()
+        self.database.load_location_data(SAMPLE_LOCATIONS)
+        self.database.load_people_data([(*voter, normalise_name(voter[2])) for voter in voters])
+        self.database.create_indexes()
+        self.database.finish_reload(expected_voters=len(voters) if expected_voters is None else expected_voters)
+
+    def search_identifications(self, identification):
+        return {voter.identification for voter in self.database.search_voters(identification, '')}
+
+    def test_reload_and_rollback(self):
+        self.reload(SAMPLE_VOTERS[:2])
+
+        self.assertEqual(self.search_identifications('1011'), {'101110111', '101120112'})
+
+        self.database.rollback_reload()
+
+        self.assertEqual(self.search_identifications('1011'), {'101110111', '101120112', '101130113'})
+
+    def test_the_padron_is_read_only_while_it_is_reloaded(self):
+        self.database.begin_reload()
+
+        with self.assertRaises(ReloadError):
+            self.database.delete_voters(['101110111'])
+        with self.assertRaises(ReloadError):
+            self.database.begin_reload()
+        self.assertEqual(self.search_identifications('1011'), {'101110111', '101120112', '101130113'})
+
+        self.database.abort_reload()
+
+        self.assertEqual(self.database.delete_voters(['101110111']), 1)
+
+    def test_an_incomplete_reload_is_refused(self):
+        with self.assertRaises(ReloadError):
+            self.reload(SAMPLE_VOTERS[:2], expected_voters=3)
+        self.database.abort_reload()
+
+        self.assertEqual(self.search_identifications('1011'), {'101110111', '101120112', '101130113'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SqliteDBTests(BackendTests, CountedEstimateTests, SimpleTestCase):
+
+    def make_database(self):
+        return make_sqlite_database(self)
+
+    def test_load_errors_are_raised(self):
+        self.database.execute('DROP TABLE location')
+
+        with self.assertLogs('votes.utils', 'ERROR'), self.assertRaises(sqlite3.OperationalError):
+            self.database.load_location_data(SAMPLE_LOCATIONS)
+
+    def test_an_interrupted_search_times_out(self):
+        # The progress handler interrupts the statement after SEARCH_TIMEOUT_MS
+        interrupted = sqlite3.OperationalError('interrupted')
+
+        with mock.patch.object(self.database, 'execute', side_effect=interrupted), \
+                self.assertRaises(SearchTimeoutError):
+            self.database.search_voters('', 'ROJAS')
+
+    def test_other_search_errors_are_raised(self):
+        self.database.execute('DROP TABLE person_name')
+
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'no such table'):
+            self.database.search_voters('', 'ROJAS')
+
+
+@unittest.skipUnless(can_mock_mongo(), "mongomock is not installed or does not support this pymongo")
+@override_settings(CACHES=TEST_CACHES)
+class MongoDBTests(BackendTests, CountedEstimateTests, ReloadTests, SimpleTestCase):
+
+    def make_database(self):
+        with mock.patch('pymongo.MongoClient', mongomock.MongoClient):
+            database = MongoDB()
+
+        database.client.drop_database('padron_electoral')
+        self.addCleanup(database.client.drop_database, 'padron_electoral')
+
+        return database
+
+    def test_add_voter_errors_are_raised(self):
+        from pymongo.errors import DuplicateKeyError
+
+        with self.assertLogs('votes.utils', 'ERROR'), self.assertRaises(DuplicateKeyError):
+            self.add_voter('201140114', 'Maria Perez Arce')
+
+        self.assertEqual(self.database.get_board_occupancy('201001'), [('00001', 1)])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "the test database is not Postgresql")
+@override_settings(CACHES=TEST_CACHES)
+class PostgresqlDBTests(BackendTests, ReloadTests, TestCase):
+
+    def make_database(self):
+        return PostgresqlDB()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CopyPadronTests(SimpleTestCase):
+
+    def setUp(self):
+        isolate_backend(self)
+        self.source = make_sqlite_database(self)
+        load_sample_padron(self.source)
+
+    def test_the_summary_changes_with_any_voter(self):
+        summary = summarise_padron(self.source)
+        self.assertEqual((summary.voters, summary.locations), (4, 3))
+        self.assertEqual(summarise_padron(self.source), summary)
+
+        self.source.delete_voter('201140114')
+        self.source.load_people_data([(*SAMPLE_VOTERS[3][:2], 'MARIA PEREZ', *SAMPLE_VOTERS[3][3:], 'MARIA PEREZ')])
+
+        self.assertEqual(summarise_padron(self.source).voters, 4)
+        self.assertNotEqual(summarise_padron(self.source), summary)
+
+    @unittest.skipUnless(can_mock_mongo(), "mongomock is not installed or does not support this pymongo")
+    def test_copy_padron(self):
+        with mock.patch('pymongo.MongoClient', mongomock.MongoClient):
+            target = MongoDB()
+        target.client.drop_database('padron_electoral')
+        self.addCleanup(target.client.drop_database, 'padron_electoral')
+
+        copy_padron(self.source, target, batch_size=3, max_workers=2)
+
+        self.assertEqual(summarise_padron(target), summarise_padron(self.source))
+        self.assertEqual(target.get_board_occupancy('101001'), [('00012', 2)])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VotersLookupTests(TestCase):
+
+    def setUp(self):
+        isolate_backend(self)
+        database = make_sqlite_database(self)
+        load_sample_padron(database)
+        patcher = mock.patch('votes.views.get_database', return_value=database)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse('voters_lookup')
+
+    def log_in(self):
+        self.client.force_login(User.objects.create_user('mesa'))
+
+    def test_anonymous_users_are_sent_to_the_login(self):
+        response = self.client.get(self.url, {'cedulas': '201140114'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    def test_lookup_in_the_requested_order(self):
+        self.log_in()
+
+        response = self.client.get(self.url, {'cedulas': '201140114,999999999,101110111'})
+
+        self.assertEqual([voter['identification'] for voter in response.json()['voters']],
+                         ['201140114', '101110111'])
+        self.assertEqual(response.json()['voters'][0]['district'], 'ALAJUELA')
+        self.assertEqual(response.json()['not_found'], ['999999999'])
+
+    def test_lookup_with_a_json_body(self):
+        self.log_in()
+
+        response = self.client.post(self.url, json.dumps({'cedulas': ['101130113']}), content_type='application/json')
+
+        self.assertEqual(response.json()['voters'][0]['voting_board'], '00013')
+
+    def test_bad_requests(self):
+        self.log_in()
+
+        self.assertEqual(self.client.post(self.url, 'cedulas', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, json.dumps({'cedulas': '101130113'}),
+                                          content_type='application/json').status_code, 400)
+
+        with mock.patch('votes.views.VOTERS_LOOKUP_MAX_BATCH', 1):
+            self.assertEqual(self.client.get(self.url, {'cedulas': '101130113,101110111'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportTests(TestCase):
+
+    def setUp(self):
+        isolate_backend(self)
+        database = make_sqlite_database(self)
+        load_sample_padron(database)
+        patcher = mock.patch('votes.views.get_database', return_value=database)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create_user('mesa'))
+        self.url = reverse('voters_export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_the_padron_as_csv(self):
+        response, content = self.export()
+
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="padron.csv"')
+        self.assertEqual(tuple(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(sorted(row[0] for row in rows[1:]), [voter[0] for voter in SAMPLE_VOTERS])
+        self.assertIn(['101110111', 'JOSÉ PEÑA SOLÍS', '101001', 'SAN JOSE', 'CENTRAL', 'HOSPITAL', '00012', 'Hombre',
+                       '2030-01-01'], rows)
+
+    def test_export_a_region_as_ndjson(self):
+        response, content = self.export(formato='ndjson', provincia='SAN JOSE', canton='CENTRAL', distrito='CARMEN')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="SAN JOSE_CENTRAL_CARMEN.ndjson"')
+        self.assertEqual([json.loads(line) for line in content.splitlines()],
+                         [{'identification': '101130113', 'full_name': 'LUIS ROJAS MORA', 'elec_code': '101002',
+                           'province': 'SAN JOSE', 'canton': 'CENTRAL', 'district': 'CARMEN', 'voting_board': '00013',
+                           'gender': 'Hombre', 'id_expiration_date': '2031-06-01'}])
+
+    def test_export_in_chunks(self):
+        database = mock.Mock(iter_voters=mock.Mock(return_value=iter([(str(number),) for number in range(5)])))
+
+        chunks = list(export_voters(database, 'ndjson', chunk_size=2))
+
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [2, 2, 1])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url, {'formato': 'xml'}).status_code, 400)
+
+
+class RouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_request(self, view, cookies=None):
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies or {})
+        response = PrimaryPinMiddleware(view)(request)
+
+        return response
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_the_replicas(self):
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Person))
+
+        response = self.run_request(view)
+
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_other_apps_use_the_primary(self):
+        def view(request):
+            return HttpResponse(self.router.db_for_read(User))
+
+        self.assertEqual(self.run_request(view).content, b'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_SECONDS=7)
+    def test_a_write_pins_the_request_and_the_client(self):
+        def view(request):
+            before = self.router.db_for_read(Person)
+            pin_primary()
+            return HttpResponse(f'{before} {self.router.db_for_read(Person)}')
+
+        response = self.run_request(view)
+
+        self.assertEqual(response.content, b'replica default')
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], 7)
+        self.assertFalse(is_primary_pinned())
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_the_cookie_pins_the_next_requests(self):
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Person))
+
+        self.assertEqual(self.run_request(view, {PRIMARY_PIN_COOKIE: '1'}).content, b'default')
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Person), 'default')
+
+
+class RequestTimingTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_database_calls_are_counted(self):
+        def view(request):
+            list(User.objects.all())
+            # The MongoDB commands arrive through the command listener
+            record_db_call(0.25)
+            return HttpResponse()
+
+        response = RequestTimingMiddleware(view)(self.factory.get('/'))
+
+        db_timing, render_timing, total_timing = response['Server-Timing'].split(', ')
+        self.assertTrue(db_timing.startswith('db;desc="2 calls";dur='))
+        self.assertGreaterEqual(float(db_timing.split('dur=')[1]), 250)
+        self.assertEqual(render_timing, 'render;dur=0.0')
+        self.assertTrue(total_timing.startswith('total;dur='))
+
+    def test_calls_outside_a_request_are_ignored(self):
+        record_db_call(0.25)
+
+        response = RequestTimingMiddleware(lambda request: HttpResponse())(self.factory.get('/'))
+
+        self.assertTrue(response['Server-Timing'].startswith('db;desc="0 calls";dur=0.0'))
+
+    def test_slow_requests_are_logged(self):
+        with mock.patch('votes.timing.REQUEST_SLOW_THRESHOLD_MS', 0), \
+                self.assertLogs('votes.timing', 'WARNING') as logs:
+            RequestTimingMiddleware(lambda request: HttpResponse())(self.factory.get('/padron/'))
+
+        self.assertIn("Slow request GET /padron/", logs.output[0])
+
+    def test_every_timing_goes_to_the_profiler(self):
+        profiler = mock.Mock()
+
+        with mock.patch('votes.timing.REQUEST_PROFILER', 'metrics.profile_request'), \
+                mock.patch('votes.timing.import_string', return_value=profiler) as import_string:
+            middleware = RequestTimingMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.get('/'))
+
+        import_string.assert_called_once_with('metrics.profile_request')
+        request, profiled_response, timing = profiler.call_args.args
+        self.assertIs(profiled_response, response)
+        self.assertGreater(timing.total_time, 0)
+
+    def test_the_render_time_of_a_template_response(self):
+        response = self.client.get(reverse('login'))
+
+        render_time = float(response['Server-Timing'].split('render;dur=')[1].split(',')[0])
+        self.assertGreater(render_time, 0)
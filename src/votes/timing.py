@@ -0,0 +1,131 @@
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from logging import getLogger
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from padron_web.settings import REQUEST_SLOW_THRESHOLD_MS, REQUEST_PROFILER
+
+logger = getLogger(__name__)
+
+
+class RequestTiming:
+    """
+    Where the time of a request goes
+
+    ...
+
+    Attributes
+    ----------
+    db_calls : int
+        the amount of queries sent to Postgresql and commands sent to MongoDB
+    db_time : float
+        seconds spent waiting for the databases
+    render_time : float
+        seconds spent rendering the template
+    total_time : float
+        seconds spent in the whole request
+    """
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.render_start = None
+
+    def add_db_call(self, duration):
+        self.db_calls += 1
+        self.db_time += duration
+
+    def to_server_timing(self):
+        """
+        :return: the value of the Server-Timing header, durations in milliseconds
+        """
+        return (f'db;desc="{self.db_calls} calls";dur={self.db_time * 1000:.1f}, '
+                f'render;dur={self.render_time * 1000:.1f}, '
+                f'total;dur={self.total_time * 1000:.1f}')
+
+
+_request_timing = ContextVar('request_timing', default=None)
+
+
+def record_db_call(duration):
+    """
+    Adds a database call to the timing of the current request, if there is one
+
+    :param duration: seconds the call took
+    """
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.add_db_call(duration)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    An execute wrapper (see connection.execute_wrapper) that times every query of the ORM and the raw cursors
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_db_call(time.perf_counter() - start)
+
+
+class RequestTimingMiddleware:
+    """
+    Measures the database calls, the database time and the render time of every request.
+
+    The numbers are sent in a Server-Timing header, shown by the browser developer tools, and the requests slower than
+    REQUEST_SLOW_THRESHOLD_MS are logged. REQUEST_PROFILER can name a function(request, response, timing) that
+    receives the timing of every request, to send it to a metrics system.
+
+    The render time is only known for TemplateResponse, which the middleware renders itself. The body of a streaming
+    response is produced after the headers are sent, so it is not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.profiler = import_string(REQUEST_PROFILER) if REQUEST_PROFILER else None
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _request_timing.set(timing)
+        start = time.perf_counter()
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+
+                response = self.get_response(request)
+        finally:
+            _request_timing.reset(token)
+
+        timing.total_time = time.perf_counter() - start
+        response['Server-Timing'] = timing.to_server_timing()
+
+        if timing.total_time * 1000 >= REQUEST_SLOW_THRESHOLD_MS:
+            logger.warning("Slow request %s %s: %.1f ms, %s db calls in %.1f ms, render %.1f ms", request.method,
+                           request.path, timing.total_time * 1000, timing.db_calls, timing.db_time * 1000,
+                           timing.render_time * 1000)
+
+        if self.profiler is not None:
+            self.profiler(request, response, timing)
+
+        return response
+
+    def process_template_response(self, request, response):
+        timing = _request_timing.get()
+
+        if timing is not None:
+            timing.render_start = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.__end_render(timing))
+
+        return response
+
+    @staticmethod
+    def __end_render(timing):
+        timing.render_time += time.perf_counter() - timing.render_start
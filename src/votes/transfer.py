@@ -0,0 +1,91 @@
+import hashlib
+from logging import getLogger
+
+from votes.fields import normalise_name
+from votes.signals import padron_reloaded
+from votes.utils import load_in_batches
+
+logger = getLogger(__name__)
+
+CHECKSUM_MODULUS = 2 ** 64
+
+
+class PadronSummary:
+    """
+    The amount of voters and locations of a database and an order independent checksum of them, to compare two
+    databases without sorting them
+
+    ...
+
+    Attributes
+    ----------
+    voters : int
+        the amount of voters
+    locations : int
+        the amount of locations
+    checksum : int
+        the sum of a hash of every voter and location, modulo 2 ** 64
+    """
+
+    def __init__(self):
+        self.voters = 0
+        self.locations = 0
+        self.checksum = 0
+
+    def add(self, values):
+        digest = hashlib.md5('|'.join(str(value) for value in values).encode('utf-8')).digest()
+        self.checksum = (self.checksum + int.from_bytes(digest[:8], 'big')) % CHECKSUM_MODULUS
+
+    def __eq__(self, other):
+        return (self.voters, self.locations, self.checksum) == (other.voters, other.locations, other.checksum)
+
+    def __str__(self):
+        return f"{self.voters} voters, {self.locations} locations, checksum {self.checksum:016x}"
+
+
+def copy_padron(source, target, batch_size=5000, max_workers=8):
+    """
+    Copies the locations and the voters of a database into another one, usually empty. The voters are read with
+    DBFactory.iter_voters, a server side cursor, and written in batches by a Thread Pool with the same bulk loads
+    used by process_files, so the copy takes about as long as an import without parsing the TSE files.
+
+    :param source: the DBFactory read
+    :param target: the DBFactory written
+    :param batch_size: the amount of voters written at once
+    :param max_workers: the amount of writer threads
+    """
+    location_tuples = [(location.elec_code, location.province, location.canton, location.district)
+                       for location in source.get_locations()]
+    target.load_location_data(location_tuples)
+    logger.info("%s locations copied", len(location_tuples))
+
+    # iter_voters gives (identification, full_name, elec_code, province, canton, district, voting_board, gender,
+    # id_expiration_date), the bulk load takes the tuples of FileDecoder
+    person_tuples = ((row[0], row[6], row[1], row[7], row[8], row[2], normalise_name(row[1]))
+                     for row in source.iter_voters(batch_size=batch_size))
+    load_in_batches(person_tuples, batch_size, target.load_people_data, max_workers)
+
+    target.create_indexes()
+    target.refresh_board_occupancy()
+    # The processes serving the target drop their copies of its locations and voters
+    padron_reloaded.send(sender=target.__class__)
+
+
+def summarise_padron(database):
+    """
+    Counts the voters and locations of a database and computes their checksum, in a single pass
+
+    :param database: a DBFactory
+    :return: a PadronSummary
+    """
+    summary = PadronSummary()
+
+    for location in database.get_locations():
+        summary.locations += 1
+        summary.add((location.elec_code, location.province, location.canton, location.district))
+
+    for row in database.iter_voters():
+        summary.voters += 1
+        summary.add(row)
+
+    return summary
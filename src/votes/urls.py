@@ -1,11 +1,15 @@
 from django.urls import path
 
 from . import views
-from .views import LoginView, NewVoterView, DeleteVoterView
+from .views import LoginView, NewVoterView, DeleteVoterView, BulkVotersView
 
 urlpatterns = [
     path('votantes/', views.voters, name='voters'),
+    path('votantes/autocompletar/', views.voters_autocomplete, name='voters_autocomplete'),
+    path('votantes/exportar/', views.voters_export, name='voters_export'),
+    path('votantes/consulta/', views.voters_lookup, name='voters_lookup'),
     path('votantes/<str:pk>/', views.voter_info, name='voter_info'),
+    path('metricas/busquedas/', views.search_cache_statistics, name='search_cache_statistics'),
     path('login/', LoginView.as_view(
          template_name='votes/login.html',
          redirect_authenticated_user=True),
@@ -14,5 +18,11 @@ urlpatterns = [
     path('gestion-votantes/agregar/', NewVoterView.as_view(
          template_name='votes/new_voter.html'),
          name='new_voter'),
-    path('gestion-votantes/eliminar/<str:pk>', DeleteVoterView.as_view(), name='delete_voter')
+    path('gestion-votantes/eliminar/<str:pk>', DeleteVoterView.as_view(), name='delete_voter'),
+    path('gestion-votantes/carga-masiva/', BulkVotersView.as_view(), name='bulk_voters'),
+    path('ubicaciones/provincias/', views.provinces, name='provinces'),
+    path('ubicaciones/cantones/', views.cantons, name='cantons'),
+    path('ubicaciones/distritos/', views.districts, name='districts'),
+    path('ubicaciones/<str:elec_code>/juntas/', views.board_occupancy, name='board_occupancy'),
+    path('ubicaciones/<str:elec_code>/juntas/<str:voting_board>/', views.board_roster, name='board_roster'),
 ]
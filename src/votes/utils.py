@@ -1,20 +1,34 @@
 import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from collections import Counter, deque
+from itertools import islice
 
 from django.http import HttpResponseRedirect
 
-from padron_web.settings import ACTUAL_DATABASE
+from padron_web.settings import ACTUAL_DATABASE, SQLITE_DATABASE_PATH, SEARCH_TIMEOUT_MS, STAMP_CHECK_SECONDS, \
+    SEARCH_MAX_ESTIMATED_MATCHES
 from abc import ABC, abstractmethod
 from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
-from votes.models import Person, Location
-from pymongo import MongoClient
-from padron_web.settings import CONNECTION_STRING
-from django.db import connection
+from votes.models import Person, Location, BoardOccupancy
+from votes.locations import LOCATION_HIERARCHY
+from votes.signals import voter_added, voter_deleted, voters_added, voters_deleted, padron_reloaded
+from votes.fields import get_gender, gender_to_code, code_to_gender, code_to_string, date_to_datetime, normalise_name
+from padron_web.settings import CONNECTION_STRING, MONGO_READ_CONNECTION_STRING, MONGO_READ_PREFERENCE
+from votes.routers import pin_primary, is_primary_pinned
+from votes.timing import record_db_call
+from django.db import connection, connections, router, transaction
 from django.db import IntegrityError, ProgrammingError, DatabaseError, InterfaceError, DataError, OperationalError, \
     NotSupportedError
-from django.db.models import Count, Q
 
 logger = getLogger(__name__)
 
@@ -28,10 +42,28 @@ def add_voter(sender, instance, **kwargs):
     :param instance: the person to be saved
     :param kwargs: other params
     """
-    instance.voting_board = '00000'
-    instance.full_name = instance.full_name.upper()
-    if len(instance.identification) > 3:
-        instance.gender = "Hombre" if int(instance.identification[3]) % 2 == 0 else "Mujer"
+    for field, value in get_new_voter_values(instance.identification, instance.full_name).items():
+        setattr(instance, field, value)
+
+
+def get_new_voter_values(identification, full_name):
+    """
+    The values enforced for every new voter: voting board '00000', uppercase name and the gender taken from the
+    identification. Used by the pre_save signal and by the bulk inserts, which skip the signals.
+
+    :param identification: a string with the voter id
+    :param full_name: the voter's name as it was typed
+    :return: a dictionary with the values of the voter fields
+    """
+    values = {
+        'voting_board': '00000',
+        'full_name': full_name.upper(),
+        'search_key': normalise_name(full_name),
+    }
+    if len(identification) > 3:
+        values['gender'] = get_gender(identification)
+
+    return values
 
 
 def set_expiration_date(string_date):
@@ -47,91 +79,207 @@ def set_expiration_date(string_date):
     return date
 
 
-def set_database():
-    if ACTUAL_DATABASE == "Mongodb":
+DATABASE_NAMES = ("Mongodb", "Postgresql", "Sqlite")
+
+
+def set_database(database_name=ACTUAL_DATABASE):
+    """
+    Creates a database backend
+
+    :param database_name: one of DATABASE_NAMES, ACTUAL_DATABASE by default
+    :return: a new DBFactory
+    """
+    if database_name == "Mongodb":
         return MongoDB()
-    elif ACTUAL_DATABASE == "Postgresql":
+    elif database_name == "Postgresql":
         return PostgresqlDB()
+    elif database_name == "Sqlite":
+        return SqliteDB()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def load_in_batches(items, batch_size, load, max_workers):
+    """
+    Splits the items in batches and loads them in a Thread Pool. Only a few batches per worker are read ahead, so a
+    big file or cursor is never held in memory.
+
+    :param items: An iterable, like the lines of a file or a database cursor
+    :param batch_size: The amount of items in a single batch
+    :param load: The function that loads a batch, a list of items
+    :param max_workers: The amount of threads
+    :return: The amount of items loaded
+    """
+    items = iter(items)
+    pending = deque()
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+
+            count += len(batch)
+            pending.append(executor.submit(load, batch))
+            while len(pending) > max_workers * 2:
+                pending.popleft().result()
+
+        for future in pending:
+            future.result()
+
+    return count
+
+
+def get_database():
+    """
+    The database of the current process, created on the first call. The views and commands share it instead of
+    creating a backend when they are imported, so a pre-fork server (gunicorn, uwsgi) never forks a MongoClient: every
+    worker creates its own after the fork.
+
+    :return: a DBFactory for ACTUAL_DATABASE
+    """
+    global _database
+
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = set_database()
+
+    return _database
+
+
+def _forget_database():
+    """
+    Drops the database inherited from the parent process, the child creates a new one when it needs it
+    """
+    global _database, _database_lock
+
+    _database = None
+    _database_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_database)
 
 
 class FileDecoder:
     """
     A class to decode two given txt files and upload the data to a database.
 
+    The files are read a section at a time and every section is uploaded by a thread pool while the next ones are
+    read, so the whole padron is never held in memory. They can be read from the zip archive distributed by the TSE
+    as well, without extracting it.
+
     ...
 
     Attributes
     ----------
-    __distelec_file_sections : list
-        Stores the data of Distelec.txt by sections
-    __padron_file_sections : list
-        Stores the data of PADRON_COMPLETO.txt by sections
     __SPLIT_LOCATIONS : int
-        The amount of lines stored in a single section of _distelec_file_sections
+        The amount of lines of Distelec.txt uploaded at once
     __SPLIT_PEOPLE : int
-        The amount of lines stored in a single section of _padron_file_sections
+        The amount of lines of PADRON_COMPLETO.txt uploaded at once
     """
+    LOCATIONS_FILE = 'Distelec.txt'
+    PEOPLE_FILE = 'PADRON_COMPLETO.txt'
+    ENCODING = 'iso-8859-1'
 
     def __init__(self):
-        self.__distelec_file_sections = []
-        self.__padron_file_sections = []
         self.__SPLIT_LOCATIONS = 1072
         self.__SPLIT_PEOPLE = 8324
-        self.__DATABASE = set_database()
+        self.__DATABASE = get_database()
 
-    def process_files(self, locations_path, people_path):
+    def process_files(self, locations_path, people_path, reload=False):
         """
         A files processor manager. Creates the Thread Pools to accelerate the upload process.
 
         :param locations_path: A string with the Distelec.txt directory
         :param people_path: A string with the PADRON_COMPLETO.txt directory
+        :param reload: True to load into shadow tables or collections and swap them with the live padron at the end
         """
-        self.__split_locations_file(locations_path)
-        self.__split_people_file(people_path)
+        with open(locations_path, 'r', encoding=self.ENCODING) as locations_file, \
+                open(people_path, 'r', encoding=self.ENCODING) as people_file:
+            self.__process_lines(locations_file, people_file, reload)
 
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            for section in self.__distelec_file_sections:
-                executor.submit(self.__set_location_tuples, section)
+    def process_archive(self, archive_path, reload=False):
+        """
+        Uploads Distelec.txt and PADRON_COMPLETO.txt straight from the TSE zip archive. The files are decompressed
+        and decoded while they are read, nothing is extracted to the disk.
+
+        :param archive_path: A string with the .zip file directory
+        :param reload: True to load into shadow tables or collections and swap them with the live padron at the end
+        """
+        with zipfile.ZipFile(archive_path) as archive:
+            locations_name = self.__find_member(archive, self.LOCATIONS_FILE)
+            people_name = self.__find_member(archive, self.PEOPLE_FILE)
 
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            for section in self.__padron_file_sections:
-                executor.submit(self.__set_person_tuples, section)
+            with io.TextIOWrapper(archive.open(locations_name), encoding=self.ENCODING) as locations_file, \
+                    io.TextIOWrapper(archive.open(people_name), encoding=self.ENCODING) as people_file:
+                self.__process_lines(locations_file, people_file, reload)
 
-    def __split_locations_file(self, file_path):
+    @staticmethod
+    def __find_member(archive, file_name):
         """
-        Reads an entire txt file and split it in sections with certain amount of lines.
+        Looks for a file in the archive, in any folder and without minding the case.
 
-        :param file_path: A string with the .txt file directory
+        :param archive: A ZipFile
+        :param file_name: The name of the file
+        :return: The name of the member in the archive
         """
-        with open(file_path, 'r', encoding='iso-8859-1') as file:
-            string_file = file.read().splitlines()
-            splits = len(string_file) // self.__SPLIT_LOCATIONS
+        for name in archive.namelist():
+            if os.path.basename(name).lower() == file_name.lower():
+                return name
 
-            counter = 0
+        raise FileNotFoundError(f"{file_name} is not in {archive.filename}")
 
-            for i in range(0, splits):
-                self.__distelec_file_sections.append(string_file[counter:counter + self.__SPLIT_LOCATIONS])
-                counter += self.__SPLIT_LOCATIONS
+    def __process_lines(self, locations_lines, people_lines, reload=False):
+        """
+        Uploads the locations and then the people, the voters reference their locations.
 
-            self.__distelec_file_sections.append(string_file[counter:])
+        On a reload the live padron keeps serving while the files are loaded into shadow tables or collections, which
+        replace it once they are complete and indexed. The voters can not be added or deleted meanwhile, the changes
+        would be lost with the replaced padron. A reload that fails is aborted.
 
-    def __split_people_file(self, file_path):
+        :param locations_lines: An iterable with the lines of Distelec.txt
+        :param people_lines: An iterable with the lines of PADRON_COMPLETO.txt
+        :param reload: True to load into shadow tables or collections
         """
-        Reads an entire txt file and split it in sections with certain amount of lines.
+        if reload:
+            self.__DATABASE.begin_reload()
 
-        :param file_path: A string with the .txt file directory
-        """
-        with open(file_path, 'r', encoding='iso-8859-1') as file:
-            string_file = file.read().splitlines()
-            splits = len(string_file) // self.__SPLIT_PEOPLE
+        try:
+            load_in_batches(self.__read_lines(locations_lines), self.__SPLIT_LOCATIONS, self.__set_location_tuples,
+                            max_workers=2)
+            voters = load_in_batches(self.__read_lines(people_lines), self.__SPLIT_PEOPLE, self.__set_person_tuples,
+                                     max_workers=8)
 
-            counter = 0
+            self.__DATABASE.create_indexes()
 
-            for i in range(0, splits):
-                self.__padron_file_sections.append(string_file[counter:counter + self.__SPLIT_PEOPLE])
-                counter += self.__SPLIT_PEOPLE
+            if reload:
+                self.__DATABASE.finish_reload(expected_voters=voters)
+        except BaseException:
+            # The live padron accepts writes again
+            if reload:
+                self.__DATABASE.abort_reload()
+            raise
 
-            self.__padron_file_sections.append(string_file[counter:])
+        if not reload:
+            # The other processes drop their copies of the locations and voters, as after a reload
+            padron_reloaded.send(sender=self.__DATABASE.__class__)
+
+        self.__DATABASE.refresh_board_occupancy()
+
+    @staticmethod
+    def __read_lines(lines):
+        """
+        :param lines: An iterable with the lines of a txt file
+        :return: A generator of the lines without line breaks, the blank lines are skipped
+        """
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line:
+                yield line
 
     def __set_person_tuples(self, people_list):
         """
@@ -147,10 +295,12 @@ class FileDecoder:
             elec_code = person_values[1]
             voting_board = person_values[4]
             full_name = f"{person_values[5].strip()} {person_values[6].strip()} {person_values[7].strip()}"
-            gender = "Hombre" if int(person_values[0][3]) % 2 == 0 else "Mujer"
+            gender = get_gender(identification)
             id_expiration_date = set_expiration_date(person_values[3])
+            search_key = normalise_name(full_name)
 
-            person_tuples.append((identification, voting_board, full_name, gender, id_expiration_date, elec_code))
+            person_tuples.append((identification, voting_board, full_name, gender, id_expiration_date, elec_code,
+                                  search_key))
 
             count += 1
 
@@ -179,6 +329,45 @@ class FileDecoder:
         self.__DATABASE.load_location_data(tuples=location_tuples)
 
 
+class VoterRow:
+    """
+    A search result: only the fields shown in the voters list, without the cost of a model instance
+
+    ...
+
+    Attributes
+    ----------
+    identification : str
+        legal identification in Costa Rica
+    full_name : str
+        person's full name
+    """
+    __slots__ = ('identification', 'full_name')
+
+    def __init__(self, identification, full_name):
+        self.identification = identification
+        self.full_name = full_name
+
+    def __eq__(self, other):
+        return isinstance(other, VoterRow) and (self.identification, self.full_name) == (other.identification,
+                                                                                       other.full_name)
+
+    def __repr__(self):
+        return f"VoterRow({self.identification!r}, {self.full_name!r})"
+
+
+class SearchTimeoutError(Exception):
+    """
+    Raised by DBFactory.search_voters when the database takes longer than SEARCH_TIMEOUT_MS
+    """
+
+
+class ReloadError(Exception):
+    """
+    Raised when a reload of the padron can not be completed or rolled back, the live padron is left unchanged
+    """
+
+
 class DBFactory(ABC):
     """
     Abstract factory class for database processes
@@ -200,13 +389,100 @@ class DBFactory(ABC):
         """
         pass
 
+    def create_indexes(self):
+        """
+        Builds the indexes the database needs after loading the files. The Postgresql indexes are created by the
+        Django migrations
+        """
+        pass
+
     @abstractmethod
-    def search_voters(self, identification, name):
+    def refresh_board_occupancy(self):
+        """
+        Counts again the voters of every voting board, after loading the files. The counts are kept up to date by the
+        voters added and deleted afterwards
         """
-        Search in database for voters who match with the specified identification or name
+        pass
+
+    def begin_reload(self):
+        """
+        Sends the next loads (load_people_data, load_location_data and create_indexes) to empty shadow tables or
+        collections, the live padron keeps serving meanwhile. Raises ReloadError on the backends without reloads
+        """
+        raise ReloadError(f"{self.__class__.__name__} can not reload the padron without downtime")
+
+    def finish_reload(self, expected_voters):
+        """
+        Swaps the loaded shadow tables or collections with the live ones, which are kept as the previous version
+
+        :param expected_voters: the amount of voters read from the files, the swap is refused with ReloadError if
+                                fewer were loaded
+        """
+        raise ReloadError(f"{self.__class__.__name__} can not reload the padron without downtime")
+
+    def rollback_reload(self):
+        """
+        Swaps the previous version of the padron back in, the current one becomes the previous version
+        """
+        raise ReloadError(f"{self.__class__.__name__} can not reload the padron without downtime")
+
+    def abort_reload(self):
+        """
+        Drops the shadow tables or collections of a reload that did not finish, the voters can be added and deleted
+        again. Nothing is done if no reload is running
+        """
+        raise ReloadError(f"{self.__class__.__name__} can not reload the padron without downtime")
+
+    @abstractmethod
+    def search_voters(self, identification, name, limit=None):
+        """
+        Search in database for voters who match with the specified identification or name. The search is stopped by
+        the database after SEARCH_TIMEOUT_MS and SearchTimeoutError is raised.
+
+        :param identification: a string with an alike voter id
+        :param name: a string with an alike voter name, it is compared accent and case insensitive
+        :param limit: the maximum amount of voters returned, None for all of them
+        :return: a list of VoterRow of the voters who match the specifications
+        """
+        pass
+
+    def estimate_voters(self, identification, name):
+        """
+        Estimates how many voters a search would find, cheaply: from the query plan, or counting at most
+        SEARCH_MAX_ESTIMATED_MATCHES + 1 of them, the amount that makes the search too large
+
         :param identification: a string with an alike voter id
         :param name: a string with an alike voter name
-        :return: a list of voters who match the specifications
+        :return: the estimated amount of voters, or None if the database has no cheap estimate
+        """
+        return None
+
+    @abstractmethod
+    def get_locations(self):
+        """
+        Reads all the vote locations
+        :return: a list of Location objects
+        """
+        pass
+
+    @abstractmethod
+    def get_voter_names(self):
+        """
+        Iterates over all the voters without loading them at once
+        :return: an iterable of (identification, full_name) tuples
+        """
+        pass
+
+    @abstractmethod
+    def iter_voters(self, province=None, canton=None, district=None, batch_size=5000):
+        """
+        Iterates over the voters of a region with a server side cursor, so any amount of voters uses constant memory
+        :param province: a province name, or None for the whole padron
+        :param canton: a canton name, or None for the whole province
+        :param district: a district name, or None for the whole canton
+        :param batch_size: the amount of voters fetched from the database at once
+        :return: an iterable of (identification, full_name, elec_code, province, canton, district, voting_board,
+                 gender, id_expiration_date) tuples
         """
         pass
 
@@ -221,6 +497,25 @@ class DBFactory(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_board_roster(self, elec_code, voting_board):
+        """
+        Lists the voters of a voting board, sorted by name
+        :param elec_code: the six digits electoral code of the vote location
+        :param voting_board: the five digits voting board
+        :return: a list of VoterRow
+        """
+        pass
+
+    @abstractmethod
+    def get_board_occupancy(self, elec_code):
+        """
+        Reads the precomputed amount of voters of every voting board of a vote location
+        :param elec_code: the six digits electoral code of the vote location
+        :return: a list of (voting_board, voters) tuples sorted by voting board, the empty boards are left out
+        """
+        pass
+
     @abstractmethod
     def get_voter(self, identification):
         """
@@ -230,11 +525,29 @@ class DBFactory(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_voters(self, identifications):
+        """
+        Search for the info of several voters at once, with a single query
+
+        :param identifications: a list of voter ids
+        :return: a dictionary with the Person objects of the found voters by identification
+        """
+        pass
+
+    @abstractmethod
+    def has_voters(self):
+        """
+        Looks for any voter, reading at most one
+        :return: True if the padron has at least one voter
+        """
+        pass
+
     @abstractmethod
     def add_voter(self, person):
         """
         Inserts a row/document on the database with a new person's info
-        :param person: a dictionary with the fields of the form
+        :param person: a dictionary with the fields of the form, 'elec_code' is a Location object
         :return: the person identification
         """
         pass
@@ -247,49 +560,197 @@ class DBFactory(ABC):
         """
         pass
 
+    @abstractmethod
+    def add_voters(self, people):
+        """
+        Inserts a batch of new voters with a single set based insert. The voters who already exist are skipped
+        :param people: a list of dictionaries with 'identification', 'elec_code' (a Location object), 'full_name' and
+        'id_expiration_date'
+        :return: a list with the identifications of the inserted voters
+        """
+        pass
+
+    @abstractmethod
+    def delete_voters(self, identifications):
+        """
+        Deletes a batch of voters with a single set based delete
+        :param identifications: a list of identifications
+        :return: the amount of deleted voters
+        """
+        pass
+
 
 class MongoDB(DBFactory, ABC):
+    """
+    Database processes on MongoDB with PyMongo.
+
+    The person documents use short keys and typed values, so the collection and its indexes take less memory:
+
+        _id: identification, e: electoral code (int), b: voting board (int), n: full name, g: gender code (int),
+        x: expiration date (datetime), t: the words of the normalised name (see normalise_name)
+
+    The names are searched on t, a multikey index: every word of the search must be the beginning of a word of the
+    name, as anchored regular expressions that the index answers without reading the collection.
+
+    The location is referenced by its electoral code and resolved with the in-memory location hierarchy.
+    to_document and to_person are the mapping between these documents and the Person objects.
+
+    The reads use a second client with MONGO_READ_PREFERENCE, unless the request is pinned to the primary after a
+    write.
+
+    The padron collections are versioned: the document "padron" of votes_metadata holds the live version, the
+    previous one and the one being reloaded. Version N is read from votes_person_N and votes_location_N, version 0
+    from votes_person and votes_location as created before the versions. A reload writes into the collections of a
+    new version and replaces the live padron with a single update of the metadata, so there is always a complete
+    padron to read; the replaced version is kept for a rollback. Every process reads the live version again at most
+    every STAMP_CHECK_SECONDS, the writes read it every time and are refused while a reload is running.
+
+    The amount of voters of every voting board is kept in votes_board_occupancy, {e, b, n: voters}, rebuilt by an
+    aggregation after every load and updated with $inc by the voters added and deleted.
+    """
+    PADRON_COLLECTIONS = ("votes_location", "votes_person")
+    METADATA_ID = "padron"
+
     def __init__(self):
-        self.client = MongoClient(CONNECTION_STRING)
+        # Imported here, so pymongo is only loaded when MongoDB is the selected database
+        from pymongo import MongoClient
+        from votes.mongo_timing import MongoTimingListener
+
+        self.client = MongoClient(CONNECTION_STRING, event_listeners=[MongoTimingListener()])
         self.db = self.client.padron_electoral
-        self.person_collection = self.db.votes_person
-        self.location_collection = self.db.votes_location
-        self.locations_list = []
+        self.metadata_collection = self.db.votes_metadata
+        self.occupancy_collection = self.db.votes_board_occupancy
+        # The version written by the loads during a reload, None otherwise
+        self.loading_version = None
+        # (live version, monotonic time it was read)
+        self.__version = (None, 0.0)
+        self.read_client = MongoClient(MONGO_READ_CONNECTION_STRING, readPreference=MONGO_READ_PREFERENCE,
+                                       event_listeners=[MongoTimingListener()])
+        self.read_db = self.read_client.padron_electoral
+
+    @staticmethod
+    def get_collection_name(name, version):
+        """
+        :param name: one of PADRON_COLLECTIONS
+        :param version: a version of the padron
+        :return: the name of the collection of the version
+        """
+        return name if version == 0 else f"{name}_{version}"
+
+    def get_metadata(self):
+        """
+        :return: the metadata of the padron versions, {version, previous, reloading}, from the primary
+        """
+        metadata = {"version": 0, "previous": None, "reloading": None}
+        metadata.update(self.metadata_collection.find_one({"_id": self.METADATA_ID}) or {})
+
+        return metadata
 
-    def get_location_info(self, elec_code_id):
+    def get_version(self, fresh=False):
+        """
+        :param fresh: True to read the live version now, without waiting for STAMP_CHECK_SECONDS
+        :return: the live version of the padron
+        """
+        version, checked = self.__version
 
-        for location in self.locations_list:
-            if elec_code_id == location.elec_code:
+        if fresh or version is None or time.monotonic() - checked >= STAMP_CHECK_SECONDS:
+            version = self.get_metadata()["version"]
+            self.__version = (version, time.monotonic())
 
-                return location
+        return version
 
-        return None
+    @property
+    def person_collection(self):
+        return self.db[self.get_collection_name("votes_person", self.get_version())]
+
+    @property
+    def location_collection(self):
+        return self.db[self.get_collection_name("votes_location", self.get_version())]
+
+    @property
+    def load_person_collection(self):
+        if self.loading_version is None:
+            return self.person_collection
+
+        return self.db[self.get_collection_name("votes_person", self.loading_version)]
+
+    @property
+    def load_location_collection(self):
+        if self.loading_version is None:
+            return self.location_collection
+
+        return self.db[self.get_collection_name("votes_location", self.loading_version)]
+
+    @property
+    def read_person_collection(self):
+        collection = self.person_collection
+        return collection if is_primary_pinned() else self.read_db[collection.name]
+
+    @property
+    def read_location_collection(self):
+        collection = self.location_collection
+        return collection if is_primary_pinned() else self.read_db[collection.name]
+
+    @property
+    def read_occupancy_collection(self):
+        return self.occupancy_collection if is_primary_pinned() else self.read_db.votes_board_occupancy
+
+    @staticmethod
+    def to_document(identification, elec_code, voting_board, full_name, gender, id_expiration_date, search_key):
+        """
+        Builds a compact person document
+
+        :return: a dictionary with the short keys
+        """
+        return {
+            "_id": str(identification),
+            "e": int(elec_code),
+            "b": int(voting_board),
+            "n": full_name,
+            "g": gender_to_code(gender),
+            "x": date_to_datetime(id_expiration_date),
+            "t": list(dict.fromkeys(search_key.split()))
+        }
+
+    def to_person(self, document):
+        """
+        Builds a Person object from a compact person document, the missing keys are left empty
+
+        :param document: a person document, complete or projected
+        :return: an unsaved Person object
+        """
+        person = Person(identification=document["_id"], full_name=document.get("n", ''))
+
+        if "e" in document:
+            person.elec_code = self.get_location(document["e"])
+        if "b" in document:
+            person.voting_board = code_to_string(document["b"], 5)
+        if "g" in document:
+            person.gender = code_to_gender(document["g"])
+        if "x" in document:
+            person.id_expiration_date = document["x"].date()
+
+        return person
+
+    def get_location(self, elec_code):
+        """
+        :param elec_code: an electoral code as stored in the person documents
+        :return: the Location object of the code
+        """
+        return LOCATION_HIERARCHY.get_location(self, code_to_string(elec_code, 6))
 
     def load_people_data(self, tuples):
 
         list_of_documents = []
 
         for tuple in tuples:
-            elec_code = self.get_location_info(tuple[5])
-            if elec_code is not None:
-                date = f'{tuple[4].strftime("%Y")}-{tuple[4].strftime("%m")}-{tuple[4].strftime("%d")}'
-                person_document = {
-                    "_id": tuple[0],
-                    "voting_board": tuple[1],
-                    "full_name": tuple[2],
-                    "gender": tuple[3],
-                    "id_expiration_date": date,
-                    "elec_code_id": {
-                        "elec_code": elec_code.elec_code,
-                        "province": elec_code.province,
-                        "canton": elec_code.canton,
-                        "district": elec_code.district
-                    }
-                }
-                list_of_documents.append(person_document)
+            person_document = self.to_document(identification=tuple[0], elec_code=tuple[5], voting_board=tuple[1],
+                                               full_name=tuple[2], gender=tuple[3], id_expiration_date=tuple[4],
+                                               search_key=tuple[6])
+            list_of_documents.append(person_document)
 
         try:
-            self.person_collection.insert_many(list_of_documents)
+            self.load_person_collection.insert_many(list_of_documents)
         except Exception as error:  # Cambiar exception
             print(error)
             logger.error("Error importing voters data", exc_info=error)
@@ -300,148 +761,401 @@ class MongoDB(DBFactory, ABC):
 
         for tuple in tuples:
             location_document = {
-                "_id": tuple[0],
+                "_id": int(tuple[0]),
                 "province": tuple[1],
                 "canton": tuple[2],
                 "district": tuple[3]
             }
-            location = Location(elec_code=tuple[0], province=tuple[1], canton=tuple[2], district=tuple[3])
-            self.locations_list.append(location)
             list_of_documents.append(location_document)
 
         try:
-            self.location_collection.insert_many(list_of_documents)
+            self.load_location_collection.insert_many(list_of_documents)
         except Exception as error:
             print(error)
             logger.error("Error importing locations data", exc_info=error)
 
-    def search_voters(self, identification, name):
-        cursor = []
-        voters_info_list = []
+    def create_indexes(self):
+        # The whole search key, k, was indexed before the names were searched by their words and is not stored anymore
+        if "k_1" in self.load_person_collection.index_information():
+            self.load_person_collection.drop_index("k_1")
+
+        self.load_person_collection.create_index("t")
+        # The documents loaded before the name words existed get them from their search key. The missing words are
+        # indexed as null, so the update finds them through the index
+        self.load_person_collection.update_many({"t": {"$exists": False}},
+                                                [{"$set": {"t": {"$split": ["$k", " "]}}}, {"$unset": "k"}])
+        # The search keys of the documents that already had their words, only found in the collections loaded before
+        self.load_person_collection.update_many({"k": {"$exists": True}}, {"$unset": {"k": ""}})
+        self.load_person_collection.create_index([("e", 1), ("g", 1)])
+        self.load_person_collection.create_index("x")
+        # Answers the board rosters already sorted by name
+        self.load_person_collection.create_index([("e", 1), ("b", 1), ("n", 1)])
+
+    def refresh_board_occupancy(self):
+        pin_primary()
+        # $out replaces votes_board_occupancy at once when the aggregation is complete, keeping its indexes
+        self.person_collection.aggregate([{"$group": {"_id": {"e": "$e", "b": "$b"}, "n": {"$sum": 1}}},
+                                          {"$project": {"_id": 0, "e": "$_id.e", "b": "$_id.b", "n": 1}},
+                                          {"$out": self.occupancy_collection.name}], allowDiskUse=True)
+        self.occupancy_collection.create_index([("e", 1), ("b", 1)], unique=True)
+
+    def __count_board_voters(self, documents, sign):
+        """
+        Updates the amount of voters of the voting boards of some added or deleted voters
+
+        :param documents: the person documents, with the "e" and "b" keys
+        :param sign: 1 for added voters, -1 for deleted voters
+        """
+        from pymongo import UpdateOne
+
+        boards = Counter((document["e"], document["b"]) for document in documents)
+        if boards:
+            self.occupancy_collection.bulk_write([UpdateOne({"e": elec_code, "b": voting_board},
+                                                            {"$inc": {"n": sign * amount}}, upsert=True)
+                                                  for (elec_code, voting_board), amount in boards.items()],
+                                                 ordered=False)
+
+    def begin_reload(self):
+        from pymongo.errors import DuplicateKeyError
 
+        pin_primary()
+        metadata = self.get_metadata()
+        version = max(metadata["version"], metadata["previous"] or 0) + 1
+
+        try:
+            # Conditional, so two reloads can not run at once, and the writes are refused from now on
+            self.metadata_collection.update_one({"_id": self.METADATA_ID, "reloading": None},
+                                                {"$set": {"reloading": version},
+                                                 "$setOnInsert": {"version": 0, "previous": None}}, upsert=True)
+        except DuplicateKeyError as error:
+            raise ReloadError("Another reload of the padron is running, if it stopped abort it with process_files "
+                              "--abort") from error
+
+        for name in self.PADRON_COLLECTIONS:
+            self.db.drop_collection(self.get_collection_name(name, version))
+
+        self.loading_version = version
+
+    def finish_reload(self, expected_voters):
+        pin_primary()
+        loaded_voters = self.load_person_collection.count_documents({})
+        if loaded_voters < expected_voters:
+            raise ReloadError(f"Only {loaded_voters} of {expected_voters} voters were loaded, the padron was not "
+                              f"replaced")
+
+        metadata = self.get_metadata()
+        # The single write that replaces the padron, every process reads the new version from now on
+        result = self.metadata_collection.update_one(
+            {"_id": self.METADATA_ID, "reloading": self.loading_version},
+            {"$set": {"version": self.loading_version, "previous": metadata["version"], "reloading": None}})
+        if result.modified_count == 0:
+            raise ReloadError("The reload was aborted by another process, the padron was not replaced")
+
+        # The version replaced by the previous reload is no longer needed
+        if metadata["previous"] is not None:
+            for name in self.PADRON_COLLECTIONS:
+                self.db.drop_collection(self.get_collection_name(name, metadata["previous"]))
+
+        self.__version = (self.loading_version, time.monotonic())
+        self.loading_version = None
+        padron_reloaded.send(sender=self.__class__)
+
+    def rollback_reload(self):
+        pin_primary()
+        metadata = self.get_metadata()
+        if metadata["reloading"] is not None:
+            raise ReloadError("A reload of the padron is running, it must finish or be aborted first")
+
+        existing = set(self.db.list_collection_names())
+        previous = metadata["previous"]
+        if previous is None or not all(self.get_collection_name(name, previous) in existing
+                                       for name in self.PADRON_COLLECTIONS):
+            raise ReloadError("There is no previous version of the padron")
+
+        result = self.metadata_collection.update_one(
+            {"_id": self.METADATA_ID, "version": metadata["version"], "reloading": None},
+            {"$set": {"version": previous, "previous": metadata["version"]}})
+        if result.modified_count == 0:
+            raise ReloadError("The padron was replaced during the rollback, it was not rolled back")
+
+        self.__version = (previous, time.monotonic())
+        padron_reloaded.send(sender=self.__class__)
+
+    def abort_reload(self):
+        pin_primary()
+        version = self.loading_version
+        if version is None:
+            version = self.get_metadata()["reloading"]
+
+        if version is not None:
+            self.metadata_collection.update_one({"_id": self.METADATA_ID, "reloading": version},
+                                                {"$set": {"reloading": None}})
+            for name in self.PADRON_COLLECTIONS:
+                self.db.drop_collection(self.get_collection_name(name, version))
+
+        self.loading_version = None
+
+    def __check_writable(self):
+        """
+        Reads the live version of the padron before a write, refused while a reload is running: the new padron
+        would not have the change
+        """
+        metadata = self.get_metadata()
+        if metadata["reloading"] is not None:
+            raise ReloadError("The padron is being reloaded, the voters can not be changed until it finishes")
+
+        self.__version = (metadata["version"], time.monotonic())
+
+    @staticmethod
+    def get_search_filter(identification, name):
+        """
+        :param identification: the value of 'identification' input
+        :param name: the value of 'name' input
+        :return: the filter of the voters who match the searching specifications, None if both are empty
+        """
         if identification != '':
-            documents_to_find = {"_id": {"$regex": identification}}
-            cursor = self.person_collection.find(documents_to_find)
-        elif name != '':
-            documents_to_find = {"full_name": {"$regex": name}}
-            cursor = self.person_collection.find(documents_to_find)
+            return {"_id": {"$regex": re.escape(identification)}}
+        elif normalise_name(name) != '':
+            # Anchored, so the index bounds of every word are a range of the t index
+            return {"$and": [{"t": {"$regex": "^" + re.escape(word)}} for word in normalise_name(name).split()]}
 
-        for doc in cursor:
-            person = Person(identification=doc["_id"], full_name=doc["full_name"])
+        return None
+
+    def search_voters(self, identification, name, limit=None):
+        from pymongo.errors import ExecutionTimeout
 
-            voters_info_list.append(person)
+        voters_info_list = []
+
+        documents_to_find = self.get_search_filter(identification, name)
+        if documents_to_find is None:
+            return voters_info_list
+
+        cursor = self.read_person_collection.find(documents_to_find, {"n": 1}).max_time_ms(SEARCH_TIMEOUT_MS)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+
+        try:
+            for doc in cursor:
+                voters_info_list.append(VoterRow(doc["_id"], doc["n"]))
+        except ExecutionTimeout as error:
+            raise SearchTimeoutError(f"Search of '{identification or name}' timed out") from error
 
         return voters_info_list
 
+    def estimate_voters(self, identification, name):
+        from pymongo.errors import ExecutionTimeout
+
+        documents_to_find = self.get_search_filter(identification, name)
+        if documents_to_find is None:
+            return 0
+
+        try:
+            return self.read_person_collection.count_documents(documents_to_find,
+                                                               limit=SEARCH_MAX_ESTIMATED_MATCHES + 1,
+                                                               maxTimeMS=SEARCH_TIMEOUT_MS)
+        except ExecutionTimeout:
+            # The search itself is stopped by the same timeout
+            return None
+
+    def get_locations(self):
+        return [Location(elec_code=code_to_string(document["_id"], 6), province=document["province"],
+                         canton=document["canton"], district=document["district"])
+                for document in self.read_location_collection.find()]
+
+    def get_voter_names(self):
+        cursor = self.read_person_collection.find({}, {"n": 1}, batch_size=10000)
+
+        for doc in cursor:
+            yield doc["_id"], doc["n"]
+
+    def iter_voters(self, province=None, canton=None, district=None, batch_size=5000):
+        documents_to_find = {}
+        if province or canton or district:
+            elec_codes = LOCATION_HIERARCHY.get_elec_codes(self, province or None, canton or None, district or None)
+            documents_to_find["e"] = {"$in": [int(elec_code) for elec_code in elec_codes]}
+
+        cursor = self.read_person_collection.find(documents_to_find, batch_size=batch_size)
+
+        for doc in cursor:
+            person = self.to_person(doc)
+            location = person.elec_code
+            yield (person.identification, person.full_name, location.elec_code, location.province, location.canton,
+                   location.district, person.voting_board, person.gender, person.id_expiration_date)
+
     def get_voter_statistics(self, id_expiration_date, elec_code):
         counts_list = []
-        province = elec_code.province
-        canton = elec_code.canton
-        district = elec_code.district
-        women_by_province = 0
-        women_by_canton = 0
-        women_by_district = 0
-        men_by_province = 0
-        men_by_canton = 0
-        men_by_district = 0
-
-        pipeline = [{"$match": {"elec_code_id.province": province}},
-                    {"$group": {"_id": "$gender", "count": {"$sum": 1}}}]
-
-        province_stats = self.person_collection.aggregate(pipeline)
-
-        for group in province_stats:
-            if group["_id"] == "Mujer":
-                women_by_province = group["count"]
-
-            if group["_id"] == "Hombre":
-                men_by_province = group["count"]
-
-        pipeline = [{"$match": {"gender": "Mujer", "elec_code_id.province": province, "elec_code_id.canton": canton}},
-                    {"$group": {"_id": "$elec_code_id.district", "count": {"$sum": 1}}}]
-
-        women_district_stats = self.person_collection.aggregate(pipeline)
-
-        for group in women_district_stats:
-            women_by_canton += group['count']
-            if group['_id'] == district:
-                women_by_district = group['count']
-
-        pipeline = [{"$match": {"gender": "Hombre", "elec_code_id.province": province, "elec_code_id.canton": canton}},
-                    {"$group": {"_id": "$elec_code_id.district", "count": {"$sum": 1}}}]
-
-        men_district_stats = self.person_collection.aggregate(pipeline)
-
-        for group in men_district_stats:
-            men_by_canton += group['count']
-            if group['_id'] == district:
-                men_by_district = group['count']
-
-        same_exp_date = self.person_collection.count_documents({
-            "id_expiration_date": f'{id_expiration_date.strftime("%Y")}-{id_expiration_date.strftime("%m")}'
-                                  f'-{id_expiration_date.strftime("%d")}'
-        })
-
-        counts_list.extend([men_by_district + women_by_district,
-                            men_by_canton + women_by_canton,
-                            men_by_province + women_by_province,
-                            men_by_district, men_by_canton,
-                            men_by_province, women_by_district,
-                            women_by_canton, women_by_province,
+        counts = {gender: {"district": 0, "canton": 0, "province": 0} for gender in ("Hombre", "Mujer")}
+        province_codes = LOCATION_HIERARCHY.get_elec_codes(self, elec_code.province)
+        canton_codes = set(LOCATION_HIERARCHY.get_elec_codes(self, elec_code.province, elec_code.canton))
+
+        # A single pass over the province: voters by district and gender, the totals are added up here
+        pipeline = [{"$match": {"e": {"$in": [int(code) for code in province_codes]}}},
+                    {"$group": {"_id": {"e": "$e", "g": "$g"}, "count": {"$sum": 1}}}]
+
+        for group in self.read_person_collection.aggregate(pipeline):
+            district_code = code_to_string(group["_id"]["e"], 6)
+            gender_counts = counts[code_to_gender(group["_id"]["g"])]
+
+            gender_counts["province"] += group["count"]
+            if district_code in canton_codes:
+                gender_counts["canton"] += group["count"]
+            if district_code == elec_code.elec_code:
+                gender_counts["district"] += group["count"]
+
+        same_exp_date = self.read_person_collection.count_documents({"x": date_to_datetime(id_expiration_date)})
+
+        men = counts["Hombre"]
+        women = counts["Mujer"]
+        counts_list.extend([men["district"] + women["district"],
+                            men["canton"] + women["canton"],
+                            men["province"] + women["province"],
+                            men["district"], men["canton"],
+                            men["province"], women["district"],
+                            women["canton"], women["province"],
                             same_exp_date])
 
         return counts_list
 
     def get_voter(self, identification):
         person_to_find = {"_id": identification}
-        person = self.person_collection.find_one(person_to_find)
+        person = self.read_person_collection.find_one(person_to_find)
         person_found = None
 
         if person:
-            elec_code_id = person["elec_code_id"]
+            person_found = self.to_person(person)
+
+        return person_found
 
-            date = datetime.date(int(person["id_expiration_date"][:4]), int(person["id_expiration_date"][5:7]),
-                                 int(person["id_expiration_date"][8:]))
-            elec_code = Location(elec_code=elec_code_id["elec_code"], province=elec_code_id["province"],
-                                 canton=elec_code_id["canton"], district=elec_code_id["district"])
+    def get_voters(self, identifications):
+        documents_to_find = {"_id": {"$in": [str(identification) for identification in identifications]}}
 
-            person_found = Person(identification=person["_id"], elec_code=elec_code,
-                                  voting_board=person["voting_board"], full_name=person["full_name"],
-                                  gender=person["gender"], id_expiration_date=date)
+        return {doc["_id"]: self.to_person(doc) for doc in self.read_person_collection.find(documents_to_find)}
 
-        return person_found
+    def has_voters(self):
+        return self.read_person_collection.find_one({}, {"_id": 1}) is not None
+
+    def get_board_roster(self, elec_code, voting_board):
+        cursor = self.read_person_collection.find({"e": int(elec_code), "b": int(voting_board)}, {"n": 1}).sort("n", 1)
+
+        return [VoterRow(doc["_id"], doc["n"]) for doc in cursor]
+
+    def get_board_occupancy(self, elec_code):
+        cursor = self.read_occupancy_collection.find({"e": int(elec_code), "n": {"$gt": 0}}).sort("b", 1)
+
+        return [(code_to_string(doc["b"], 5), doc["n"]) for doc in cursor]
 
     def add_voter(self, person):
-        location = person["elec_code"]
-        elec_code_id = self.location_collection.find_one({"province": location.province, "canton": location.canton,
-                                                          "district": location.district})["_id"]
-        person["full_name"] = person["full_name"].upper()
-        if len(str(person["identification"])) > 3:
-            person["gender"] = "Hombre" if int(str(person["identification"])[3]) % 2 == 0 else "Mujer"
-
-        new_person = {
-            "_id": str(person["identification"]),
-            "elec_code_id": elec_code_id,
-            "voting_board": "00000",
-            "full_name": person["full_name"],
-            "gender": person["gender"],
-            "id_expiration_date": f'{person["id_expiration_date"].strftime("%Y")}-{person["id_expiration_date"].strftime("%m")}'
-                                  f'-{person["id_expiration_date"].strftime("%d")}'
-        }
+        pin_primary()
+        self.__check_writable()
+        identification = str(person["identification"])
+        values = get_new_voter_values(identification, person["full_name"])
+
+        new_person = self.to_document(identification=identification, elec_code=person["elec_code"].elec_code,
+                                      voting_board=values["voting_board"], full_name=values["full_name"],
+                                      gender=values.get("gender"), id_expiration_date=person["id_expiration_date"],
+                                      search_key=values["search_key"])
 
         try:
-            result = self.person_collection.insert_one(new_person)
+            self.person_collection.insert_one(new_person)
         except Exception as error:
-            print(error)
+            logger.error("Error adding the voter %s", identification, exc_info=error)
+            raise
 
-        return str(person["identification"])
+        self.__count_board_voters([new_person], 1)
+        voter_added.send(sender=self.__class__, identification=new_person["_id"], full_name=new_person["n"])
+
+        return identification
 
     def delete_voter(self, identification):
+        pin_primary()
+        self.__check_writable()
         person_to_delete = {"_id": identification}
-        self.person_collection.delete_one(person_to_delete)
+        deleted = self.person_collection.find_one_and_delete(person_to_delete, {"e": 1, "b": 1})
+
+        if deleted:
+            self.__count_board_voters([deleted], -1)
+            voter_deleted.send(sender=self.__class__, identification=identification)
+
+    def add_voters(self, people):
+        pin_primary()
+        self.__check_writable()
+        identifications = [str(person["identification"]) for person in people]
+        existing = {doc["_id"] for doc in self.person_collection.find({"_id": {"$in": identifications}}, {"_id": 1})}
+        new_people = []
+
+        for person in people:
+            identification = str(person["identification"])
+            if identification in existing:
+                continue
+
+            existing.add(identification)
+            values = get_new_voter_values(identification, person["full_name"])
+            new_people.append(self.to_document(identification=identification, elec_code=person["elec_code"].elec_code,
+                                               voting_board=values["voting_board"], full_name=values["full_name"],
+                                               gender=values["gender"],
+                                               id_expiration_date=person["id_expiration_date"],
+                                               search_key=values["search_key"]))
+
+        if new_people:
+            self.person_collection.insert_many(new_people, ordered=False)
+            self.__count_board_voters(new_people, 1)
+            voters_added.send(sender=self.__class__, voters=[(person["_id"], person["n"]) for person in new_people])
+
+        return [person["_id"] for person in new_people]
+
+    def delete_voters(self, identifications):
+        pin_primary()
+        self.__check_writable()
+        identifications = [str(identification) for identification in identifications]
+        documents_to_delete = {"_id": {"$in": identifications}}
+        deleted = list(self.person_collection.find(documents_to_delete, {"e": 1, "b": 1}))
+        result = self.person_collection.delete_many(documents_to_delete)
+
+        if result.deleted_count:
+            self.__count_board_voters(deleted, -1)
+            voters_deleted.send(sender=self.__class__, identifications=identifications)
+
+        return result.deleted_count
 
 
 class PostgresqlDB(DBFactory, ABC):
+    """
+    Database processes on Postgresql with the Django ORM and raw SQL for the bulk loads.
+
+    A reload writes into copies of votes_location and votes_person in the padron_reload schema, built without their
+    secondary indexes so the load runs at full speed. Once complete and indexed they are moved to the public schema
+    in a single transaction; the replaced tables are kept in the padron_previous schema. The indexes and constraints
+    keep their names, they are unique per schema.
+
+    votes_boardoccupancy, the amount of voters of every voting board, is not part of a reload: it is counted again
+    once the new tables are live.
+
+    The voters can not be added or deleted while the padron_reload schema exists, the changes would be lost with the
+    replaced tables.
+    """
+    PADRON_TABLES = ("votes_location", "votes_person")
+    LIVE_SCHEMA = "public"
+    RELOAD_SCHEMA = "padron_reload"
+    PREVIOUS_SCHEMA = "padron_previous"
+    # SQLSTATE of the statements cancelled by statement_timeout
+    QUERY_CANCELED = "57014"
+
+    # The schema written by the loads, the shadow one during a reload
+    load_schema = LIVE_SCHEMA
+
+    @staticmethod
+    def get_person_row(person_tuple):
+        """
+        Adapts a person tuple from the files to the compact columns of votes_person
+
+        :param person_tuple: (identification, voting_board, full_name, gender, id_expiration_date, elec_code,
+                              search_key)
+        :return: the same tuple with numeric voting board, gender and electoral code
+        """
+        identification, voting_board, full_name, gender, id_expiration_date, elec_code, search_key = person_tuple
+
+        return (identification, int(voting_board), full_name, gender_to_code(gender), id_expiration_date,
+                int(elec_code), search_key)
 
     def load_people_data(self, tuples):
         cursor = None
@@ -449,12 +1163,12 @@ class PostgresqlDB(DBFactory, ABC):
         try:
             cursor = connection.cursor()
 
-            data_text = ','.join(cursor.mogrify('(%s, %s, %s, %s, %s, %s)', row).decode(
+            data_text = ','.join(cursor.mogrify('(%s, %s, %s, %s, %s, %s, %s)', self.get_person_row(row)).decode(
                 'utf-8') for row in tuples)
 
-            insert_script = """INSERT INTO public.votes_person (identification, voting_board, full_name, gender,  
-                            id_expiration_date, elec_code_id) VALUES {0} \nON CONFLICT (
-                            identification)\nDO NOTHING;""".format(data_text)
+            insert_script = """INSERT INTO {0}.votes_person (identification, voting_board, full_name, gender,  
+                            id_expiration_date, elec_code_id, search_key) VALUES {1} \nON CONFLICT (
+                            identification)\nDO NOTHING;""".format(self.load_schema, data_text)
 
             cursor.execute(insert_script)
             connection.commit()
@@ -474,11 +1188,11 @@ class PostgresqlDB(DBFactory, ABC):
         try:
             cursor = connection.cursor()
 
-            data_text = ','.join(cursor.mogrify('(%s, %s, %s, %s)', row).decode(
+            data_text = ','.join(cursor.mogrify('(%s, %s, %s, %s)', (int(row[0]), *row[1:])).decode(
                 'utf-8') for row in tuples)
 
-            insert_script = """INSERT INTO public.votes_location (elec_code, province, canton, district) 
-                            VALUES {0} \nON CONFLICT (elec_code)\nDO NOTHING;""".format(data_text)
+            insert_script = """INSERT INTO {0}.votes_location (elec_code, province, canton, district) 
+                            VALUES {1} \nON CONFLICT (elec_code)\nDO NOTHING;""".format(self.load_schema, data_text)
 
             cursor.execute(insert_script)
             connection.commit()
@@ -492,62 +1206,283 @@ class PostgresqlDB(DBFactory, ABC):
             if cursor is not None:
                 cursor.close()
 
-    def search_voters(self, identification, name):
+    @staticmethod
+    def get_search_queryset(identification, name):
+        """
+        :param identification: the value of 'identification' input
+        :param name: the value of 'name' input
+        :return: the queryset of the voters who match the searching specifications
+        """
+        if identification != '':
+            return Person.objects.filter(identification__contains=identification)
+        elif name != '':
+            return Person.objects.filter(search_key__contains=normalise_name(name))
+
+        return Person.objects.none()
+
+    def create_indexes(self):
+        if self.load_schema == self.LIVE_SCHEMA:
+            return
+
+        with connection.cursor() as cursor:
+            for table in self.PADRON_TABLES:
+                # The secondary indexes of the live table, built on the shadow one with the same names
+                cursor.execute("""SELECT indexdef FROM pg_indexes WHERE schemaname = %s AND tablename = %s AND 
+                               indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)""",
+                               [self.LIVE_SCHEMA, table, f"{self.LIVE_SCHEMA}.{table}"])
+                for index_definition, in cursor.fetchall():
+                    cursor.execute(index_definition.replace(f" ON {self.LIVE_SCHEMA}.{table} ",
+                                                            f" ON {self.load_schema}.{table} ", 1))
+
+            for table in self.PADRON_TABLES:
+                # The foreign keys point to the shadow tables
+                cursor.execute("""SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE 
+                               conrelid = %s::regclass AND contype = 'f'""", [f"{self.LIVE_SCHEMA}.{table}"])
+                for name, constraint_definition in cursor.fetchall():
+                    constraint_definition = re.sub(r"REFERENCES (\w+\.)?", f"REFERENCES {self.load_schema}.",
+                                                   constraint_definition)
+                    cursor.execute(f"ALTER TABLE {self.load_schema}.{table} ADD CONSTRAINT {name} "
+                                   f"{constraint_definition}")
+
+                cursor.execute(f"ANALYZE {self.load_schema}.{table}")
+
+    def refresh_board_occupancy(self):
+        pin_primary()
+
+        # DELETE instead of TRUNCATE, the readers keep seeing the old counts until the new ones are committed
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.votes_boardoccupancy")
+            cursor.execute("""INSERT INTO public.votes_boardoccupancy (elec_code, voting_board, voters) SELECT 
+                           elec_code_id, voting_board, COUNT(*) FROM public.votes_person GROUP BY elec_code_id, 
+                           voting_board""")
+
+    @staticmethod
+    def __count_board_voters(boards, sign):
+        """
+        Updates the amount of voters of the voting boards of some added or deleted voters with a single statement,
+        inside the transaction of the insert or delete
+
+        :param boards: an iterable of the (elec_code, voting_board) of every voter
+        :param sign: 1 for added voters, -1 for deleted voters
+        """
+        counts = Counter((int(elec_code), int(voting_board)) for elec_code, voting_board in boards)
+        if not counts:
+            return
+
+        values = ', '.join(['(%s, %s, %s)'] * len(counts))
+        params = [value for (elec_code, voting_board), amount in counts.items()
+                  for value in (elec_code, voting_board, amount)]
+
+        with connection.cursor() as cursor:
+            if sign > 0:
+                cursor.execute(f"""INSERT INTO public.votes_boardoccupancy (elec_code, voting_board, voters) VALUES 
+                               {values} ON CONFLICT (elec_code, voting_board) DO UPDATE SET 
+                               voters = votes_boardoccupancy.voters + EXCLUDED.voters""", params)
+            else:
+                cursor.execute(f"""UPDATE public.votes_boardoccupancy AS occupancy SET 
+                               voters = occupancy.voters - deleted.voters FROM (VALUES {values}) AS deleted 
+                               (elec_code, voting_board, voters) WHERE occupancy.elec_code = deleted.elec_code AND 
+                               occupancy.voting_board = deleted.voting_board""", params)
+
+    def begin_reload(self):
+        pin_primary()
+
+        # A single transaction, a failure while the tables are copied leaves no half built schema refusing the writes
+        with transaction.atomic(), connection.cursor() as cursor:
+            try:
+                # Fails if the schema exists, so two reloads can not run at once, and the writes are refused from now on
+                cursor.execute(f"CREATE SCHEMA {self.RELOAD_SCHEMA}")
+            except ProgrammingError as error:
+                raise ReloadError("Another reload of the padron is running, if it stopped abort it with "
+                                  "process_files --abort") from error
+
+            for table in self.PADRON_TABLES:
+                cursor.execute(f"CREATE TABLE {self.RELOAD_SCHEMA}.{table} (LIKE {self.LIVE_SCHEMA}.{table} "
+                               f"INCLUDING DEFAULTS)")
+
+                # The primary key is needed by the loads (ON CONFLICT), the other indexes are built after them
+                cursor.execute("""SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE 
+                               conrelid = %s::regclass AND contype IN ('p', 'u', 'c')""",
+                               [f"{self.LIVE_SCHEMA}.{table}"])
+                for name, constraint_definition in cursor.fetchall():
+                    cursor.execute(f"ALTER TABLE {self.RELOAD_SCHEMA}.{table} ADD CONSTRAINT {name} "
+                                   f"{constraint_definition}")
+
+        self.load_schema = self.RELOAD_SCHEMA
+
+    def finish_reload(self, expected_voters):
+        pin_primary()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.RELOAD_SCHEMA}.votes_person")
+            loaded_voters = cursor.fetchone()[0]
+
+        if loaded_voters < expected_voters:
+            raise ReloadError(f"Only {loaded_voters} of {expected_voters} voters were loaded, the padron was not "
+                              f"replaced")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {self.PREVIOUS_SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {self.PREVIOUS_SCHEMA}")
+            self.__move_tables(cursor, self.LIVE_SCHEMA, self.PREVIOUS_SCHEMA)
+            self.__move_tables(cursor, self.RELOAD_SCHEMA, self.LIVE_SCHEMA)
+            cursor.execute(f"DROP SCHEMA {self.RELOAD_SCHEMA}")
+
+        self.load_schema = self.LIVE_SCHEMA
+        padron_reloaded.send(sender=self.__class__)
+
+    def rollback_reload(self):
+        pin_primary()
+
+        with connection.cursor() as cursor:
+            if self.__is_reloading(cursor):
+                raise ReloadError("A reload of the padron is running, it must finish or be aborted first")
+
+            cursor.execute("SELECT COUNT(*) FROM pg_tables WHERE schemaname = %s", [self.PREVIOUS_SCHEMA])
+            if cursor.fetchone()[0] < len(self.PADRON_TABLES):
+                raise ReloadError("There is no previous version of the padron")
+
+        # The current tables go through the reload schema, which becomes the new previous version
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {self.RELOAD_SCHEMA}")
+            self.__move_tables(cursor, self.LIVE_SCHEMA, self.RELOAD_SCHEMA)
+            self.__move_tables(cursor, self.PREVIOUS_SCHEMA, self.LIVE_SCHEMA)
+            cursor.execute(f"DROP SCHEMA {self.PREVIOUS_SCHEMA}")
+            cursor.execute(f"ALTER SCHEMA {self.RELOAD_SCHEMA} RENAME TO {self.PREVIOUS_SCHEMA}")
+
+        padron_reloaded.send(sender=self.__class__)
+
+    def abort_reload(self):
+        pin_primary()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {self.RELOAD_SCHEMA} CASCADE")
+
+        self.load_schema = self.LIVE_SCHEMA
+
+    def __move_tables(self, cursor, from_schema, to_schema):
+        for table in self.PADRON_TABLES:
+            cursor.execute(f"ALTER TABLE {from_schema}.{table} SET SCHEMA {to_schema}")
+
+    def __is_reloading(self, cursor):
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s)", [self.RELOAD_SCHEMA])
+
+        return cursor.fetchone()[0]
+
+    def __check_writable(self):
+        """
+        Refuses a write while a reload is running, the new padron would not have the change
+        """
+        with connection.cursor() as cursor:
+            if self.__is_reloading(cursor):
+                raise ReloadError("The padron is being reloaded, the voters can not be changed until it finishes")
+
+    def search_voters(self, identification, name, limit=None):
         """
             Looks for voters in the DB who match the searching specifications.
 
             :param identification: the value of 'identification' input
             :param name: the value of 'name' input
-            :return: a list with all the found objects
+            :param limit: the maximum amount of voters returned, None for all of them
+            :return: a list of VoterRow with all the found voters
             """
-        voters_info_list = []
+        voters = self.get_search_queryset(identification, name)
+        alias = router.db_for_read(Person)
 
-        if identification != '':
-            voters_info_list = Person.objects.filter(identification__contains=identification)
-        elif name != '':
-            voters_info_list = Person.objects.filter(full_name__contains=name)
+        try:
+            with transaction.atomic(using=alias):
+                # SET LOCAL only lasts until the end of the transaction, the connection keeps its default timeout
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s', [SEARCH_TIMEOUT_MS])
 
-        return voters_info_list
+                rows = voters.using(alias).values_list('identification', 'full_name')[:limit]
+                return [VoterRow(*row) for row in rows]
+        except OperationalError as error:
+            # Only the cancellation by statement_timeout, the other errors (a lost connection, ...) are not timeouts
+            if getattr(error.__cause__, 'pgcode', None) != self.QUERY_CANCELED:
+                raise
+
+            raise SearchTimeoutError(f"Search of '{identification or name}' timed out") from error
+
+    def estimate_voters(self, identification, name):
+        """
+        Reads the amount of voters the planner expects the search to find. EXPLAIN does not run the query, so the
+        estimate is cheap even for a search that matches most of the padron.
+        """
+        if identification == '' and name == '':
+            return 0
+
+        voters = self.get_search_queryset(identification, name)
+        plan = json.loads(voters.using(router.db_for_read(Person)).explain(format='json'))
+        return plan[0]['Plan']['Plan Rows']
+
+    def get_locations(self):
+        return list(Location.objects.all())
+
+    def get_voter_names(self):
+        return Person.objects.values_list('identification', 'full_name').iterator(chunk_size=10000)
+
+    def iter_voters(self, province=None, canton=None, district=None, batch_size=5000):
+        voters = Person.objects.all()
+        if province:
+            voters = voters.filter(elec_code__province=province)
+        if canton:
+            voters = voters.filter(elec_code__canton=canton)
+        if district:
+            voters = voters.filter(elec_code__district=district)
+
+        # On Postgresql iterator() uses a server side cursor
+        return voters.values_list('identification', 'full_name', 'elec_code_id', 'elec_code__province',
+                                  'elec_code__canton', 'elec_code__district', 'voting_board', 'gender',
+                                  'id_expiration_date').iterator(chunk_size=batch_size)
 
     def get_voter_statistics(self, id_expiration_date, elec_code):
         """
                 Retrieves some statistics associated to the voter. Like voters in their region and so.
 
+                The voters by gender of the district, the canton and the province are counted in a single pass over
+                the province rows, found through the elec_code index, with GROUPING SETS. The voters with the same
+                expiration date are counted on their own index.
+
                 :param id_expiration_date: the voters id's expiration date
                 :param elec_code: the chose voter's electoral code in a Location object
                 :return:a list with the obtained statistics
                 """
         counts_list = []
-        province = elec_code.province
-        canton = elec_code.canton
-        district = elec_code.district
-        counts = Person.objects.aggregate(women_by_province=Count('identification',
-                                                                  filter=Q(elec_code__province=province,
-                                                                           gender='Mujer')),
-                                          women_by_canton=Count('identification',
-                                                                filter=Q(elec_code__canton=canton, gender='Mujer')),
-                                          women_by_district=Count('identification',
-                                                                  filter=Q(elec_code__district=district,
-                                                                           gender='Mujer')),
-                                          men_by_province=Count('identification',
-                                                                filter=Q(elec_code__province=province,
-                                                                         gender='Hombre')),
-                                          men_by_canton=Count('identification',
-                                                              filter=Q(elec_code__canton=canton, gender='Hombre')),
-                                          men_by_district=Count('identification',
-                                                                filter=Q(elec_code__district=district,
-                                                                         gender='Hombre')),
-                                          same_exp_date=Count('identification',
-                                                              filter=Q(id_expiration_date=id_expiration_date))
-                                          )
-
-        counts_list.extend([counts['men_by_district'] + counts['women_by_district'],
-                            counts['men_by_canton'] + counts['women_by_canton'],
-                            counts['men_by_province'] + counts['women_by_province'],
-                            counts['men_by_district'], counts['men_by_canton'],
-                            counts['men_by_province'], counts['women_by_district'],
-                            counts['women_by_canton'], counts['women_by_province'],
-                            counts['same_exp_date']])
+        counts = {gender: {"district": 0, "canton": 0, "province": 0} for gender in ("Hombre", "Mujer")}
+        province_codes = [int(code) for code in LOCATION_HIERARCHY.get_elec_codes(self, elec_code.province)]
+        # GROUPING() is 1 for the district rows, 2 for the canton rows and 3 for the province rows
+        levels = {1: "district", 2: "canton", 3: "province"}
+
+        statistics_script = """SELECT GROUPING(p.elec_code_id, l.canton), p.elec_code_id, l.canton, p.gender, 
+                            COUNT(*) FROM public.votes_person p JOIN public.votes_location l ON l.elec_code = 
+                            p.elec_code_id WHERE p.elec_code_id = ANY(%s) GROUP BY GROUPING SETS ((p.elec_code_id, 
+                            p.gender), (l.canton, p.gender), (p.gender));"""
+
+        with connections[router.db_for_read(Person)].cursor() as cursor:
+            cursor.execute(statistics_script, [province_codes])
+
+            for grouping, district_code, canton, gender, count in cursor.fetchall():
+                level = levels[grouping]
+
+                if level == "district" and district_code != int(elec_code.elec_code):
+                    continue
+                if level == "canton" and canton != elec_code.canton:
+                    continue
+
+                counts[code_to_gender(gender)][level] = count
+
+        same_exp_date = Person.objects.filter(id_expiration_date=id_expiration_date).count()
+
+        men = counts["Hombre"]
+        women = counts["Mujer"]
+        counts_list.extend([men["district"] + women["district"],
+                            men["canton"] + women["canton"],
+                            men["province"] + women["province"],
+                            men["district"], men["canton"],
+                            men["province"], women["district"],
+                            women["canton"], women["province"],
+                            same_exp_date])
 
         return counts_list
 
@@ -561,19 +1496,501 @@ class PostgresqlDB(DBFactory, ABC):
 
         return person
 
+    def get_voters(self, identifications):
+        identifications = [str(identification) for identification in identifications]
+
+        return {person.identification: person
+                for person in Person.objects.filter(pk__in=identifications).select_related('elec_code')}
+
+    def has_voters(self):
+        return Person.objects.exists()
+
+    def get_board_roster(self, elec_code, voting_board):
+        # Read in the order of the (elec_code, voting_board, full_name) index, without a sort
+        voters = Person.objects.filter(elec_code_id=elec_code, voting_board=voting_board).order_by('full_name')
+
+        return [VoterRow(*row) for row in voters.values_list('identification', 'full_name')]
+
+    def get_board_occupancy(self, elec_code):
+        boards = BoardOccupancy.objects.filter(elec_code=elec_code, voters__gt=0).order_by('voting_board')
+
+        return list(boards.values_list('voting_board', 'voters'))
+
     def add_voter(self, person):
-        elec_code = Location.objects.filter(province=person["elec_code"].province, canton=person["elec_code"].canton,
-                                            district=person["elec_code"].district)
+        pin_primary()
+        self.__check_writable()
+        new_person = Person(identification=str(person["identification"]), elec_code_id=person["elec_code"].elec_code,
+                            full_name=person["full_name"], id_expiration_date=person["id_expiration_date"])
+
+        with transaction.atomic():
+            new_person.save(force_insert=True)
+            self.__count_board_voters([(new_person.elec_code_id, new_person.voting_board)], 1)
 
-        if elec_code.exists():
-            new_person = Person(identification=str(person["identification"]), elec_code=elec_code[0],
-                                full_name=person["full_name"], id_expiration_date=person["id_expiration_date"])
-            new_person.save()
+        voter_added.send(sender=self.__class__, identification=new_person.identification,
+                         full_name=new_person.full_name)
 
         return str(person["identification"])
 
     def delete_voter(self, identification):
-        person = Person.objects.filter(pk=identification)
+        pin_primary()
+        self.__check_writable()
+
+        # A single statement that returns the voting board of the deleted voter, if any
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.LIVE_SCHEMA}.votes_person WHERE identification = %s "
+                           f"RETURNING elec_code_id, voting_board", [str(identification)])
+            deleted = cursor.fetchone()
+
+            if deleted is not None:
+                self.__count_board_voters([deleted], -1)
+
+        if deleted is not None:
+            voter_deleted.send(sender=self.__class__, identification=identification)
+
+    def add_voters(self, people):
+        pin_primary()
+        self.__check_writable()
+        identifications = [str(person["identification"]) for person in people]
+        existing = set(Person.objects.filter(pk__in=identifications).values_list('pk', flat=True))
+        new_people = []
+
+        for person in people:
+            identification = str(person["identification"])
+            if identification in existing:
+                continue
+
+            existing.add(identification)
+            new_people.append(Person(identification=identification, elec_code_id=person["elec_code"].elec_code,
+                                     id_expiration_date=person["id_expiration_date"],
+                                     **get_new_voter_values(identification, person["full_name"])))
+
+        # bulk_create does not send pre_save, the signal rules are already applied
+        with transaction.atomic():
+            Person.objects.bulk_create(new_people, ignore_conflicts=True)
+            self.__count_board_voters([(person.elec_code_id, person.voting_board) for person in new_people], 1)
+
+        if new_people:
+            voters_added.send(sender=self.__class__,
+                              voters=[(person.identification, person.full_name) for person in new_people])
+
+        return [person.identification for person in new_people]
+
+    def delete_voters(self, identifications):
+        pin_primary()
+        self.__check_writable()
+        identifications = [str(identification) for identification in identifications]
+        voters = Person.objects.filter(pk__in=identifications)
+
+        with transaction.atomic():
+            boards = list(voters.select_for_update().values_list('elec_code_id', 'voting_board'))
+            # Person has no dependent rows or delete signals, so this is a single DELETE ... WHERE IN
+            deleted, _ = voters.delete()
+            self.__count_board_voters(boards, -1)
 
-        if person.exists():
-            person[0].delete()
+        if deleted:
+            voters_deleted.send(sender=self.__class__, identifications=identifications)
+
+        return deleted
+
+
+class SqliteDB(DBFactory, ABC):
+    """
+    Database processes on an embedded SQLite file, for the polling stations without a network or a database server.
+
+    The tables mirror the compact Postgresql schema: numeric electoral codes, voting boards and genders, and ISO
+    dates. The names are searched through an FTS5 index with the trigram tokenizer, which answers the same 'contains'
+    searches as the other backends without scanning the table. The statistics are read from two precomputed tables,
+    voter_count (voters by electoral code and gender) and expiration_count (voters by expiration date), kept up to
+    date by triggers on person. board_count, the voters of every voting board, is kept the same way.
+
+    Every thread uses its own connection to SQLITE_DATABASE_PATH, in WAL mode so the reads are not blocked by a
+    write.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS location (
+            elec_code INTEGER PRIMARY KEY, province TEXT NOT NULL, canton TEXT NOT NULL, district TEXT NOT NULL);
+
+        CREATE TABLE IF NOT EXISTS person (
+            identification TEXT NOT NULL UNIQUE, elec_code INTEGER NOT NULL, voting_board INTEGER NOT NULL,
+            full_name TEXT NOT NULL, gender INTEGER NOT NULL, id_expiration_date TEXT NOT NULL,
+            search_key TEXT NOT NULL);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS person_name USING fts5(
+            search_key, content='person', content_rowid='rowid', tokenize='trigram');
+
+        CREATE TABLE IF NOT EXISTS voter_count (
+            elec_code INTEGER NOT NULL, gender INTEGER NOT NULL, amount INTEGER NOT NULL,
+            PRIMARY KEY (elec_code, gender)) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS expiration_count (
+            id_expiration_date TEXT PRIMARY KEY, amount INTEGER NOT NULL) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS board_count (
+            elec_code INTEGER NOT NULL, voting_board INTEGER NOT NULL, amount INTEGER NOT NULL,
+            PRIMARY KEY (elec_code, voting_board)) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS person_inserted AFTER INSERT ON person BEGIN
+            INSERT INTO person_name (rowid, search_key) VALUES (new.rowid, new.search_key);
+            INSERT OR IGNORE INTO voter_count VALUES (new.elec_code, new.gender, 0);
+            UPDATE voter_count SET amount = amount + 1 WHERE elec_code = new.elec_code AND gender = new.gender;
+            INSERT OR IGNORE INTO expiration_count VALUES (new.id_expiration_date, 0);
+            UPDATE expiration_count SET amount = amount + 1 WHERE id_expiration_date = new.id_expiration_date;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS person_deleted AFTER DELETE ON person BEGIN
+            INSERT INTO person_name (person_name, rowid, search_key) VALUES ('delete', old.rowid, old.search_key);
+            UPDATE voter_count SET amount = amount - 1 WHERE elec_code = old.elec_code AND gender = old.gender;
+            UPDATE expiration_count SET amount = amount - 1 WHERE id_expiration_date = old.id_expiration_date;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS person_board_inserted AFTER INSERT ON person BEGIN
+            INSERT OR IGNORE INTO board_count VALUES (new.elec_code, new.voting_board, 0);
+            UPDATE board_count SET amount = amount + 1
+            WHERE elec_code = new.elec_code AND voting_board = new.voting_board;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS person_board_deleted AFTER DELETE ON person BEGIN
+            UPDATE board_count SET amount = amount - 1
+            WHERE elec_code = old.elec_code AND voting_board = old.voting_board;
+        END;
+    """
+
+    # The trigram tokenizer needs at least three characters, shorter names are searched with LIKE
+    MIN_FTS_LENGTH = 3
+
+    def __init__(self):
+        self.__local = threading.local()
+
+        with self.connection:
+            self.connection.executescript(self.SCHEMA)
+
+    @property
+    def connection(self):
+        """
+        :return: the sqlite3 connection of the current thread
+        """
+        connection = getattr(self.__local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(SQLITE_DATABASE_PATH, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection = connection
+
+        return connection
+
+    def execute(self, sql, params=()):
+        """
+        Runs a statement on the connection of the current thread and times it for the request timing
+
+        :param sql: the statement
+        :param params: its parameters
+        :return: the sqlite3 cursor
+        """
+        start = time.perf_counter()
+        try:
+            return self.connection.execute(sql, params)
+        finally:
+            record_db_call(time.perf_counter() - start)
+
+    @staticmethod
+    def get_person_row(identification, elec_code, voting_board, full_name, gender, id_expiration_date, search_key):
+        """
+        Adapts the values of a person to the columns of the person table
+
+        :return: a tuple with numeric electoral code, voting board and gender and the date as ISO text
+        """
+        return (str(identification), int(elec_code), int(voting_board), full_name, gender_to_code(gender),
+                id_expiration_date.isoformat(), search_key)
+
+    def to_person(self, row):
+        """
+        Builds a Person object from a complete person row
+
+        :param row: (identification, elec_code, voting_board, full_name, gender, id_expiration_date, search_key)
+        :return: an unsaved Person object
+        """
+        identification, elec_code, voting_board, full_name, gender, id_expiration_date, search_key = row
+
+        return Person(identification=identification, elec_code=self.get_location(elec_code),
+                      voting_board=code_to_string(voting_board, 5), full_name=full_name,
+                      gender=code_to_gender(gender), id_expiration_date=datetime.date.fromisoformat(id_expiration_date),
+                      search_key=search_key)
+
+    def get_location(self, elec_code):
+        """
+        :param elec_code: an electoral code as stored in the person table
+        :return: the Location object of the code
+        """
+        return LOCATION_HIERARCHY.get_location(self, code_to_string(elec_code, 6))
+
+    def load_people_data(self, tuples):
+        rows = [self.get_person_row(identification=row[0], elec_code=row[5], voting_board=row[1], full_name=row[2],
+                                    gender=row[3], id_expiration_date=row[4], search_key=row[6]) for row in tuples]
+
+        try:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO person VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        except sqlite3.Error as error:
+            logger.error("Error importing voters data", exc_info=error)
+            raise
+
+    def load_location_data(self, tuples):
+        rows = [(int(row[0]), *row[1:]) for row in tuples]
+
+        try:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO location VALUES (?, ?, ?, ?)', rows)
+        except sqlite3.Error as error:
+            logger.error("Error importing locations data", exc_info=error)
+            raise
+
+    def create_indexes(self):
+        with self.connection:
+            # Serves the electoral code lookups as well, it replaces the former person_elec_code index
+            self.connection.execute('CREATE INDEX IF NOT EXISTS person_board ON person (elec_code, voting_board, '
+                                    'full_name)')
+            self.connection.execute('DROP INDEX IF EXISTS person_elec_code')
+            self.connection.execute("INSERT INTO person_name (person_name) VALUES ('optimize')")
+            self.connection.execute('ANALYZE')
+
+    def refresh_board_occupancy(self):
+        # The triggers keep board_count up to date, it is counted again for the files created before them
+        with self.connection:
+            self.connection.execute('DELETE FROM board_count')
+            self.connection.execute('INSERT INTO board_count SELECT elec_code, voting_board, COUNT(*) FROM person '
+                                    'GROUP BY elec_code, voting_board')
+
+    def get_search_select(self, identification, name):
+        """
+        :param identification: the value of 'identification' input
+        :param name: the value of 'name' input
+        :return: a (select_script, params) tuple with the select, without a LIMIT, of the identifications and names of
+                 the voters who match the searching specifications, None if both are empty
+        """
+        if identification != '':
+            return 'SELECT identification, full_name FROM person WHERE instr(identification, ?) > 0', (identification,)
+        elif name != '':
+            search_key = normalise_name(name)
+
+            if len(search_key) >= self.MIN_FTS_LENGTH:
+                # A quoted FTS5 string is a phrase, with the trigram tokenizer it matches any substring
+                phrase = '"{0}"'.format(search_key.replace('"', '""'))
+                return 'SELECT identification, full_name FROM person WHERE rowid IN ' \
+                       '(SELECT rowid FROM person_name WHERE person_name MATCH ?)', (phrase,)
+
+            return 'SELECT identification, full_name FROM person WHERE instr(search_key, ?) > 0', (search_key,)
+
+        return None
+
+    def fetch_search(self, sql, params):
+        """
+        Runs a search statement, interrupted after SEARCH_TIMEOUT_MS
+
+        :param sql: the statement
+        :param params: its parameters
+        :return: a list with the rows
+        """
+        # SQLite has no statement timeout, the progress handler interrupts the query after SEARCH_TIMEOUT_MS
+        deadline = time.monotonic() + SEARCH_TIMEOUT_MS / 1000
+        self.connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+
+        try:
+            return self.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as error:
+            # Only the interruption of the progress handler is a timeout, a locked or broken database is an error
+            if str(error) != 'interrupted':
+                raise
+
+            raise SearchTimeoutError(f"Search timed out after {SEARCH_TIMEOUT_MS} ms") from error
+        finally:
+            self.connection.set_progress_handler(None, 0)
+
+    def search_voters(self, identification, name, limit=None):
+        search_select = self.get_search_select(identification, name)
+        if search_select is None:
+            return []
+
+        select_script, params = search_select
+        # LIMIT -1 is no limit in SQLite
+        rows = self.fetch_search(f'{select_script} LIMIT ?', (*params, -1 if limit is None else limit))
+
+        return [VoterRow(*row) for row in rows]
+
+    def estimate_voters(self, identification, name):
+        search_select = self.get_search_select(identification, name)
+        if search_select is None:
+            return 0
+
+        select_script, params = search_select
+
+        try:
+            return self.fetch_search(f'SELECT count(*) FROM ({select_script} LIMIT ?)',
+                                     (*params, SEARCH_MAX_ESTIMATED_MATCHES + 1))[0][0]
+        except SearchTimeoutError:
+            # The search itself is stopped by the same timeout
+            return None
+
+    def get_locations(self):
+        return [Location(elec_code=code_to_string(elec_code, 6), province=province, canton=canton, district=district)
+                for elec_code, province, canton, district in
+                self.execute('SELECT elec_code, province, canton, district FROM location')]
+
+    def get_voter_names(self):
+        cursor = self.execute('SELECT identification, full_name FROM person')
+
+        for rows in iter(lambda: cursor.fetchmany(10000), []):
+            yield from rows
+
+    def iter_voters(self, province=None, canton=None, district=None, batch_size=5000):
+        select_script = 'SELECT * FROM person'
+        params = []
+
+        if province or canton or district:
+            elec_codes = LOCATION_HIERARCHY.get_elec_codes(self, province or None, canton or None, district or None)
+            params = [int(elec_code) for elec_code in elec_codes]
+            select_script += ' WHERE elec_code IN ({0})'.format(', '.join('?' * len(params)))
+
+        cursor = self.execute(select_script, params)
+
+        for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+            for row in rows:
+                person = self.to_person(row)
+                location = person.elec_code
+                yield (person.identification, person.full_name, location.elec_code, location.province,
+                       location.canton, location.district, person.voting_board, person.gender,
+                       person.id_expiration_date)
+
+    def get_voter_statistics(self, id_expiration_date, elec_code):
+        counts_list = []
+        counts = {gender: {"district": 0, "canton": 0, "province": 0} for gender in ("Hombre", "Mujer")}
+        province_codes = [int(code) for code in LOCATION_HIERARCHY.get_elec_codes(self, elec_code.province)]
+        canton_codes = set(LOCATION_HIERARCHY.get_elec_codes(self, elec_code.province, elec_code.canton))
+
+        # voter_count has a row per district and gender, the totals of the province are added up here
+        rows = self.execute('SELECT elec_code, gender, amount FROM voter_count WHERE elec_code IN ({0})'.format(
+            ', '.join('?' * len(province_codes))), province_codes)
+
+        for district_code, gender, amount in rows:
+            district_code = code_to_string(district_code, 6)
+            gender_counts = counts[code_to_gender(gender)]
+
+            gender_counts["province"] += amount
+            if district_code in canton_codes:
+                gender_counts["canton"] += amount
+            if district_code == elec_code.elec_code:
+                gender_counts["district"] += amount
+
+        row = self.execute('SELECT amount FROM expiration_count WHERE id_expiration_date = ?',
+                           (id_expiration_date.isoformat(),)).fetchone()
+        same_exp_date = row[0] if row else 0
+
+        men = counts["Hombre"]
+        women = counts["Mujer"]
+        counts_list.extend([men["district"] + women["district"],
+                            men["canton"] + women["canton"],
+                            men["province"] + women["province"],
+                            men["district"], men["canton"],
+                            men["province"], women["district"],
+                            women["canton"], women["province"],
+                            same_exp_date])
+
+        return counts_list
+
+    def get_voter(self, identification):
+        row = self.execute('SELECT * FROM person WHERE identification = ?', (identification,)).fetchone()
+        person_found = None
+
+        if row:
+            person_found = self.to_person(row)
+
+        return person_found
+
+    def get_voters(self, identifications):
+        identifications = [str(identification) for identification in identifications]
+        if not identifications:
+            return {}
+
+        rows = self.execute('SELECT * FROM person WHERE identification IN ({0})'.format(
+            ', '.join('?' * len(identifications))), identifications)
+
+        return {row[0]: self.to_person(row) for row in rows}
+
+    def has_voters(self):
+        return self.execute('SELECT 1 FROM person LIMIT 1').fetchone() is not None
+
+    def get_board_roster(self, elec_code, voting_board):
+        rows = self.execute('SELECT identification, full_name FROM person WHERE elec_code = ? AND voting_board = ? '
+                            'ORDER BY full_name', (int(elec_code), int(voting_board)))
+
+        return [VoterRow(*row) for row in rows]
+
+    def get_board_occupancy(self, elec_code):
+        rows = self.execute('SELECT voting_board, amount FROM board_count WHERE elec_code = ? AND amount > 0 '
+                            'ORDER BY voting_board', (int(elec_code),))
+
+        return [(code_to_string(voting_board, 5), amount) for voting_board, amount in rows]
+
+    def add_voter(self, person):
+        identification = str(person["identification"])
+        values = get_new_voter_values(identification, person["full_name"])
+        row = self.get_person_row(identification=identification, elec_code=person["elec_code"].elec_code,
+                                  voting_board=values["voting_board"], full_name=values["full_name"],
+                                  gender=values.get("gender"), id_expiration_date=person["id_expiration_date"],
+                                  search_key=values["search_key"])
+
+        try:
+            with self.connection:
+                self.execute('INSERT INTO person VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            voter_added.send(sender=self.__class__, identification=identification, full_name=values["full_name"])
+        except sqlite3.Error as error:
+            logger.error("Error adding the voter %s", identification, exc_info=error)
+            raise
+
+        return identification
+
+    def delete_voter(self, identification):
+        with self.connection:
+            cursor = self.execute('DELETE FROM person WHERE identification = ?', (identification,))
+
+        if cursor.rowcount:
+            voter_deleted.send(sender=self.__class__, identification=identification)
+
+    def add_voters(self, people):
+        identifications = [str(person["identification"]) for person in people]
+        existing = {row[0] for row in self.execute('SELECT identification FROM person WHERE identification IN ({0})'
+                                                   .format(', '.join('?' * len(identifications))), identifications)}
+        new_people = []
+
+        for person in people:
+            identification = str(person["identification"])
+            if identification in existing:
+                continue
+
+            existing.add(identification)
+            values = get_new_voter_values(identification, person["full_name"])
+            new_people.append(self.get_person_row(identification=identification,
+                                                  elec_code=person["elec_code"].elec_code,
+                                                  voting_board=values["voting_board"], full_name=values["full_name"],
+                                                  gender=values["gender"],
+                                                  id_expiration_date=person["id_expiration_date"],
+                                                  search_key=values["search_key"]))
+
+        if new_people:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO person VALUES (?, ?, ?, ?, ?, ?, ?)', new_people)
+            voters_added.send(sender=self.__class__, voters=[(person[0], person[3]) for person in new_people])
+
+        return [person[0] for person in new_people]
+
+    def delete_voters(self, identifications):
+        identifications = [str(identification) for identification in identifications]
+
+        with self.connection:
+            cursor = self.execute('DELETE FROM person WHERE identification IN ({0})'.format(
+                ', '.join('?' * len(identifications))), identifications)
+
+        if cursor.rowcount:
+            voters_deleted.send(sender=self.__class__, identifications=identifications)
+
+        return cursor.rowcount
@@ -1,17 +1,32 @@
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, reverse
+import json
+
+from django.http import HttpResponseRedirect, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, \
+    HttpResponseNotFound
+from django.shortcuts import reverse
+from django.template.response import TemplateResponse
 from django.utils.decorators import method_decorator
-from django.views.generic import CreateView, DeleteView
+from django.views.generic import DeleteView, FormView
 from .forms import SearchLocationForm
 from .models import Person
-from votes.utils import set_database
+from votes.utils import ReloadError, get_database
+from votes.cache import SEARCH_CACHE
+from votes.search_guard import SearchRefused
+from votes.autocomplete import AUTOCOMPLETE_INDEX
+from votes.locations import LOCATION_HIERARCHY
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from votes.export import EXPORT_FORMATS, export_voters
+from votes.fields import code_to_string
+from padron_web.settings import AUTOCOMPLETE_MAX_RESULTS, SEARCH_MAX_RESULTS, VOTERS_LOOKUP_MAX_BATCH
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
-from .forms import NewVoterForm
-
+from .forms import NewVoterForm, BulkVotersForm
+from votes.bulk import add_voters_from_file, delete_voters_from_file
 
-DATABASE = set_database()
+RELOAD_MESSAGE = "El padrón se está recargando, los votantes no se pueden modificar hasta que termine. Intente de " \
+                 "nuevo en unos minutos."
 
 
 def voters(request):
@@ -30,14 +45,24 @@ def voters(request):
             identification = form.cleaned_data['identification']
             name = form.cleaned_data['name']
 
-            voters_info_list = DATABASE.search_voters(identification=identification, name=name.upper())
+            try:
+                voters_info_list = SEARCH_CACHE.search_voters(get_database(), identification=identification,
+                                                              name=name)
+            except SearchRefused as error:
+                voters_info_list = []
+                param_dict['search_message'] = str(error)
+
+            if len(voters_info_list) > SEARCH_MAX_RESULTS:
+                voters_info_list = voters_info_list[:SEARCH_MAX_RESULTS]
+                param_dict['search_message'] = f"Se muestran los primeros {SEARCH_MAX_RESULTS} votantes, agregue " \
+                                               f"más datos para refinar la búsqueda"
 
             param_dict['voters_info_list'] = voters_info_list
 
     if request.user.is_authenticated:
         param_dict['logout'] = "Cerrar Sesión"
 
-    return render(request, "votes/voters.html", param_dict)
+    return TemplateResponse(request, "votes/voters.html", param_dict)
 
 
 def voter_info(request, pk):
@@ -49,11 +74,12 @@ def voter_info(request, pk):
     :return: a view with voter info and some statistics related
     """
     param_dict = {}
-    person = DATABASE.get_voter(pk)
+    database = get_database()
+    person = database.get_voter(pk)
 
     if person is not None:
         elec_code = person.elec_code
-        statistics_list = DATABASE.get_voter_statistics(person.id_expiration_date, elec_code)
+        statistics_list = database.get_voter_statistics(person.id_expiration_date, elec_code)
 
         param_dict['voter_info_list'] = [person]
         param_dict['statistics_list'] = statistics_list
@@ -64,7 +90,194 @@ def voter_info(request, pk):
     if request.user.is_authenticated:
         param_dict['logout'] = "Cerrar Sesión"
 
-    return render(request, "votes/voter_info.html", param_dict)
+    return TemplateResponse(request, "votes/voter_info.html", param_dict)
+
+
+def voters_autocomplete(request):
+    """
+    The voters autocomplete view, served from an in-memory index
+
+    :param request: for html requests, with the typed text in 'q' and optionally the amount of results in 'limit'
+    :return: a json with the voters whose name or identification starts with the typed text
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), AUTOCOMPLETE_MAX_RESULTS))
+    except ValueError:
+        return HttpResponseBadRequest(f"Invalid limit: {request.GET.get('limit')}")
+
+    matches = AUTOCOMPLETE_INDEX.search(get_database(), request.GET.get('q', ''), limit=limit)
+
+    return JsonResponse({'results': [{'identification': identification, 'full_name': full_name}
+                                     for identification, full_name in matches]})
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(['GET', 'POST'])
+def voters_lookup(request):
+    """
+    The batch voters lookup view, for the ID card scanners of the polling stations. A queue of scans is answered in
+    a single request and a single database query. The scanners log in as the other users, so the padron can not be
+    read in bulk anonymously. It only reads, so it is exempt from the CSRF check to be usable by the scanner clients.
+
+    :param request: for html requests, with the identifications in 'cedulas' (comma separated) or in a json body
+                    {"cedulas": [...]}
+    :return: a json with the found voters, in the requested order, and the identifications not found
+    """
+    if request.method == 'POST':
+        try:
+            identifications = json.loads(request.body)['cedulas']
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest('Expected a json body with a list of cédulas')
+    else:
+        identifications = [identification for value in request.GET.getlist('cedulas')
+                           for identification in value.split(',')]
+
+    if not isinstance(identifications, list):
+        return HttpResponseBadRequest('Expected a list of cédulas')
+
+    identifications = list(dict.fromkeys(str(identification).strip() for identification in identifications))
+    identifications = [identification for identification in identifications if identification]
+
+    if len(identifications) > VOTERS_LOOKUP_MAX_BATCH:
+        return HttpResponseBadRequest(f'At most {VOTERS_LOOKUP_MAX_BATCH} cédulas per request')
+
+    people = get_database().get_voters(identifications) if identifications else {}
+    found = []
+
+    for identification in identifications:
+        person = people.get(identification)
+        if person is None:
+            continue
+
+        location = person.elec_code
+        found.append({'identification': person.identification, 'full_name': person.full_name,
+                      'elec_code': location.elec_code, 'province': location.province, 'canton': location.canton,
+                      'district': location.district, 'voting_board': person.voting_board,
+                      'id_expiration_date': person.id_expiration_date.isoformat()})
+
+    return JsonResponse({'voters': found,
+                         'not_found': [identification for identification in identifications
+                                       if identification not in people]})
+
+
+def board_occupancy(request, elec_code):
+    """
+    The occupancy view of the voting boards of a vote location, read from the counts precomputed at import time
+
+    :param request: for html requests
+    :param elec_code: the six digits electoral code of the vote location
+    :return: a json with the amount of voters of every voting board of the location
+    """
+    database = get_database()
+    location = LOCATION_HIERARCHY.get_location(database, elec_code)
+
+    if location is None:
+        return HttpResponseNotFound(f'Unknown electoral code: {elec_code}')
+
+    boards = [{'voting_board': voting_board, 'voters': amount}
+              for voting_board, amount in database.get_board_occupancy(location.elec_code)]
+
+    return JsonResponse({'elec_code': location.elec_code, 'province': location.province, 'canton': location.canton,
+                         'district': location.district, 'voters': sum(board['voters'] for board in boards),
+                         'boards': boards})
+
+
+def board_roster(request, elec_code, voting_board):
+    """
+    The roster view of a voting board, its voters sorted by name
+
+    :param request: for html requests
+    :param elec_code: the six digits electoral code of the vote location
+    :param voting_board: the voting board, with or without the leading zeros
+    :return: a json with the identification and the name of the voters of the voting board
+    """
+    database = get_database()
+    location = LOCATION_HIERARCHY.get_location(database, elec_code)
+
+    if location is None:
+        return HttpResponseNotFound(f'Unknown electoral code: {elec_code}')
+    if not voting_board.isdigit() or len(voting_board) > 5:
+        return HttpResponseBadRequest(f'Invalid voting board: {voting_board}')
+
+    voting_board = code_to_string(int(voting_board), 5)
+    roster = database.get_board_roster(location.elec_code, voting_board)
+
+    return JsonResponse({'elec_code': location.elec_code, 'voting_board': voting_board,
+                         'voters': [{'identification': voter.identification, 'full_name': voter.full_name}
+                                    for voter in roster]})
+
+
+@cache_control(max_age=3600)
+def provinces(request):
+    """
+    The provinces view for the cascading location selects
+
+    :param request: for html requests
+    :return: a json with the provinces names
+    """
+    return JsonResponse({'provinces': LOCATION_HIERARCHY.get_provinces(get_database())})
+
+
+@cache_control(max_age=3600)
+def cantons(request):
+    """
+    The cantons view for the cascading location selects
+
+    :param request: for html requests, with the province name in 'provincia'
+    :return: a json with the cantons names of the province
+    """
+    return JsonResponse({'cantons': LOCATION_HIERARCHY.get_cantons(get_database(), request.GET.get('provincia', ''))})
+
+
+@cache_control(max_age=3600)
+def districts(request):
+    """
+    The districts view for the cascading location selects
+
+    :param request: for html requests, with the province name in 'provincia' and the canton name in 'canton'
+    :return: a json with the electoral code and name of the districts of the canton
+    """
+    districts_list = LOCATION_HIERARCHY.get_districts(get_database(), request.GET.get('provincia', ''),
+                                                      request.GET.get('canton', ''))
+
+    return JsonResponse({'districts': [{'elec_code': elec_code, 'district': district}
+                                       for elec_code, district in districts_list]})
+
+
+@login_required
+def voters_export(request):
+    """
+    The voters export view, streams the voters of a region while they are read from the database
+
+    :param request: for html requests, with optional 'provincia', 'canton' and 'distrito' names and 'formato' as
+    'csv' (default) or 'ndjson'
+    :return: a streaming response with the voters
+    """
+    export_format = request.GET.get('formato', 'csv')
+
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Formato no soportado: {export_format}")
+
+    region = [request.GET.get(key) for key in ('provincia', 'canton', 'distrito')]
+    file_name = '_'.join(name for name in region if name) or 'padron'
+
+    response = StreamingHttpResponse(export_voters(get_database(), export_format, *region),
+                                     content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{export_format}"'
+
+    return response
+
+
+@login_required
+def search_cache_statistics(request):
+    """
+    The search cache metrics view
+
+    :param request: for html requests
+    :return: a json with the hits, misses and hit rate of the voters search cache
+    """
+    return JsonResponse(SEARCH_CACHE.get_statistics())
 
 
 class UserLoginView(LoginView):
@@ -83,19 +296,29 @@ def logout_view(request):
     :return: a view of logout message and redirection page
     """
     logout(request)
-    return render(request, "votes/logout_view.html")
+    return TemplateResponse(request, "votes/logout_view.html")
 
 
 @method_decorator(login_required, name='dispatch')
-class NewVoterView(CreateView):
+class NewVoterView(FormView):
     """
     A view with the form for new voters
     """
-    model = Person
     form_class = NewVoterForm
+    template_name = 'votes/new_voter.html'
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['database'] = get_database()
+        return kwargs
 
     def form_valid(self, form):
-        self.object = DATABASE.add_voter(form.cleaned_data)
+        try:
+            self.object = get_database().add_voter(form.cleaned_data)
+        except ReloadError:
+            form.add_error(None, RELOAD_MESSAGE)
+            return self.form_invalid(form)
+
         return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
@@ -110,12 +333,46 @@ class DeleteVoterView(DeleteView):
     model = Person
 
     def get_object(self, queryset=None):
-        return DATABASE.get_voter(self.kwargs.get("pk"))
+        return get_database().get_voter(self.kwargs.get("pk"))
 
     def form_valid(self, form):
         success_url = self.get_success_url()
-        DATABASE.delete_voter(self.object.pk)
+
+        try:
+            get_database().delete_voter(self.object.pk)
+        except ReloadError:
+            form.add_error(None, RELOAD_MESSAGE)
+            return self.form_invalid(form)
+
         return HttpResponseRedirect(success_url)
 
     def get_success_url(self):
         return reverse('voters')
+
+
+@method_decorator(login_required, name='dispatch')
+class BulkVotersView(FormView):
+    """
+    A view to add and delete batches of voters from uploaded files
+    """
+    form_class = BulkVotersForm
+    template_name = 'votes/bulk_voters.html'
+
+    def form_valid(self, form):
+        results = []
+        # Both files were decoded by the form validation
+        encoding = form.cleaned_data['encoding']
+
+        try:
+            if form.cleaned_data['new_voters_file']:
+                lines = (line.decode(encoding) for line in form.cleaned_data['new_voters_file'])
+                results.append(('Votantes agregados', add_voters_from_file(get_database(), lines)))
+
+            if form.cleaned_data['deceased_file']:
+                lines = (line.decode(encoding) for line in form.cleaned_data['deceased_file'])
+                results.append(('Votantes eliminados', delete_voters_from_file(get_database(), lines)))
+        except ReloadError:
+            form.add_error(None, RELOAD_MESSAGE)
+            return self.form_invalid(form)
+
+        return self.render_to_response(self.get_context_data(form=form, results=results))